@@ -0,0 +1,56 @@
+import unicodedata
+from functools import lru_cache
+
+# Arabic normalization for matching narrator titles against rejal hints.
+#
+# The same few thousand titles and hints occur in every chain of the corpus,
+# so the normalized strings and title words are memoized; the caches are
+# bounded so a long run over many distinct names doesn't grow without limit.
+
+# Distinct strings kept per cache
+NORMALIZE_CACHE_SIZE = 65536
+
+# Letter variants folded together, and the diacritics (U+064B-U+065F) dropped
+LETTER_FOLDS = {
+    "إ": "ا", "أ": "ا", "آ": "ا",
+    "ى": "ي",
+    "ة": "ه",
+    "ئ": "ء", "ؤ": "ء",
+}
+DIACRITICS = range(0x064B, 0x0660)
+NORMALIZE_TABLE = str.maketrans({**LETTER_FOLDS, **{chr(code): None for code in DIACRITICS}})
+
+# Removed from a title before it is compared with a hint, in this order
+HONORIFICS = ["عليه السلام", "ع"]
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_arabic(text):
+    text = unicodedata.normalize("NFKC", text).translate(NORMALIZE_TABLE)
+    text = ' '.join(text.split())  # Remove extra spaces
+    return text.replace("ابن", "بن")  # Treat ابن and بن as the same
+
+def strip_honorifics(title):
+    for pattern in HONORIFICS:
+        title = title.replace(pattern, "").strip()
+    return title
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def title_words(title):
+    """The distinct normalized words of a narrator title, honorifics removed"""
+    return tuple(dict.fromkeys(normalize_arabic(strip_honorifics(title)).split()))
+
+def is_normal_narrator(title, hint):
+    """True if every word of the title occurs in the hint, i.e. the title names the hinted narrator"""
+    hint = normalize_arabic(hint)
+    return all(word in hint for word in title_words(title))
+
+def clear_caches():
+    normalize_arabic.cache_clear()
+    title_words.cache_clear()
+
+def format_cache_stats():
+    parts = []
+    for name, cached in (("normalized strings", normalize_arabic), ("title words", title_words)):
+        info = cached.cache_info()
+        parts.append(f"{name} {info.hits} hits, {info.misses} misses, {info.currsize} cached")
+    return "; ".join(parts)
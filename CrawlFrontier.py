@@ -0,0 +1,201 @@
+import os
+import math
+import sqlite3
+import hashlib
+import threading
+
+# Default file holding every hadith ID the frontier has seen
+DEFAULT_FRONTIER_PATH = "crawl_frontier.sqlite3"
+
+# Expected number of IDs and false-positive rate of the first Bloom filter;
+# more filters, each twice as large, are added as the crawl grows
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.01
+
+# IDs taken from the on-disk queue at a time
+FRONTIER_CHUNK = 500
+
+# Seed IDs inserted between commits
+SEED_COMMIT_EVERY = 1000
+
+QUEUED = 0
+TAKEN = 1
+
+def reference_ids(details):
+    """Return the hadithIds in the groupTogetherList of an ElasticHadithById response"""
+    ids = []
+    for entry in (details or {}).get("data") or []:
+        if not isinstance(entry, dict):
+            continue
+        for item in entry.get("groupTogetherList") or []:
+            if isinstance(item, dict) and item.get("hadithId") not in (None, "", "N/A"):
+                ids.append(str(item["hadithId"]))
+    return ids
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings; about 1.2 bytes per key at a 1% error rate"""
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+class CrawlFrontier:
+    """Queue of hadith IDs to crawl, fed by the sitemap and by references found in responses.
+
+    Every ID ever offered is kept in a SQLite file, which is the exact seen
+    set and also holds the queue of IDs not yet handed out. A chain of Bloom
+    filters in memory answers most "seen before?" questions for new IDs
+    without touching the disk; only a Bloom hit is checked against the file.
+    Memory stays at the Bloom filters plus one chunk of queued IDs however
+    large the reference graph is.
+
+    IDs handed out by a run that stopped early are queued again when the
+    file is reopened; the crawl journal skips the ones that were finished.
+    """
+
+    def __init__(self, path=DEFAULT_FRONTIER_PATH, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE,
+                 limit=None, accept=None):
+        self.path = path
+        self.error_rate = error_rate
+        self.limit = limit
+        self.accept = accept
+        self.lock = threading.Lock()
+        self.counters = {"seeds": 0, "discovered": 0, "duplicates": 0, "disk_checks": 0, "false_positives": 0,
+                         "over_limit": 0}
+        self.uncommitted = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS frontier (hadith_id TEXT PRIMARY KEY, state INTEGER NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state)")
+        self.db.execute("UPDATE frontier SET state = ? WHERE state = ?", (QUEUED, TAKEN))
+        self.db.commit()
+
+        self.count = self.db.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+        self.queued = self.db.execute("SELECT COUNT(*) FROM frontier WHERE state = ?", (QUEUED,)).fetchone()[0]
+        self.filters = [BloomFilter(max(capacity, self.count * 2), error_rate)]
+        for (hadith_id,) in self.db.execute("SELECT hadith_id FROM frontier"):
+            self.filters[-1].add(hadith_id)
+
+    def _seen(self, hadith_id):
+        if not any(hadith_id in bloom for bloom in self.filters):
+            return False
+        self.counters["disk_checks"] += 1
+        row = self.db.execute("SELECT 1 FROM frontier WHERE hadith_id = ?", (hadith_id,)).fetchone()
+        if row is None:
+            self.counters["false_positives"] += 1
+            return False
+        return True
+
+    def _add(self, hadith_id):
+        bloom = self.filters[-1]
+        if bloom.count >= bloom.capacity:
+            # Keep the overall error rate in check by making each new filter larger and stricter
+            bloom = BloomFilter(bloom.capacity * 2, bloom.error_rate / 2)
+            self.filters.append(bloom)
+        bloom.add(hadith_id)
+        self.db.execute("INSERT INTO frontier (hadith_id, state) VALUES (?, ?)", (hadith_id, QUEUED))
+        self.count += 1
+        self.queued += 1
+        self.uncommitted += 1
+
+    def offer(self, hadith_id, discovered=False):
+        """Queue an ID unless it was seen before; returns True if it was new"""
+        hadith_id = str(hadith_id)
+        with self.lock:
+            if self._seen(hadith_id):
+                self.counters["duplicates"] += 1
+                return False
+            if discovered and self.limit is not None and self.count >= self.limit:
+                self.counters["over_limit"] += 1
+                return False
+            self._add(hadith_id)
+            self.counters["discovered" if discovered else "seeds"] += 1
+            if self.uncommitted >= SEED_COMMIT_EVERY:
+                self._commit()
+            return True
+
+    def discover(self, hadith_ids):
+        """Queue the new IDs among references found in a response; returns how many were new"""
+        added = 0
+        for hadith_id in hadith_ids:
+            if self.accept is not None and not self.accept(str(hadith_id)):
+                continue
+            added += self.offer(hadith_id, discovered=True)
+        # Discovered IDs are committed right away; the hadith they came from may be marked done next
+        with self.lock:
+            self._commit()
+        return added
+
+    def _commit(self):
+        if self.uncommitted:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def take(self, count=FRONTIER_CHUNK):
+        """Hand out up to count queued IDs, oldest first"""
+        with self.lock:
+            rows = self.db.execute("SELECT rowid, hadith_id FROM frontier WHERE state = ? ORDER BY rowid LIMIT ?",
+                                   (QUEUED, count)).fetchall()
+            if rows:
+                self.db.executemany("UPDATE frontier SET state = ? WHERE rowid = ?",
+                                    [(TAKEN, rowid) for rowid, _ in rows])
+                self.db.commit()
+                self.uncommitted = 0
+                self.queued -= len(rows)
+            return [hadith_id for _, hadith_id in rows]
+
+    def iter_ids(self, seed_ids=()):
+        """Yield queued IDs with the seeds added as they are read, until the queue is empty.
+
+        References discovered while the IDs are being crawled join the queue
+        and come out of the same iterator. Once it is exhausted, IDs found
+        by hadiths still in flight are left queued; iterate again for them.
+        """
+        for hadith_id in seed_ids:
+            self.offer(hadith_id)
+            if self.queued >= FRONTIER_CHUNK:
+                yield from self.take()
+        while True:
+            hadith_ids = self.take()
+            if not hadith_ids:
+                return
+            yield from hadith_ids
+
+    def memory_bytes(self):
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+    def format_stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return (f"{self.count} IDs seen ({counters['seeds']} new from the sitemap, {counters['discovered']} "
+                f"discovered in references), {self.queued} queued, {counters['duplicates']} duplicates, "
+                f"{counters['over_limit']} over the limit; Bloom filters {self.memory_bytes() / 1024:.0f} KB, "
+                f"{counters['disk_checks']} disk checks, {counters['false_positives']} false positives")
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.db.close()
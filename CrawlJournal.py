@@ -0,0 +1,104 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+
+# Default journal file for the JSON crawler
+DEFAULT_JOURNAL_PATH = "crawl_journal.sqlite3"
+
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+def scan_saved_hadith_ids(output_dir):
+    """Return the IDs of all hadith_{id}.json files already in the output folder"""
+    saved = set()
+    if not os.path.isdir(output_dir):
+        return saved
+    pattern = re.compile(r'hadith_(\d+)\.json$')
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            match = pattern.match(entry.name)
+            if match:
+                saved.add(match.group(1))
+    return saved
+
+class CrawlJournal:
+    """Durable record of which hadith IDs are done, failed or in flight.
+
+    Every state change is committed to a SQLite file straight away, so after
+    a crash or restart remaining() can work out what is left to fetch.
+    IDs left in flight by a crash are simply fetched again.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS crawl_state ("
+            "hadith_id TEXT PRIMARY KEY, status TEXT, attempts INTEGER DEFAULT 0, "
+            "error TEXT, updated_at REAL)"
+        )
+        self.db.commit()
+
+    def _set(self, hadith_id, status, error=None, count_attempt=False):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO crawl_state (hadith_id, status, attempts, error, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(hadith_id) DO UPDATE SET status = excluded.status, "
+                "attempts = attempts + ?, error = excluded.error, updated_at = excluded.updated_at",
+                (str(hadith_id), status, 1 if count_attempt else 0, error, time.time(), 1 if count_attempt else 0)
+            )
+            self.db.commit()
+
+    def mark_in_flight(self, hadith_id):
+        self._set(hadith_id, IN_FLIGHT, count_attempt=True)
+
+    def mark_done(self, hadith_id):
+        self._set(hadith_id, DONE)
+
+    def mark_failed(self, hadith_id, error):
+        self._set(hadith_id, FAILED, error=str(error))
+
+    def status(self, hadith_id):
+        """Return the recorded status of one ID, or None if it was never seen"""
+        with self.lock:
+            row = self.db.execute("SELECT status FROM crawl_state WHERE hadith_id = ?", (str(hadith_id),)).fetchone()
+        return row[0] if row else None
+
+    def ids_with_status(self, status):
+        with self.lock:
+            rows = self.db.execute("SELECT hadith_id FROM crawl_state WHERE status = ?", (status,)).fetchall()
+        return {row[0] for row in rows}
+
+    def counts(self):
+        with self.lock:
+            rows = self.db.execute("SELECT status, COUNT(*) FROM crawl_state GROUP BY status").fetchall()
+        return dict(rows)
+
+    def remaining(self, hadith_ids, output_dir=None, include_failed=True, saved_ids=None):
+        """Yield the sitemap IDs still to fetch, in sitemap order.
+
+        IDs marked done, IDs whose hadith_{id}.json already exists in
+        output_dir and IDs in saved_ids (e.g. from a segment store) are
+        skipped. Failed IDs are kept unless include_failed is False.
+        hadith_ids may be any iterable, including a generator.
+        """
+        finished = self.ids_with_status(DONE)
+        if not include_failed:
+            finished |= self.ids_with_status(FAILED)
+        if output_dir is not None:
+            finished |= scan_saved_hadith_ids(output_dir)
+        if saved_ids:
+            finished |= set(saved_ids)
+        return (hadith_id for hadith_id in hadith_ids if str(hadith_id) not in finished)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
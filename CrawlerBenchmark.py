@@ -0,0 +1,199 @@
+import os
+import sys
+import csv
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from MockHadithApi import start_mock_server, add_mock_arguments, mock_from_args
+from RetryScheduler import RetryScheduler
+
+# Load-tests the crawlers against MockHadithApi instead of hadith.inoor.ir.
+#
+#   python CrawlerBenchmark.py --crawler rfs --ids 500 --mode async --concurrency 16
+#   python CrawlerBenchmark.py --crawler cws2 --ids 200 --error-rate 0.02 --throttle-rate 0.01
+#
+# The mock server runs in this process and the crawler modules are imported
+# only after HADITH_API_BASE points at it, with a scratch folder as working
+# directory so their logs and output files don't land in the repo.
+
+def percentile_ms(endpoint_name, percentile):
+    from HadithApiClient import latency_percentile
+    value = latency_percentile(endpoint_name, percentile)
+    return f"{value * 1000:.0f}ms" if value is not None else "n/a"
+
+def benchmark_ids(count, start_id):
+    return [str(hadith_id) for hadith_id in range(start_id, start_id + count)]
+
+def open_frontier(args, workdir, name):
+    """A fresh CrawlFrontier for one crawler, or None without --frontier"""
+    if not args.frontier:
+        return None
+    from CrawlFrontier import CrawlFrontier
+    return CrawlFrontier(os.path.join(workdir, f"{name}_frontier.sqlite3"), limit=args.frontier_limit)
+
+def configure_client(args):
+    from HadithApiClient import rate_limiter, reset_latencies, configure_deadlines, reset_hedge_stats
+    from RateLimiter import DEFAULT_BUDGETS
+    for endpoint_name, budget in DEFAULT_BUDGETS.items():
+        budget = dict(budget, rate=args.rate, max_rate=max(args.rate, args.max_rate or args.rate))
+        if args.min_rate is not None:
+            budget["min_rate"] = min(args.min_rate, args.rate)
+        rate_limiter.configure(endpoint_name, **budget)
+    configure_deadlines(hedge_percentile=args.hedge_percentile, hedging=not args.no_hedge)
+    reset_latencies()
+    reset_hedge_stats()
+
+def run_response_fetching_script(args, hadith_ids, workdir, scheduler):
+    """Run ResponseFetchingScript.process_hadith_ids(_async); returns (succeeded, failed)"""
+    import ResponseFetchingScript as crawler
+    from SegmentStore import SegmentWriter
+    crawler.details_client.batch_size = args.batch_size
+    crawler.details_client.timeout = crawler.request_timeout = args.timeout
+    if args.time_budget is not None:
+        crawler.time_budget_seconds = args.time_budget or None
+    crawler.segment_writer = SegmentWriter(os.path.join(workdir, "segments"))
+    csv_file = os.path.join(workdir, "hadith_data.csv")
+    crawler.frontier = open_frontier(args, workdir, "rfs")
+    pending = iter(hadith_ids) if crawler.frontier is None else crawler.frontier.iter_ids(hadith_ids)
+    succeeded = failed = 0
+    try:
+        # Same rounds as ResponseFetchingScript.main when crawling a frontier
+        while True:
+            if args.mode == "async":
+                counts = asyncio.run(crawler.process_hadith_ids_async(
+                    pending, csv_file, args.max_retries, args.concurrency, scheduler=scheduler))
+            else:
+                counts = crawler.process_hadith_ids(pending, csv_file, args.max_retries, scheduler=scheduler)
+            succeeded, failed = succeeded + counts[0], failed + counts[1]
+            if crawler.frontier is None or not crawler.frontier.queued:
+                return succeeded, failed
+            pending = crawler.frontier.iter_ids()
+    finally:
+        crawler.segment_writer.close()
+        crawler.segment_writer = None
+        if crawler.frontier is not None:
+            print(f"Crawl frontier: {crawler.frontier.format_stats()}")
+            crawler.frontier.close()
+            crawler.frontier = None
+
+def run_current_working_script(args, hadith_ids, workdir, scheduler):
+    """Run CurrentWorkingScript2.process_hadith_data; returns (succeeded, failed)"""
+    import CurrentWorkingScript2 as crawler
+    # The script sends stdout to its log file on import; the benchmark report goes to the console
+    sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    crawler.details_client.batch_size = args.batch_size
+    crawler.details_client.timeout = args.timeout
+    if args.time_budget is not None:
+        crawler.HADITH_TIME_BUDGET = args.time_budget or None
+    crawler.set_csv_folder(os.path.join(workdir, "cws2_csv"))
+    crawler.initialize_csv_files()
+    names = ["hadith_file", "book_file", "reference_file", "sanad_file", "narrator_file", "narrator_chain_file",
+             "narrator_details_file", "narrator_death_records_file", "narrator_evaluation_file"]
+    frontier = open_frontier(args, workdir, "cws2")
+    pending = iter(hadith_ids) if frontier is None else frontier.iter_ids(hadith_ids)
+    with contextlib.ExitStack() as stack:
+        writers = [csv.writer(stack.enter_context(open(getattr(crawler, name), "a", newline="", encoding="utf-8")))
+                   for name in names]
+        # The crawler prints several lines per hadith; keep them out of the report
+        stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w", encoding="utf-8")))
+        succeeded = crawler.process_hadith_data(pending, *writers, scheduler=scheduler,
+                                                fetch_workers=args.fetch_workers, extract_workers=args.extract_workers,
+                                                frontier=frontier)
+    attempted = len(hadith_ids)
+    if frontier is not None:
+        print(f"Crawl frontier: {frontier.format_stats()}")
+        attempted = frontier.count
+        frontier.close()
+    return succeeded, attempted - succeeded
+
+CRAWLERS = {
+    "rfs": ("ResponseFetchingScript.process_hadith_ids", run_response_fetching_script),
+    "cws2": ("CurrentWorkingScript2.process_hadith_data", run_current_working_script),
+}
+
+def report(label, elapsed, succeeded, failed, server_stats, scheduler):
+    from HadithApiClient import format_hedge_stats
+    total = succeeded + failed
+    print(f"\n=== {label} ===")
+    print(f"Hadith IDs: {total} ({succeeded} succeeded, {failed} failed) in {elapsed:.2f}s")
+    print(f"Throughput: {succeeded / elapsed if elapsed else 0:.1f} hadith/s")
+    for endpoint_name in ("details", "rejal"):
+        requests_sent = server_stats["requests"].get(endpoint_name, 0)
+        statuses = {status.split(":", 1)[1]: count for status, count in server_stats["statuses"].items()
+                    if status.startswith(endpoint_name + ":")}
+        print(f"{endpoint_name}: {requests_sent} requests, p50 {percentile_ms(endpoint_name, 50)}, "
+              f"p99 {percentile_ms(endpoint_name, 99)}, statuses {statuses}, "
+              f"{server_stats['unique_ids'].get(endpoint_name, 0)} unique IDs, "
+              f"{server_stats['repeated_ids'].get(endpoint_name, 0)} retried/refetched IDs")
+    print(f"Time per hadith: p50 {percentile_ms('hadith', 50)}, p99 {percentile_ms('hadith', 99)}, "
+          f"max {percentile_ms('hadith', 100)}")
+    print(f"Hedging: {format_hedge_stats()}")
+    print(f"Retries: {scheduler.format_stats()}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the crawlers against a local mock of the hadith API")
+    parser.add_argument("--crawler", choices=["rfs", "cws2", "both"], default="rfs")
+    parser.add_argument("--ids", type=int, default=200, help="Number of hadith IDs to crawl")
+    parser.add_argument("--start-id", type=int, default=1000)
+    parser.add_argument("--mode", choices=["sequential", "async"], default="sequential",
+                        help="ResponseFetchingScript mode")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--fetch-workers", type=int, default=None, help="CurrentWorkingScript2 fetch threads")
+    parser.add_argument("--extract-workers", type=int, default=None, help="CurrentWorkingScript2 extraction threads")
+    parser.add_argument("--max-retries", type=int, default=None)
+    parser.add_argument("--frontier", action="store_true",
+                        help="Also crawl the hadith IDs referenced in groupTogetherList")
+    parser.add_argument("--frontier-limit", type=int, default=None,
+                        help="Stop queueing discovered IDs once this many have been seen")
+    parser.add_argument("--retry-delay-scale", type=float, default=0.05,
+                        help="Multiplier on the retry policies' delays, so a benchmark doesn't wait minutes")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Fixed per-request timeout (default: derived from observed latencies)")
+    parser.add_argument("--hedge-percentile", type=float, default=None)
+    parser.add_argument("--no-hedge", action="store_true", help="Compare against a run without hedged requests")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Seconds allowed per hadith (default: the crawler's own; 0 for no limit)")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="Client requests per second per endpoint (high by default to measure the crawler)")
+    parser.add_argument("--max-rate", type=float, default=None)
+    parser.add_argument("--min-rate", type=float, default=None,
+                        help="Floor for the rate limiter, e.g. so heavy-tailed latency can't throttle a comparison run")
+    parser.add_argument("--workdir", default=None, help="Scratch folder for crawler output (temporary by default)")
+    add_mock_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    corpus, config = mock_from_args(args)
+    server = start_mock_server(corpus, config)
+    os.environ["HADITH_API_BASE"] = server.base_url
+    if "HadithApiClient" in sys.modules:
+        print("HadithApiClient was imported before the mock server started; endpoints may be wrong")
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="hadith_benchmark_"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    print(f"Mock API at {server.base_url} (latency {config.latency_spec}, errors {config.error_rate:.1%}, "
+          f"429s {config.throttle_rate:.1%}, rate limit {config.rate_limit or 'none'})")
+    print(f"Crawler output in {workdir}")
+
+    hadith_ids = benchmark_ids(args.ids, args.start_id)
+    crawlers = ["rfs", "cws2"] if args.crawler == "both" else [args.crawler]
+    for name in crawlers:
+        label, run = CRAWLERS[name]
+        configure_client(args)
+        server.state.reset()
+        scheduler = RetryScheduler(max_attempts=args.max_retries, delay_scale=args.retry_delay_scale)
+        started = time.monotonic()
+        succeeded, failed = run(args, hadith_ids, workdir, scheduler)
+        elapsed = time.monotonic() - started
+        report(f"{label} ({args.mode if name == 'rfs' else 'pipeline'})", elapsed, succeeded, failed,
+               server.state.stats(), scheduler)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,34 @@ import csv
 import uuid
 import re
 import os
-import requests
 import time
-import random
 import logging
 import sys
+import argparse
+import itertools
+import threading
+import queue
 from datetime import datetime
+from HadithApiClient import (
+    BatchedDetailsClient, HADITH_DETAILS_ENDPOINT, HADITH_REJAL_ENDPOINT, send_request, format_connection_stats, rate_limiter,
+    run_concurrently, enable_response_cache, cache_lookup, cache_store, format_cache_stats,
+    DEFAULT_HADITH_TIME_BUDGET, hadith_time_budget, record_latency, configure_deadlines, format_hedge_stats
+)
+from CrawlJournal import CrawlJournal, DONE
+from CrawlFrontier import CrawlFrontier, reference_ids
+from RejalIndex import rejal_index
+from NarratorProfile import extract_narrator_profile
+from JsonBackend import response_json
+from RetryScheduler import RetryScheduler, DeadLetterFile
+from SitemapReader import iter_hadith_ids, is_xml_source, URL_LIST_HADITH_PATTERN, SITEMAP_HADITH_PATTERN
+from Sharding import (
+    add_shard_arguments, argv_shard_suffix, filter_shard, shard_of, shard_path, shard_suffix, launch_shards,
+    merge_narrator_tables
+)
 
 # Create a log file name with timestamp
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file_path = f"hadith_processing_log_{timestamp}.txt"
+log_file_path = f"hadith_processing_log_{timestamp}{argv_shard_suffix()}.txt"
 
 # Set up a file to capture all output
 class Logger:
@@ -71,43 +89,76 @@ for file_path in [hadith_file, book_file, reference_file, sanad_file, narrator_f
 # API Endpoints
 def get_endpoints(hadith_id):
     return {
-        "hadith_details": "https://hadith.inoor.ir/service/api/elastic/ElasticHadithById",
-        "hadith_rejal": f"https://hadith.inoor.ir/service/api/hadith/HadithRejalList/v2?hadithId={hadith_id}"
+        "hadith_details": HADITH_DETAILS_ENDPOINT,
+        "hadith_rejal": f"{HADITH_REJAL_ENDPOINT}?hadithId={hadith_id}"
     }
 
+# Groups ElasticHadithById lookups into multi-ID requests (1 disables batching)
+DETAILS_BATCH_SIZE = 20
+# timeout=None: each request's deadline comes from the endpoint's observed latencies
+details_client = BatchedDetailsClient(batch_size=DETAILS_BATCH_SIZE, timeout=None)
+
+# Seconds allowed for the details, rejal and reference requests of one hadith (None: no limit)
+HADITH_TIME_BUDGET = DEFAULT_HADITH_TIME_BUDGET
+
+# Persistent cache of API responses, reused across runs and across references
+response_cache_file = "response_cache.sqlite3"
+
+# Records which hadith IDs already made it into the CSV files, so a restart continues
+crawl_journal_file = os.path.join(csv_folder, "crawl_journal.sqlite3")
+
+# Hadith IDs that failed on every retry, for a later --replay-dead-letters run
+dead_letter_file = os.path.join(csv_folder, "dead_letters.jsonl")
+
+# Every hadith ID seen by a --frontier crawl, and the ones still to crawl
+crawl_frontier_file = os.path.join(csv_folder, "crawl_frontier.sqlite3")
+
+# Point every CSV path (and the journal) at another folder, e.g. one per shard
+def set_csv_folder(folder):
+    global csv_folder, hadith_file, book_file, reference_file, sanad_file, narrator_file, narrator_chain_file
+    global narrator_details_file, narrator_death_records_file, narrator_evaluation_file, crawl_journal_file
+    global dead_letter_file, crawl_frontier_file
+    
+    csv_folder = folder
+    os.makedirs(csv_folder, exist_ok=True)
+    hadith_file = os.path.join(csv_folder, "hadith.csv")
+    book_file = os.path.join(csv_folder, "book.csv")
+    reference_file = os.path.join(csv_folder, "reference.csv")
+    sanad_file = os.path.join(csv_folder, "hadith_sanad.csv")
+    narrator_file = os.path.join(csv_folder, "narrators.csv")
+    narrator_chain_file = os.path.join(csv_folder, "hadith_narrator_chain.csv")
+    narrator_details_file = os.path.join(csv_folder, "narrator_details.csv")
+    narrator_death_records_file = os.path.join(csv_folder, "narrator_death_records.csv")
+    narrator_evaluation_file = os.path.join(csv_folder, "narrator_evaluation.csv")
+    crawl_journal_file = os.path.join(csv_folder, "crawl_journal.sqlite3")
+    dead_letter_file = os.path.join(csv_folder, "dead_letters.jsonl")
+    crawl_frontier_file = os.path.join(csv_folder, "crawl_frontier.sqlite3")
+
 # Function to fetch Hadith details (POST request)
 def fetch_hadith_details(hadith_id):
-    payload = {"hadithId": [hadith_id], "searchPhrase": ""}
-    headers = {"accept": "application/json", "content-type": "application/json"}
-    
     try:
         print(f"Fetching hadith details for ID: {hadith_id}")
-        response = requests.post(get_endpoints(hadith_id)["hadith_details"], json=payload, headers=headers)
-        print(f"Response status code: {response.status_code}")
+        data, error = details_client.get(hadith_id)
         
-        if response.status_code == 200:
-            data = response.json()
+        if error is None:
             print(f"Response data keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dictionary'}")
             return data
         else:
-            logging.error(f"Failed to fetch hadith details for ID {hadith_id}. Status code: {response.status_code}")
-            print(f"Error response: {response.text[:100]}...")  # Print first 100 chars
-            return {"error": response.text}
+            logging.error(f"Failed to fetch hadith details for ID {hadith_id}. {error}")
+            print(f"Error response: {error}")
+            return {"error": error}
     except Exception as e:
         logging.error(f"Exception while fetching hadith details for ID {hadith_id}: {str(e)}")
         return {"error": str(e)}
 
 # Function to fetch reference details for a hadith ID
+# Returns None if the request failed, {} if the reference has no data
 def fetch_reference_details(reference_hadith_id):
-    payload = {"hadithId": [reference_hadith_id], "searchPhrase": ""}
-    headers = {"accept": "application/json", "content-type": "application/json"}
-    
     try:
         print(f"Fetching reference details for ID: {reference_hadith_id}")
-        response = requests.post(get_endpoints(reference_hadith_id)["hadith_details"], json=payload, headers=headers)
+        data, error = details_client.get(reference_hadith_id)
         
-        if response.status_code == 200:
-            data = response.json()
+        if error is None:
             if "data" in data and data["data"]:
                 ref_data = data["data"][0]
                 return {
@@ -119,11 +170,11 @@ def fetch_reference_details(reference_hadith_id):
                 }
             return {}
         else:
-            logging.error(f"Failed to fetch reference details for ID {reference_hadith_id}. Status code: {response.status_code}")
-            return {}
+            logging.error(f"Failed to fetch reference details for ID {reference_hadith_id}. {error}")
+            return None
     except Exception as e:
         logging.error(f"Exception while fetching reference details for ID {reference_hadith_id}: {str(e)}")
-        return {}
+        return None
 
 # Function to fetch Hadith Rejal list (GET request)
 def fetch_hadith_rejal(hadith_id):
@@ -131,46 +182,45 @@ def fetch_hadith_rejal(hadith_id):
     
     try:
         print(f"Fetching hadith rejal for ID: {hadith_id}")
-        response = requests.get(get_endpoints(hadith_id)["hadith_rejal"], headers=headers)
+        cached = cache_lookup("rejal", hadith_id)
+        if cached is not None:
+            print(f"Using cached hadith rejal for ID: {hadith_id}")
+            return cached
+        
+        response = send_request("rejal", "GET", get_endpoints(hadith_id)["hadith_rejal"], headers=headers)
         print(f"Response status code: {response.status_code}")
         
         if response.status_code == 200:
-            data = response.json()
+            data = response_json(response)
             print(f"Response data keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dictionary'}")
+            cache_store("rejal", hadith_id, data)
             return data
         else:
             logging.error(f"Failed to fetch hadith rejal for ID {hadith_id}. Status code: {response.status_code}")
-            return None
+            return {"error": f"Failed to fetch hadith rejal: HTTP {response.status_code}"}
     except Exception as e:
         logging.error(f"Exception while fetching hadith rejal for ID {hadith_id}: {str(e)}")
-        return None
+        return {"error": str(e)}
 
-# Extract Hadith IDs from the file
+# Extract Hadith IDs from the file, yielding them as they are read
+# (plain URL lists, sitemap XML, sitemap indexes and .gz files are all accepted)
 def extract_hadith_ids(filename):
     try:
         if not os.path.exists(filename):
             print(f"ERROR: Sitemap file does not exist: {filename}")
-            return []
-            
-        with open(filename, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        print(f"Read {len(lines)} lines from sitemap file")
+            return
         
-        ids = []
-        for line in lines:
-            match = re.search(r'/hadith/(\d+)/', line)
-            if match:
-                ids.append(match.group(1))
+        count = 0
+        for hadith_id in iter_hadith_ids(filename, URL_LIST_HADITH_PATTERN if not is_xml_source(filename) else SITEMAP_HADITH_PATTERN):
+            count += 1
+            if count <= 5:
+                print(f"Found hadith ID in sitemap: {hadith_id}")
+            yield hadith_id
         
-        print(f"Found {len(ids)} hadith IDs in the sitemap file")
-        if ids:
-            print(f"First few IDs: {ids[:5]}")
-        return ids
+        print(f"Found {count} hadith IDs in the sitemap file")
     except Exception as e:
         logging.error(f"Error extracting hadith IDs from {filename}: {str(e)}")
         print(f"Exception reading sitemap: {str(e)}")
-        return []
 
 # Check if CSV files exist and create headers if needed
 def initialize_csv_files():
@@ -203,487 +253,519 @@ def initialize_csv_files():
         else:
             print(f"File exists and is not empty: {file_path}")
 
-# Helper function to extract narrator titles from rejal data
-def extract_narrator_titles(rejal_data, ravi_id):
-    titles = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return ""
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return ""
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList", []):
-                if info.get("title") == "لقب":  # Filter only title "لقب"
-                    for text_entry in info.get("text", []):
-                        book_names = []
-                        for book in text_entry.get("bookName", []):
-                            book_name = book.get("bookName", "")
-                            if book_name:
-                                book_names.append(book_name)
-                        
-                        text = text_entry.get("text", "")
-                        if text:
-                            book_names_str = ", ".join(book_names)
-                            formatted_title = f"{text}({book_names_str})"
-                            titles.append(formatted_title)
-    
-    return " | ".join(titles) if titles else ""
-
-# Helper function to extract narrator patronymic
-def extract_narrator_patronymic(rejal_data, ravi_id):
-    patronymics = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return ""
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return ""
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList", []):
-                if info.get("title") == "کنيه":  # Filter only title "کنيه" (patronymic)
-                    for text_entry in info.get("text", []):
-                        book_names = []
-                        for book in text_entry.get("bookName", []):
-                            book_name = book.get("bookName", "")
-                            if book_name:
-                                book_names.append(book_name)
-                        
-                        text = text_entry.get("text", "")
-                        if text:
-                            book_names_str = ", ".join(book_names)
-                            formatted_patronymic = f"{text}({book_names_str})"
-                            patronymics.append(formatted_patronymic)
-    
-    return " | ".join(patronymics) if patronymics else ""
-
-# Helper function to extract narrator sect and reliability
-def extract_narrator_sect_reliability(rejal_data, ravi_id):
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return {"sect": "", "reliability": ""}
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return {"sect": "", "reliability": ""}
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList2", []):
-                if info.get("title", "").strip() == "نتيجه ارزيابي":
-                    text_entries = info.get("text", [])
-                    if text_entries:
-                        cleaned_text = "".join(text_entries).replace(" ,", ",")
-                        words = cleaned_text.split(", ")
-                        
-                        sect = words[0] if len(words) > 0 else ""
-                        reliability = words[1] if len(words) > 1 else ""
-                        
-                        return {"sect": sect, "reliability": reliability}
-    
-    return {"sect": "", "reliability": ""}
-
-# Helper function to extract narrator evaluation summary
-def extract_narrator_evaluation_summary(rejal_data, ravi_id):
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return ""
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return ""
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList2", []):
-                if info.get("title") == "جمع بندي ارزيابي":  # Summary evaluation
-                    text = info.get("text", "")
-                    if text:
-                        return text
-    
-    return ""
-
-# Helper function to extract detailed evaluations
-def extract_narrator_evaluations(rejal_data, ravi_id):
-    evaluations = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return evaluations
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return evaluations
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList2", []):
-                if info.get("title") == "الفاظ جرح و تعدیل":  # Evaluation terms
-                    for entry in info.get("text", []):
-                        text_value = entry.get("text", "")
-                        sources = []
-                        
-                        # Extract book names
-                        if "bookName" in entry:
-                            for book_item in entry["bookName"]:
-                                if isinstance(book_item, dict) and "bookName" in book_item:
-                                    sources.append(book_item["bookName"])
-                        
-                        if text_value:  # Only add if there's evaluation text
-                            evaluations.append({
-                                "text": text_value,
-                                "sources": sources
-                            })
-    
-    return evaluations
-
-# Helper function to extract death information
-def extract_narrator_death_info(rejal_data, ravi_id):
-    death_records = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return death_records
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return death_records
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList", []):
-                if info.get("title") in ["وفات", "تاريخ وفات"]:  # Death or Death date
-                    for entry in info.get("text", []):
-                        if isinstance(entry, dict):
-                            death_year = entry.get("text", "").strip()
-                            book_names = []
-                            
-                            # Extract book names
-                            if "bookName" in entry:
-                                for book_item in entry.get("bookName", []):
-                                    if isinstance(book_item, dict) and "bookName" in book_item:
-                                        book_names.append(book_item["bookName"])
-                            
-                            source = ", ".join(book_names)
-                            
-                            if death_year or source:  # Only add if we have data
-                                death_records.append({
-                                    "death_year": death_year,
-                                    "source": source
-                                })
-    
-    return death_records
-
-# Main function to process hadith data
-def process_hadith_data(hadith_ids, hadith_writer, book_writer, reference_writer, 
-                        sanad_writer, narrator_writer, narrator_chain_writer,
-                        narrator_details_writer, narrator_death_records_writer, 
-                        narrator_evaluation_writer):
-    
-    # Keep track of processed books and narrators to avoid duplicates
-    processed_books = {}
-    processed_narrators = {}
-    processed_hadiths = {}  # Track processed hadiths to avoid duplicates
-    processed_narrator_details = set()  # Track processed narrator details
-    successful_entries = 0
-
-    # Fetch and process data for each Hadith ID
-    for hadith_id in hadith_ids:
-        try:
-            print(f"\n{'='*50}")
-            print(f"Processing Hadith ID: {hadith_id}")
-            
-            # Skip if we've already processed this hadith
-            if hadith_id in processed_hadiths:
-                print(f"Skipping already processed Hadith ID: {hadith_id}")
+# Pipeline sizing: threads in the fetch and extraction stages, and how many
+# hadiths may wait between stages before the stage in front has to wait too
+FETCH_WORKERS = 4
+EXTRACT_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 32
+
+# Put on a stage's queue once per worker to tell it there is no more work
+STAGE_DONE = object()
+
+# Fetch stage: details, rejal and every referenced hadith for one ID
+def fetch_hadith_bundle(hadith_id):
+    started = time.monotonic()
+    try:
+        with hadith_time_budget(HADITH_TIME_BUDGET) as budget:
+            bundle, error = fetch_hadith_responses(hadith_id)
+            # A reference was dropped once the budget ran out; retry the whole hadith instead.
+            # A complete bundle is kept even if it arrived after the budget expired.
+            if budget is not None and bundle is not None and bundle["dropped_references"]:
+                budget.check()
+            return bundle, error
+    finally:
+        record_latency("hadith", time.monotonic() - started)
+
+def fetch_hadith_responses(hadith_id):
+    # Details and rejal don't depend on each other, so both requests go out at once
+    hadith_data, rejal_data = run_concurrently(
+        lambda: fetch_hadith_details(hadith_id),
+        lambda: fetch_hadith_rejal(hadith_id)
+    )
+    
+    # Nothing is written for a hadith until all its responses are in, so it can be retried cleanly
+    error = hadith_data.get("error") or (rejal_data or {}).get("error")
+    if error:
+        return None, error
+    if not ("data" in hadith_data and hadith_data["data"]):
+        return None, "No valid data found"
+    
+    hadith_entry = hadith_data["data"][0]
+    hadith_id_from_data = hadith_entry.get("id", "N/A")
+    referenced_ids = [item.get("hadithId", "N/A") for item in hadith_entry.get("groupTogetherList", [])
+                     if item.get("hadithId", "N/A") != hadith_id_from_data]
+    
+    # Fetch all referenced hadiths in as few requests as possible
+    details_client.prefetch(referenced_ids)
+    references = {reference_hadith_id: fetch_reference_details(reference_hadith_id)
+                  for reference_hadith_id in dict.fromkeys(referenced_ids)}
+    
+    return {
+        "hadith_id": hadith_id,
+        "entry": hadith_entry,
+        "rejal": rejal_data,
+        "references": references,
+        "dropped_references": [reference_hadith_id for reference_hadith_id, details in references.items()
+                               if details is None],
+    }, None
+
+# Extraction stage: turn the responses into plain values for the CSV rows.
+# IDs and de-duplication are left to the writer, the only stage with shared state.
+def extract_hadith_records(bundle):
+    hadith_entry = bundle["entry"]
+    rejal_data = bundle["rejal"]
+    hadith_id_from_data = hadith_entry.get("id", "N/A")
+    
+    # Extract narrators and properly join them with comma
+    qaelTitleList = hadith_entry.get("qaelTitleList", ["N/A"])
+    
+    records = {
+        "hadith_id": bundle["hadith_id"],
+        "hadith_id_from_data": hadith_id_from_data,
+        # Extract content and clean HTML tags
+        "content": re.sub(r"</?[^>]+>", "", hadith_entry.get("text", "N/A")),
+        "originated_from": ", ".join(qaelTitleList) if isinstance(qaelTitleList, list) else qaelTitleList,
+        "book_title": hadith_entry.get("bookTitle", "Unknown Book"),
+        "book_source_id": hadith_entry.get("sourceId", "unknown"),
+        "page_num": hadith_entry.get("pageNum", "N/A"),
+        "volume": hadith_entry.get("vol", "N/A"),
+        "references": [],
+        "sanads": [],
+        "narrator_info": {},
+    }
+    
+    # References, skipping self-references
+    for item in hadith_entry.get("groupTogetherList", []):
+        reference_hadith_id = item.get("hadithId", "N/A")
+        if reference_hadith_id == hadith_id_from_data:
+            continue
+        reference_details = bundle["references"].get(reference_hadith_id)
+        if reference_details:
+            records["references"].append([
+                reference_details.get("hadith_id", reference_hadith_id),  # Referenced hadith ID
+                reference_details.get("vol", "N/A"),     # Volume
+                reference_details.get("pageNum", "N/A"), # Page number
+                reference_details.get("sourceId", "N/A"), # Source ID
+                reference_details.get("sourceMainTitle", "Unknown Source")  # Source title
+            ])
+    
+    # Sanads (narrator chains)
+    sanad_list = []
+    if rejal_data is not None and isinstance(rejal_data, dict):
+        data = rejal_data.get("data", {})
+        if isinstance(data, dict):
+            sanad_list = data.get("sanadList", [])
+    
+    # raviList indexed once; each narrator's profile is built from its entries in one pass
+    rejal = rejal_index(rejal_data)
+    
+    for sanad_list_num, sanad_entry in enumerate(sanad_list, start=1):
+        # Only narrators (type=0 or type=4) are part of the sanad
+        narrators = [sanad for sanad in sanad_entry.get("sanad", []) if sanad.get("type") in [0, 4]]
+        chain = []
+        for sanad in narrators:
+            narrator_name = sanad.get("title", "N/A")
+            if narrator_name == "N/A":
                 continue
-                
-            hadith_data = fetch_hadith_details(hadith_id)
-            rejal_data = fetch_hadith_rejal(hadith_id)
+            ravi_id = None
+            if "raviList" in sanad and len(sanad["raviList"]) > 0:
+                ravi_id = sanad["raviList"][0].get("raviId")
+            chain.append((narrator_name, ravi_id))
             
-            # Extract hadith details
-            has_valid_data = False
-            
-            if "error" not in hadith_data and "data" in hadith_data and hadith_data["data"]:
-                hadith_entry = hadith_data["data"][0]
-                
-                # Generate a unique UUID for this hadith
-                hadith_uuid = str(uuid.uuid4())
-                
-                # Extract hadith ID from data
-                hadith_id_from_data = hadith_entry.get("id", "N/A")
-                print(f"Found hadith with ID: {hadith_id_from_data}")
-                
-                # Mark this hadith as processed
-                processed_hadiths[hadith_id] = hadith_uuid
-                
-                # Extract content and clean HTML tags
-                hadith_content = re.sub(r"</?[^>]+>", "", hadith_entry.get("text", "N/A"))
-                
-                # Extract narrators and properly join them with comma
-                qaelTitleList = hadith_entry.get("qaelTitleList", ["N/A"])
-                originated_from = ", ".join(qaelTitleList) if isinstance(qaelTitleList, list) else qaelTitleList
-
-                # Extract book details and create a unique book ID based on source
-                book_title = hadith_entry.get("bookTitle", "Unknown Book")
-                book_source_id = hadith_entry.get("sourceId", "unknown")
-                
-                # Create a unique book ID or use an existing one
-                if book_source_id in processed_books:
-                    book_id = processed_books[book_source_id]
-                    print(f"Using existing book ID: {book_id} for book: {book_title}")
-                else:
-                    # Generate a book ID based on source ID or create a UUID if none
-                    book_id = f"book_{book_source_id}" if book_source_id != "unknown" else f"book_{str(uuid.uuid4())[:8]}"
-                    
-                    # Extract book metadata
-                    page_num = hadith_entry.get("pageNum", "N/A")
-                    volume = hadith_entry.get("vol", "N/A")
-                    
-                    # Write book entry only once
-                    book_writer.writerow([book_id, book_title, page_num, volume])
-                    processed_books[book_source_id] = book_id
-                    print(f"Added new book: {book_title} with ID: {book_id}")
-
-                # Write hadith entry with proper book ID relationship
-                hadith_writer.writerow([hadith_uuid, hadith_id_from_data, hadith_content, originated_from, book_id])
-                print(f"Wrote hadith entry with UUID: {hadith_uuid}")
-                
-                has_valid_data = True
-                
-                # Process references - Fixed to fetch actual reference data
-                group_together_list = hadith_entry.get("groupTogetherList", [])
-                print(f"Found {len(group_together_list)} references")
-                
-                for item in group_together_list:
-                    reference_hadith_id = item.get("hadithId", "N/A")
-                    
-                    # Skip self-references
-                    if reference_hadith_id == hadith_id_from_data:
-                        print(f"Skipping self-reference to {reference_hadith_id}")
-                        continue
-                        
-                    # Fetch the reference hadith details to get accurate metadata
-                    reference_details = fetch_reference_details(reference_hadith_id)
-                    
-                    # If we have valid reference data
-                    if reference_details:
-                        reference_id = f"ref_{str(uuid.uuid4())[:8]}"  # Create unique reference ID
-                        
-                        reference_writer.writerow([
-                            reference_id,                            # Unique reference ID
-                            hadith_uuid,                             # Foreign key to hadith
-                            reference_details.get("hadith_id", reference_hadith_id),  # Referenced hadith ID
-                            reference_details.get("vol", "N/A"),     # Volume
-                            reference_details.get("pageNum", "N/A"), # Page number
-                            reference_details.get("sourceId", "N/A"), # Source ID
-                            reference_details.get("sourceMainTitle", "Unknown Source")  # Source title
-                        ])
-                        print(f"Added reference to hadith ID: {reference_hadith_id}")
-                
-                # Process Sanad (Narrator Chains)
-                sanad_list = []
-                if rejal_data is not None and isinstance(rejal_data, dict):
-                    data = rejal_data.get("data", {})
-                    if isinstance(data, dict):
-                        sanad_list = data.get("sanadList", [])
-                
-                print(f"Found {len(sanad_list)} sanad entries")
-                
-                # Collect all ravi IDs from this hadith for later processing
-                ravi_ids = []
-                
-                # Process each sanad (chain of narrators)
-                for sanad_list_num, sanad_entry in enumerate(sanad_list, start=1):
-                    # Generate unique sanad ID using a consistent format
-                    sanad_id = f"sanad_{hadith_id_from_data}_{sanad_list_num}"
-                    
-                    # Extract only narrators with type=0 for the sanad description
-                    narrators = [sanad.get("title", "N/A") 
-                                for sanad in sanad_entry.get("sanad", []) 
-                                if sanad.get("type") in [0, 4]]
-                    
-                    # Join narrator names with spaces to create the sanad description
-                    sanad_description = " ".join(narrators)
-                    
-                    # Write sanad entry with proper foreign key to hadith
-                    sanad_writer.writerow([
-                        sanad_id,           # Primary key
-                        hadith_uuid,        # Foreign key to hadith
-                        sanad_description,  # Full description
-                        sanad_list_num      # Number/position of this sanad
-                    ])
-                    print(f"Added sanad #{sanad_list_num} with {len(narrators)} narrators")
-                    
-                    # Process each narrator in this sanad
-                    position = 1  # Track position within this sanad
-                    for sanad in sanad_entry.get("sanad", []):
-                        # Only process narrators (type=0 or type=4)
-                        if sanad.get("type") in [0, 4]:
-                            narrator_name = sanad.get("title", "N/A")
-                            
-                            # Ensure we have a valid name
-                            if narrator_name == "N/A":
-                                continue
-                            
-                            # Extract ravi ID for additional data 
-                            ravi_id = None
-                            if "raviList" in sanad and len(sanad["raviList"]) > 0:
-                                ravi_id = sanad["raviList"][0].get("raviId")
-                                if ravi_id:
-                                    ravi_ids.append(ravi_id)
-                                
-                            # Check if this narrator already exists in our database
-                            if narrator_name in processed_narrators:
-                                narrator_id = processed_narrators[narrator_name]
-                                print(f"Using existing narrator: {narrator_name}")
-                            else:
-                                # Create a numeric ID for narrators instead of a string-based one
-                                narrator_id = str(uuid.uuid4().int)[:8]  # Using first 8 digits of uuid integer
-                                
-                                # Add narrator to the database
-                                narrator_writer.writerow([narrator_id, narrator_name])
-                                processed_narrators[narrator_name] = narrator_id
-                                print(f"Added new narrator: {narrator_name}")
-                            
-                            # Create a chain entry linking this narrator to this sanad
-                            chain_id = f"chain_{sanad_id}_{position}"
-                            narrator_chain_writer.writerow([
-                                chain_id,     # Primary key
-                                sanad_id,     # Foreign key to sanad
-                                narrator_id,  # Foreign key to narrator - FIXED: Now using the numeric ID
-                                position      # Position in the chain
-                            ])
-                            
-                            # Process additional narrator details if we have a ravi ID and haven't processed this narrator yet
-                            if ravi_id and (narrator_id, ravi_id) not in processed_narrator_details:
-                                # Extract narrator titles
-                                titles = extract_narrator_titles(rejal_data, ravi_id)
-                                
-                                # Extract narrator patronymic
-                                patronymic = extract_narrator_patronymic(rejal_data, ravi_id)
-                                
-                                # Extract sect and reliability
-                                sect_reliability = extract_narrator_sect_reliability(rejal_data, ravi_id)
-                                
-                                # Generate IDs for new records
-                                details_id = f"details_{str(uuid.uuid4())[:8]}"
-                                
-                                # Write narrator details
-                                narrator_details_writer.writerow([
-                                    details_id,
-                                    narrator_id,
-                                    sect_reliability.get("sect", ""),
-                                    sect_reliability.get("reliability", ""),
-                                    titles,
-                                    patronymic  # Now including the patronymic
-                                ])
-                                
-                                # Mark this narrator as processed for additional details
-                                processed_narrator_details.add((narrator_id, ravi_id))
-                                
-                                print(f"Added details for narrator: {narrator_name}")
-                                
-                                # Extract death records using the improved function
-                                death_records = extract_narrator_death_info(rejal_data, ravi_id)
-                                for death_record in death_records:
-                                    death_record_id = f"death_{str(uuid.uuid4())[:8]}"
-                                    narrator_death_records_writer.writerow([
-                                        death_record_id,
-                                        narrator_id,
-                                        death_record.get("source", ""),
-                                        death_record.get("death_year", "")
-                                    ])
-                                    print(f"Added death record for narrator: {narrator_name}")
-                                
-                                # Extract evaluation summary
-                                summary = extract_narrator_evaluation_summary(rejal_data, ravi_id)
-                                
-                                # Extract detailed evaluations
-                                evaluations = extract_narrator_evaluations(rejal_data, ravi_id)
-                                for evaluation in evaluations:
-                                    eval_id = f"eval_{str(uuid.uuid4())[:8]}"
-                                    source = ", ".join(evaluation.get("sources", []))
-                                    
-                                    narrator_evaluation_writer.writerow([
-                                        eval_id,
-                                        narrator_id,
-                                        source,
-                                        evaluation.get("text", ""),
-                                        summary  # Including the evaluation summary
-                                    ])
-                                    print(f"Added evaluation for narrator: {narrator_name}")
-                                
-                                # If we have a summary but no detailed evaluations, still add a record
-                                if summary and not evaluations:
-                                    eval_id = f"eval_{str(uuid.uuid4())[:8]}"
-                                    narrator_evaluation_writer.writerow([
-                                        eval_id,
-                                        narrator_id,
-                                        "",  # No source
-                                        "",  # No evaluation text
-                                        summary  # Only summary
-                                    ])
-                                    print(f"Added evaluation summary for narrator: {narrator_name}")
-                            
-                            # Increment position for the next narrator in this chain
-                            position += 1
-                    
-                    print(f"Added {position-1} narrators to the chain for sanad #{sanad_list_num}")
-                
-                successful_entries += 1
+            # Narrator details are extracted once per ravi ID in this hadith
+            if ravi_id and ravi_id not in records["narrator_info"]:
+                records["narrator_info"][ravi_id] = extract_narrator_profile(rejal, ravi_id)
+        
+        records["sanads"].append({
+            "number": sanad_list_num,
+            # Join narrator names with spaces to create the sanad description
+            "description": " ".join(sanad.get("title", "N/A") for sanad in narrators),
+            "narrator_count": len(narrators),
+            "chain": chain,
+        })
+    
+    return records
+
+# Writer stage: assign IDs, de-duplicate books and narrators, and write all nine tables
+def write_hadith_records(records, writers, state):
+    (hadith_writer, book_writer, reference_writer, sanad_writer, narrator_writer, narrator_chain_writer,
+     narrator_details_writer, narrator_death_records_writer, narrator_evaluation_writer) = writers
+    processed_books = state["books"]
+    processed_narrators = state["narrators"]
+    processed_narrator_details = state["narrator_details"]
+    
+    # Generate a unique UUID for this hadith
+    hadith_uuid = str(uuid.uuid4())
+    hadith_id_from_data = records["hadith_id_from_data"]
+    print(f"Found hadith with ID: {hadith_id_from_data}")
+    
+    # Create a unique book ID or use an existing one
+    book_title = records["book_title"]
+    book_source_id = records["book_source_id"]
+    if book_source_id in processed_books:
+        book_id = processed_books[book_source_id]
+        print(f"Using existing book ID: {book_id} for book: {book_title}")
+    else:
+        # Generate a book ID based on source ID or create a UUID if none
+        book_id = f"book_{book_source_id}" if book_source_id != "unknown" else f"book_{str(uuid.uuid4())[:8]}"
+        
+        # Write book entry only once
+        book_writer.writerow([book_id, book_title, records["page_num"], records["volume"]])
+        processed_books[book_source_id] = book_id
+        print(f"Added new book: {book_title} with ID: {book_id}")
+    
+    # Write hadith entry with proper book ID relationship
+    hadith_writer.writerow([hadith_uuid, hadith_id_from_data, records["content"], records["originated_from"], book_id])
+    print(f"Wrote hadith entry with UUID: {hadith_uuid}")
+    
+    for reference in records["references"]:
+        reference_id = f"ref_{str(uuid.uuid4())[:8]}"  # Create unique reference ID
+        reference_writer.writerow([reference_id, hadith_uuid] + reference)
+        print(f"Added reference to hadith ID: {reference[0]}")
+    
+    print(f"Found {len(records['sanads'])} sanad entries")
+    for sanad in records["sanads"]:
+        # Generate unique sanad ID using a consistent format
+        sanad_id = f"sanad_{hadith_id_from_data}_{sanad['number']}"
+        sanad_writer.writerow([
+            sanad_id,                # Primary key
+            hadith_uuid,             # Foreign key to hadith
+            sanad["description"],    # Full description
+            sanad["number"]          # Number/position of this sanad
+        ])
+        print(f"Added sanad #{sanad['number']} with {sanad['narrator_count']} narrators")
+        
+        for position, (narrator_name, ravi_id) in enumerate(sanad["chain"], start=1):
+            # Check if this narrator already exists in our database
+            if narrator_name in processed_narrators:
+                narrator_id = processed_narrators[narrator_name]
             else:
-                print(f"No valid data found for Hadith ID: {hadith_id}")
-                logging.warning(f"No valid data found for Hadith ID: {hadith_id}")
+                # Create a numeric ID for narrators instead of a string-based one
+                narrator_id = str(uuid.uuid4().int)[:8]  # Using first 8 digits of uuid integer
+                narrator_writer.writerow([narrator_id, narrator_name])
+                processed_narrators[narrator_name] = narrator_id
+                print(f"Added new narrator: {narrator_name}")
             
-            if has_valid_data:
-                print(f"Successfully processed Hadith ID: {hadith_id}")
+            # Create a chain entry linking this narrator to this sanad
+            narrator_chain_writer.writerow([
+                f"chain_{sanad_id}_{position}",  # Primary key
+                sanad_id,                         # Foreign key to sanad
+                narrator_id,                      # Foreign key to narrator
+                position                          # Position in the chain
+            ])
+            
+            # Additional narrator details, once per narrator and ravi ID
+            if not ravi_id or (narrator_id, ravi_id) in processed_narrator_details:
+                continue
+            info = records["narrator_info"][ravi_id]
+            narrator_details_writer.writerow([
+                f"details_{str(uuid.uuid4())[:8]}",
+                narrator_id,
+                info["sect"],
+                info["reliability"],
+                info["titles"],
+                info["patronymic"]
+            ])
+            processed_narrator_details.add((narrator_id, ravi_id))
+            print(f"Added details for narrator: {narrator_name}")
             
-            # Delay to avoid bans
-            delay = random.uniform(2, 5)
-            print(f"Waiting {delay:.2f} seconds before next request...")
-            time.sleep(delay)
+            for death_record in info["death_records"]:
+                narrator_death_records_writer.writerow([
+                    f"death_{str(uuid.uuid4())[:8]}",
+                    narrator_id,
+                    death_record.get("source", ""),
+                    death_record.get("death_year", "")
+                ])
             
-        except Exception as e:
-            logging.error(f"Error processing Hadith ID {hadith_id}: {str(e)}")
-            print(f"⚠️ Error processing Hadith ID {hadith_id}: {str(e)}")
-            # Continue with the next ID instead of stopping
-            continue
+            for evaluation in info["evaluations"]:
+                narrator_evaluation_writer.writerow([
+                    f"eval_{str(uuid.uuid4())[:8]}",
+                    narrator_id,
+                    ", ".join(evaluation.get("sources", [])),
+                    evaluation.get("text", ""),
+                    info["summary"]  # Including the evaluation summary
+                ])
             
-    return successful_entries
+            # If we have a summary but no detailed evaluations, still add a record
+            if info["summary"] and not info["evaluations"]:
+                narrator_evaluation_writer.writerow([
+                    f"eval_{str(uuid.uuid4())[:8]}",
+                    narrator_id,
+                    "",  # No source
+                    "",  # No evaluation text
+                    info["summary"]  # Only summary
+                ])
+        
+        print(f"Added {len(sanad['chain'])} narrators to the chain for sanad #{sanad['number']}")
+
+# Main function to process hadith data: a fetch stage, an extraction stage and a
+# single writer run side by side, connected by bounded queues. When a queue is
+# full the stage feeding it waits, so throughput is set by the slowest stage.
+def process_hadith_data(hadith_ids, hadith_writer, book_writer, reference_writer, 
+                        sanad_writer, narrator_writer, narrator_chain_writer,
+                        narrator_details_writer, narrator_death_records_writer, 
+                        narrator_evaluation_writer, journal=None, scheduler=None,
+                        fetch_workers=None, extract_workers=None, queue_size=None, frontier=None):
+    
+    fetch_workers = max(1, fetch_workers or FETCH_WORKERS)
+    extract_workers = max(1, extract_workers or EXTRACT_WORKERS)
+    queue_size = max(1, queue_size or PIPELINE_QUEUE_SIZE)
+    
+    # Failed IDs go on a delayed-retry queue and come back between new IDs
+    scheduler = scheduler or RetryScheduler()
+    
+    writers = (hadith_writer, book_writer, reference_writer, sanad_writer, narrator_writer, narrator_chain_writer,
+               narrator_details_writer, narrator_death_records_writer, narrator_evaluation_writer)
+    # Keep track of processed books and narrators to avoid duplicates (writer stage only)
+    writer_state = {"books": {}, "narrators": {}, "narrator_details": set()}
+    counts = {"successful": 0, "in_flight": 0}
+    counts_lock = threading.Lock()
+    
+    fetch_queue = queue.Queue(maxsize=queue_size)
+    extract_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    
+    def finish(hadith_id):
+        with counts_lock:
+            counts["in_flight"] -= 1
+    
+    def fail(hadith_id, error, retry=True):
+        print(f"Processing Hadith ID {hadith_id} failed: {error}")
+        logging.warning(f"Processing Hadith ID {hadith_id} failed: {error}")
+        # The retry is queued before the ID stops counting as in flight, so the feeder can't miss it
+        retrying = retry and scheduler.failed(hadith_id, error) is not None
+        if journal and not retrying:
+            journal.mark_failed(hadith_id, str(error))
+        finish(hadith_id)
+    
+    def fetch_worker():
+        while True:
+            hadith_id = fetch_queue.get()
+            if hadith_id is STAGE_DONE:
+                return
+            try:
+                bundle, error = fetch_hadith_bundle(hadith_id)
+            except Exception as e:
+                bundle, error = None, e
+            if error:
+                fail(hadith_id, error)
+            else:
+                if frontier is not None:
+                    frontier.discover(reference_ids({"data": [bundle["entry"]]}))
+                extract_queue.put(bundle)
+    
+    def extract_worker():
+        while True:
+            bundle = extract_queue.get()
+            if bundle is STAGE_DONE:
+                return
+            try:
+                write_queue.put(extract_hadith_records(bundle))
+            except Exception as e:
+                logging.error(f"Error extracting Hadith ID {bundle['hadith_id']}: {str(e)}")
+                fail(bundle["hadith_id"], e)
+    
+    def writer():
+        while True:
+            records = write_queue.get()
+            if records is STAGE_DONE:
+                return
+            hadith_id = records["hadith_id"]
+            try:
+                print(f"\n{'='*50}")
+                print(f"Writing Hadith ID: {hadith_id}")
+                write_hadith_records(records, writers, writer_state)
+                with counts_lock:
+                    counts["successful"] += 1
+                scheduler.succeeded(hadith_id)
+                if journal:
+                    journal.mark_done(hadith_id)
+                print(f"Successfully processed Hadith ID: {hadith_id}")
+                finish(hadith_id)
+            except Exception as e:
+                logging.error(f"Error processing Hadith ID {hadith_id}: {str(e)}")
+                print(f"⚠️ Error processing Hadith ID {hadith_id}: {str(e)}")
+                # Some rows may already be written, so a retry would duplicate them
+                fail(hadith_id, e, retry=False)
+    
+    def submit(hadith_id):
+        attempt = scheduler.attempt_number(hadith_id)
+        print(f"Queueing Hadith ID: {hadith_id}" + (f" (attempt {attempt})" if attempt > 1 else ""))
+        with counts_lock:
+            counts["in_flight"] += 1
+        if journal:
+            journal.mark_in_flight(hadith_id)
+        # Blocks while the fetch stage is full
+        fetch_queue.put(hadith_id)
+    
+    fetchers = [threading.Thread(target=fetch_worker, daemon=True) for _ in range(fetch_workers)]
+    extractors = [threading.Thread(target=extract_worker, daemon=True) for _ in range(extract_workers)]
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    for thread in fetchers + extractors + [writer_thread]:
+        thread.start()
+    
+    # Feed new IDs (details for each batch are fetched in one request just before the
+    # batch is queued), with due retries mixed in. A frontier hands out each ID only
+    # once, so the set of submitted IDs is only kept without one.
+    submitted = set()
+    for hadith_id in details_client.iter_prefetched(hadith_ids, skip=lambda pending_id: pending_id in submitted):
+        for retry_id in scheduler.pop_due():
+            submit(retry_id)
+        if hadith_id in submitted:
+            print(f"Skipping already processed Hadith ID: {hadith_id}")
+            continue
+        if frontier is None:
+            submitted.add(hadith_id)
+        submit(hadith_id)
+    
+    # Wait for IDs still in the pipeline, and retries they schedule, to finish;
+    # references they turn up are fed in as they are discovered
+    while True:
+        for retry_id in scheduler.pop_due():
+            submit(retry_id)
+        if frontier is not None and frontier.queued:
+            discovered = [hadith_id for hadith_id in frontier.take(queue_size)
+                          if not (journal and journal.status(hadith_id) == DONE)]
+            details_client.prefetch(discovered)
+            for hadith_id in discovered:
+                submit(hadith_id)
+            continue
+        with counts_lock:
+            in_flight = counts["in_flight"]
+        if in_flight == 0 and not scheduler.pending():
+            break
+        wait = scheduler.next_due_in()
+        time.sleep(min(wait, 0.2) if wait is not None else 0.05)
+    
+    # Shut the stages down in order so every queue drains
+    for _ in fetchers:
+        fetch_queue.put(STAGE_DONE)
+    for thread in fetchers:
+        thread.join()
+    for _ in extractors:
+        extract_queue.put(STAGE_DONE)
+    for thread in extractors:
+        thread.join()
+    write_queue.put(STAGE_DONE)
+    writer_thread.join()
+    
+    return counts["successful"]
+
+# Command line options (only needed for sharded crawls and retries)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fetch hadith data and write it to the CSV tables")
+    parser.add_argument("--max-retries", type=int, default=None,
+                        help="Cap on attempts per hadith ID; by default each error class has its own limit")
+    parser.add_argument("--replay-dead-letters", action="store_true",
+                        help="Fetch only the IDs in csv_folder/dead_letters.jsonl instead of the sitemap")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS,
+                        help="Threads fetching details, rejal and references")
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS,
+                        help="Threads turning responses into CSV rows")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE,
+                        help="Hadiths that may wait between two stages before the earlier stage pauses")
+    parser.add_argument("--frontier", action="store_true",
+                        help="Also crawl hadith IDs referenced in groupTogetherList that aren't in the sitemap")
+    parser.add_argument("--frontier-limit", type=int, default=None,
+                        help="Stop queueing discovered IDs once the frontier has seen this many")
+    parser.add_argument("--time-budget", type=float, default=HADITH_TIME_BUDGET,
+                        help="Seconds allowed for all requests of one hadith before it is retried (0: no limit)")
+    parser.add_argument("--hedge-percentile", type=float, default=None,
+                        help="Latency percentile after which a slow request is sent a second time")
+    parser.add_argument("--no-hedge", action="store_true",
+                        help="Never send duplicate requests")
+    add_shard_arguments(parser)
+    return parser.parse_args()
+
+# Run every shard as a local worker process, then merge their tables into csv_folder.
+# The shard folders (tables, journal, frontier) and shard response caches are kept
+# after the merge so the next run can resume each shard; merging again drops repeated rows.
+def run_local_shards(shard_count):
+    exit_codes = launch_shards(os.path.abspath(__file__), shard_count, sys.argv[1:])
+    for shard_index, exit_code in enumerate(exit_codes):
+        if exit_code != 0:
+            print(f"Shard {shard_index} exited with code {exit_code}")
+    
+    # Tables already in csv_folder from earlier runs are merged in first
+    shard_folders = [os.path.join(csv_folder, shard_suffix(index, shard_count)) for index in range(shard_count)]
+    merged_folder = os.path.join(csv_folder, "merging")
+    counts = merge_narrator_tables([csv_folder] + shard_folders, merged_folder)
+    for name, written in counts.items():
+        os.replace(os.path.join(merged_folder, name), os.path.join(csv_folder, name))
+        print(f"Merged {name}: {written} rows")
+    os.rmdir(merged_folder)
+    
+    # Collect every shard's dead letters so one --replay-dead-letters run picks them all up
+    for shard_folder in shard_folders:
+        shard_dead_letters = os.path.join(shard_folder, "dead_letters.jsonl")
+        if os.path.exists(shard_dead_letters):
+            with open(shard_dead_letters, "r", encoding="utf-8") as source, \
+                 open(dead_letter_file, "a", encoding="utf-8") as target:
+                target.write(source.read())
+            os.remove(shard_dead_letters)
+    print(f"Shard folders kept for resuming: {', '.join(shard_folders)}")
+    return 0 if all(exit_code == 0 for exit_code in exit_codes) else 1
 
 # Main execution
 def main():
+    global HADITH_TIME_BUDGET
     print("Starting script execution...")
-    hadith_ids = extract_hadith_ids(sitemap_file)
-
-    # Check if we have any valid IDs
-    if not hadith_ids:
+    args = parse_args()
+    HADITH_TIME_BUDGET = args.time_budget or None
+    configure_deadlines(hedge_percentile=args.hedge_percentile, hedging=not args.no_hedge)
+    
+    if args.spawn_shards > 1:
+        return run_local_shards(args.spawn_shards)
+    
+    # Each shard writes its own set of tables; they are merged afterwards
+    if args.shard_count > 1:
+        set_csv_folder(os.path.join(csv_folder, shard_suffix(args.shard_index, args.shard_count)))
+        print(f"Crawling shard {args.shard_index + 1} of {args.shard_count}, writing to {csv_folder}")
+    
+    # IDs that used up their retries in an earlier run can be replayed on their own
+    dead_letters = DeadLetterFile(dead_letter_file)
+    scheduler = RetryScheduler(dead_letters, max_attempts=args.max_retries)
+    if args.replay_dead_letters:
+        print(f"Replaying dead-lettered hadith IDs from {dead_letter_file}")
+        hadith_ids = iter(dead_letters.replay_ids())
+    else:
+        hadith_ids = extract_hadith_ids(sitemap_file)
+    hadith_ids = filter_shard(hadith_ids, args.shard_index, args.shard_count, args.shard_method)
+
+    # Check if we have any valid IDs (they are streamed, so peek at the first one)
+    first_id = next(hadith_ids, None)
+    if first_id is None:
         logging.error("No valid hadith IDs found in the sitemap file.")
         print("❌ No valid hadith IDs found. Please check the sitemap file.")
         return 1
+    hadith_ids = itertools.chain([first_id], hadith_ids)
 
     # Initialize CSV files with headers if needed
     initialize_csv_files()
+    
+    # Reuse responses from earlier runs and earlier references; shards each get their own
+    # cache file, since every process keeps its own size count for eviction
+    enable_response_cache(shard_path(response_cache_file, args.shard_index, args.shard_count))
 
     # Process limit for testing (remove in production)
     process_limit = 5  # Process only first 50 IDs for testing
-    hadith_ids = hadith_ids[:process_limit]
-    print(f"Will process {len(hadith_ids)} hadith IDs for testing purposes")
+    hadith_ids = itertools.islice(hadith_ids, process_limit)
+    print(f"Will process up to {process_limit} hadith IDs for testing purposes")
+    
+    # Also crawl the hadiths they reference (only those in this shard when sharded)
+    frontier = None
+    if args.frontier:
+        accept = None
+        if args.shard_count > 1:
+            accept = lambda hadith_id: shard_of(hadith_id, args.shard_count, args.shard_method) == args.shard_index
+        frontier = CrawlFrontier(crawl_frontier_file, limit=args.frontier_limit, accept=accept)
+        print(f"Crawl frontier {crawl_frontier_file}: {frontier.count} IDs seen, {frontier.queued} queued")
+        hadith_ids = frontier.iter_ids(hadith_ids)
+    
+    # Skip IDs written to the CSV files by an earlier run
+    journal = CrawlJournal(crawl_journal_file)
+    print(f"Resuming with journal {crawl_journal_file}: {journal.counts()}")
+    hadith_ids = journal.remaining(hadith_ids)
 
     try:
         # Open CSV files in append mode
@@ -712,10 +794,23 @@ def main():
                 hadith_ids, 
                 hadith_writer, book_writer, reference_writer, 
                 sanad_writer, narrator_writer, narrator_chain_writer,
-                narrator_details_writer, narrator_death_records_writer, narrator_evaluation_writer
+                narrator_details_writer, narrator_death_records_writer, narrator_evaluation_writer,
+                journal, scheduler,
+                args.fetch_workers, args.extract_workers, args.queue_size, frontier
             )
-
-            print(f"\n✅ Processed {successful_entries} out of {len(hadith_ids)} hadith entries successfully.")
+            if args.replay_dead_letters:
+                dead_letters.finish_replay()
+
+            print(f"\n✅ Processed {successful_entries} hadith entries successfully.")
+            print(f"HTTP connections: {format_connection_stats()}")
+            print(f"Rate limits:\n{rate_limiter.format_stats()}")
+            print(f"Hedged requests: {format_hedge_stats()}")
+            print(f"Response cache: {format_cache_stats()}")
+            print(f"Retries: {scheduler.format_stats()}")
+            print(f"Dead letters: {dead_letters.count} new in {dead_letter_file}")
+            if frontier is not None:
+                print(f"Crawl frontier: {frontier.format_stats()}")
+                frontier.close()
             
             # Verify files were written
             for file_path in [hadith_file, book_file, reference_file, sanad_file, narrator_file, narrator_chain_file,
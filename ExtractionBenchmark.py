@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import time
+import random
+import argparse
+import unicodedata
+from MockHadithApi import SyntheticCorpus
+
+# Micro-benchmarks for the extraction code paths, on synthetic rejal data.
+#
+#   python ExtractionBenchmark.py profile --narrators 200 --extra-info 20
+#   python ExtractionBenchmark.py json --corpus scraped_hadith_segments --files 2000
+#   python ExtractionBenchmark.py normalize --narrators 2000 --calls 200000
+#   python ExtractionBenchmark.py classify --narrators 2000 --calls 200000 --patterns 500
+#
+# Real rejal responses carry many infoList/infoList2 sections besides the
+# six the CSV tables use; --extra-info pads each narrator with that many.
+
+def large_rejal(narrators, extra_info):
+    """A rejal response with the given number of narrators, each padded with unused info sections"""
+    corpus = SyntheticCorpus()
+    ravi_list = []
+    for ravi_id in range(1, narrators + 1):
+        ravi_list.append(pad_info(corpus.narrator(ravi_id), extra_info))
+    return {"data": {"sanadList": [], "raviList": ravi_list}}
+
+def pad_info(ravi, extra_info):
+    padding = [{"title": f"عنوان {index}", "text": [{"text": "متن", "bookName": []}]} for index in range(extra_info)]
+    ravi["infoList"] = padding + ravi["infoList"]
+    ravi["infoList2"] = padding + ravi["infoList2"]
+    return ravi
+
+def synthetic_records(count, extra_info):
+    """Saved records shaped like ResponseFetchingScript's, as JSON bytes"""
+    corpus = SyntheticCorpus(sanad_count=4, sanad_length=8)
+    records = []
+    for hadith_id in range(1000, 1000 + count):
+        rejal = corpus.rejal(str(hadith_id))
+        rejal["data"]["raviList"] = [pad_info(ravi, extra_info) for ravi in rejal["data"]["raviList"]]
+        record = {"hadith_id": str(hadith_id), "hadith_details": {"data": [corpus.details_entry(str(hadith_id))]},
+                  "hadith_rejal_list": rejal}
+        records.append(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+    return records
+
+def corpus_records(path, count):
+    """Up to count records from a segment folder or a folder of hadith_{id}.json files, as JSON bytes"""
+    from SegmentStore import SegmentReader, list_segments
+    if list_segments(path):
+        reader = SegmentReader(path)
+        try:
+            return [reader.get_bytes(hadith_id) for hadith_id in reader.ids()[:count]]
+        finally:
+            reader.close()
+    records = []
+    for name in sorted(os.listdir(path)):
+        if re.match(r'hadith_\d+\.json$', name):
+            with open(os.path.join(path, name), "rb") as f:
+                records.append(f.read())
+            if len(records) >= count:
+                break
+    return records
+
+def time_per_round(run, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        run()
+    return (time.perf_counter() - started) / rounds
+
+def benchmark_profile(args):
+    from RejalIndex import rejal_index
+    from NarratorProfile import (extract_narrator_profile, walk_info, INFO_HANDLERS, INFO2_HANDLERS,
+                                 STRIPPED_INFO2_HANDLERS, book_name_source)
+    rejal = rejal_index(large_rejal(args.narrators, args.extra_info))
+    ravi_ids = list(range(1, args.narrators + 1))
+
+    def per_field_walks():
+        # The previous extractors: one walk over infoList or infoList2 per field
+        for ravi_id in ravi_ids:
+            profile = {"titles": [], "patronymic": [], "sect": None, "reliability": "", "death_records": [],
+                       "summary": None, "evaluations": []}
+            for ravi in rejal.entries(ravi_id):
+                for title, handler in INFO_HANDLERS.items():
+                    walk_info(profile, ravi.get("infoList", []), {title: handler}, None, book_name_source)
+                for title, handler in INFO2_HANDLERS.items():
+                    stripped = {title: handler} if title in STRIPPED_INFO2_HANDLERS else None
+                    walk_info(profile, ravi.get("infoList2", []), {title: handler}, stripped, book_name_source)
+
+    def single_pass():
+        for ravi_id in ravi_ids:
+            extract_narrator_profile(rejal, ravi_id)
+
+    before = time_per_round(per_field_walks, args.rounds)
+    after = time_per_round(single_pass, args.rounds)
+    print(f"{args.narrators} narrators, {args.extra_info} extra info sections each, {args.rounds} rounds")
+    print(f"Per-field walks: {before * 1000:.2f}ms per response")
+    print(f"Single pass:     {after * 1000:.2f}ms per response ({before / after:.1f}x)")
+
+def benchmark_json(args):
+    import JsonBackend
+    if args.corpus:
+        records = corpus_records(args.corpus, args.files)
+        source = args.corpus
+    else:
+        records = synthetic_records(args.files, args.extra_info)
+        source = f"synthetic, {args.extra_info} extra info sections per narrator"
+    if not records:
+        print(f"No records found in {args.corpus}")
+        return
+    total_mb = sum(len(record) for record in records) / (1024 * 1024)
+    print(f"{len(records)} records, {total_mb:.1f} MB ({source}), best of {args.rounds} rounds")
+
+    variants = [(name, name, False) for name in JsonBackend.available_backends()]
+    if JsonBackend.typed_decoding_available():
+        variants.append(("msgspec, typed rejal", "msgspec", True))
+    for label, backend, typed in variants:
+        JsonBackend.set_backend(backend)
+        best = None
+        for _ in range(args.rounds):
+            times = []
+            for record in records:
+                started = time.perf_counter()
+                JsonBackend.loads_record(record, typed=typed)
+                times.append(time.perf_counter() - started)
+            if best is None or sum(times) < sum(best):
+                best = times
+        elapsed = sum(best)
+        best.sort()
+        print(f"{label:22} {total_mb / elapsed:8.1f} MB/s   per file: mean {elapsed / len(best) * 1000:.3f}ms, "
+              f"p50 {best[len(best) // 2] * 1000:.3f}ms, p99 {best[min(len(best) - 1, len(best) * 99 // 100)] * 1000:.3f}ms")
+    JsonBackend.set_backend(JsonBackend.JSON_BACKEND)
+
+NAME_WORDS = ["مُحَمَّد", "أَحْمَد", "عَلِيّ", "الحُسَيْن", "إِبْرَاهِيم", "عِيسَى", "مُوسَى", "جَعْفَر", "يُونُس", "زُرَارَة",
+              "حَمْزَة", "الأَشْعَرِيّ", "القُمِّيّ", "الكُوفِيّ", "البَصْرِيّ", "سُفْيَان", "هِشَام", "أَبَان", "عُثْمَان", "مَسْعُود"]
+
+def narrator_pairs(count, seed=0):
+    """Distinct (title, hint) pairs shaped like sanad titles and rejal hints, some with honorifics"""
+    rng = random.Random(seed)
+    pairs = []
+    for index in range(count):
+        words = rng.sample(NAME_WORDS, rng.randint(2, 4))
+        title = " ابن ".join(words[:2]) + " " + " ".join(words[2:])
+        if index % 10 == 0:
+            title += " عليه السلام"
+        hint_words = words if index % 4 else words + [rng.choice(NAME_WORDS)]
+        if index % 7 == 0:
+            hint_words = hint_words[1:]
+        hint = "  بن ".join(hint_words).replace("ة", "ه") + f", امامي, ثقة {index}"
+        pairs.append((title, hint))
+    return pairs
+
+def benchmark_normalize(args):
+    import re
+    import ArabicText
+
+    def legacy_normalize_arabic(text):
+        # The previous normalize_arabic: uncompiled re.sub calls on every call
+        text = unicodedata.normalize("NFKC", text)
+        text = re.sub(r'[إأآا]', 'ا', text)
+        text = re.sub(r'[ى]', 'ي', text)
+        text = re.sub(r'[ة]', 'ه', text)
+        text = re.sub(r'[ئؤ]', 'ء', text)
+        text = re.sub(r'[\u064B-\u065F]', '', text)
+        text = ' '.join(text.split())
+        text = text.replace("ابن", "بن")
+        return text
+
+    def legacy_is_normal_narrator(title, hint):
+        for pattern in ["عليه السلام", "ع"]:
+            title = title.replace(pattern, "").strip()
+        title = legacy_normalize_arabic(title)
+        hint = legacy_normalize_arabic(hint)
+        return all(word in hint for word in title.split())
+
+    def uncached_is_normal_narrator(title, hint):
+        hint = ArabicText.normalize_arabic.__wrapped__(hint)
+        words = ArabicText.normalize_arabic.__wrapped__(ArabicText.strip_honorifics(title)).split()
+        return all(word in hint for word in words)
+
+    # Occurrences follow the corpus: a few names account for most of the chains
+    pairs = narrator_pairs(args.narrators)
+    rng = random.Random(1)
+    calls = rng.choices(pairs, weights=[1 / rank for rank in range(1, len(pairs) + 1)], k=args.calls)
+    expected = [legacy_is_normal_narrator(title, hint) for title, hint in calls]
+    print(f"{args.calls} calls over {len(pairs)} distinct title/hint pairs, "
+          f"{sum(expected) / len(expected):.0%} normal narrators")
+
+    variants = [("re.sub (previous)", legacy_is_normal_narrator), ("str.translate", uncached_is_normal_narrator),
+                ("str.translate + LRU", ArabicText.is_normal_narrator)]
+    baseline = None
+    for label, check in variants:
+        ArabicText.clear_caches()
+        started = time.perf_counter()
+        results = [check(title, hint) for title, hint in calls]
+        elapsed = (time.perf_counter() - started) / len(calls)
+        baseline = baseline or elapsed
+        mismatches = sum(result != want for result, want in zip(results, expected))
+        print(f"{label:20} {elapsed * 1e6:7.2f}us per call ({baseline / elapsed:.1f}x), {mismatches} mismatches")
+    print(f"Caches: {ArabicText.format_cache_stats()}")
+
+def benchmark_classify(args):
+    from NarratorClassifier import NarratorClassifier, load_patterns, SPECIAL_NAME
+
+    # The pattern file plus made-up phrases, to see how each approach scales with the list
+    rng = random.Random(2)
+    patterns = load_patterns() + [(SPECIAL_NAME, " ".join(rng.sample(NAME_WORDS, 2)) + f" {index}")
+                                  for index in range(args.patterns)]
+    titles = [title for title, _ in narrator_pairs(args.narrators)] + ["أبيه", "عدة من أصحابنا", "بعض أصحابه"]
+    calls = random.Random(1).choices(titles, weights=[1 / rank for rank in range(1, len(titles) + 1)], k=args.calls)
+    print(f"{args.calls} titles ({len(titles)} distinct), {len(patterns)} patterns")
+
+    def substring_scans(title):
+        # The previous check: one substring scan per phrase
+        return frozenset(category for category, phrase in patterns if phrase in title)
+
+    classifier = NarratorClassifier(patterns)
+    variants = [("substring scans", substring_scans), ("automaton", classifier.match),
+                ("automaton + cache", classifier.categories)]
+    expected = [substring_scans(title) for title in calls]
+    baseline = None
+    for label, classify in variants:
+        started = time.perf_counter()
+        results = [classify(title) for title in calls]
+        elapsed = (time.perf_counter() - started) / len(calls)
+        baseline = baseline or elapsed
+        mismatches = sum(result != want for result, want in zip(results, expected))
+        print(f"{label:18} {elapsed * 1e6:7.2f}us per title ({baseline / elapsed:.1f}x), {mismatches} mismatches")
+
+BENCHMARKS = {
+    "profile": benchmark_profile,
+    "json": benchmark_json,
+    "normalize": benchmark_normalize,
+    "classify": benchmark_classify,
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the hadith extraction code")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--narrators", type=int, default=200,
+                        help="Narrators in the synthetic rejal response (normalize: distinct title/hint pairs)")
+    parser.add_argument("--extra-info", type=int, default=20, help="Unused info sections per narrator")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--corpus", default=None,
+                        help="json: segment folder or folder of hadith_{id}.json files (default: synthetic records)")
+    parser.add_argument("--files", type=int, default=1000, help="json: number of records to decode")
+    parser.add_argument("--calls", type=int, default=200000,
+                        help="normalize, classify: is_normal_narrator calls or titles to time")
+    parser.add_argument("--patterns", type=int, default=0, help="classify: phrases added to the pattern file's")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+if __name__ == "__main__":
+    main()
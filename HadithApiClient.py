@@ -0,0 +1,548 @@
+import os
+import time
+import atexit
+import logging
+import itertools
+import threading
+import contextlib
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from RateLimiter import RateLimiter
+from ResponseCache import ResponseCache, DEFAULT_CACHE_PATH, DEFAULT_TTL_SECONDS, DEFAULT_MAX_BYTES
+from JsonBackend import response_json
+
+# API Endpoints; set HADITH_API_BASE to crawl a local stand-in such as MockHadithApi.py
+API_BASE = os.environ.get("HADITH_API_BASE", "https://hadith.inoor.ir").rstrip("/")
+HADITH_DETAILS_ENDPOINT = f"{API_BASE}/service/api/elastic/ElasticHadithById"
+HADITH_REJAL_ENDPOINT = f"{API_BASE}/service/api/hadith/HadithRejalList/v2"
+# JSON request behind the hadithlist page; check the browser's network tab if the site changes it
+HADITH_LIST_ENDPOINT = os.environ.get("HADITH_LIST_ENDPOINT", f"{API_BASE}/service/api/elastic/ElasticHadithList")
+
+# Number of hadith IDs sent in one ElasticHadithById request
+DEFAULT_BATCH_SIZE = 20
+
+# Connection pool sizing for the shared session. POOL_MAXSIZE should be at
+# least the number of threads making requests at once, or extra connections
+# are opened and thrown away instead of being kept alive.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+
+# Counters for requests sent and TCP/TLS connections opened by the shared session
+connection_stats = {"requests": 0, "new_connections": 0}
+stats_lock = threading.Lock()
+
+session = None
+session_lock = threading.Lock()
+
+def count_stat(name):
+    with stats_lock:
+        connection_stats[name] += 1
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        count_stat("new_connections")
+        return super()._new_conn()
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        count_stat("new_connections")
+        return super()._new_conn()
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools record every new connection, so reuse can be reported"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, *args, **kwargs):
+        count_stat("requests")
+        return super().send(request, *args, **kwargs)
+
+def mount_adapters(target_session, pool_maxsize):
+    # Hedged requests (see send_hedged) need a few connections on top of the workers'
+    pool_maxsize += max(1, int(pool_maxsize * HEDGE_MAX_FRACTION * 2))
+    adapter = CountingHTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize)
+    previous = {id(old): old for old in (target_session.adapters.get("https://"), target_session.adapters.get("http://"))
+                if old is not None}
+    target_session.mount("https://", adapter)
+    target_session.mount("http://", adapter)
+    # Drop the old pools' keep-alive connections now rather than whenever they are garbage collected
+    for old in previous.values():
+        old.close()
+
+def get_session():
+    """Return the keep-alive session shared by every fetch function"""
+    global session
+    if session is None:
+        with session_lock:
+            if session is None:
+                new_session = requests.Session()
+                # urllib3 decodes gzip/deflate bodies transparently
+                new_session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+                mount_adapters(new_session, POOL_MAXSIZE)
+                session = new_session
+    return session
+
+def set_pool_maxsize(pool_maxsize):
+    """Resize the shared connection pool, e.g. to match the number of concurrent workers.
+
+    The hedge and run_concurrently thread pools are sized from POOL_MAXSIZE
+    too; they are shut down here and recreated at the new size on next use.
+    """
+    global POOL_MAXSIZE, hedge_executor, side_executor
+    POOL_MAXSIZE = max(1, pool_maxsize)
+    with session_lock:
+        if session is not None:
+            mount_adapters(session, POOL_MAXSIZE)
+    with side_executor_lock:
+        # Calls already running keep the executor they started with
+        for executor in (hedge_executor, side_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        hedge_executor = side_executor = None
+
+def get_connection_stats():
+    """Return request and connection counts for the shared session"""
+    with stats_lock:
+        stats = dict(connection_stats)
+    stats["reused_connections"] = max(0, stats["requests"] - stats["new_connections"])
+    stats["reuse_ratio"] = stats["reused_connections"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+def format_connection_stats():
+    stats = get_connection_stats()
+    return (f"{stats['requests']} requests over {stats['new_connections']} connections "
+            f"({stats['reused_connections']} reused, {stats['reuse_ratio']:.0%} reuse)")
+
+# Paces requests per endpoint ("details" and "rejal") instead of fixed sleeps
+rate_limiter = RateLimiter()
+
+# Threads that run the extra calls of run_concurrently; created on first use
+side_executor = None
+side_executor_lock = threading.Lock()
+
+# Recent request latencies in seconds per endpoint, for percentiles
+LATENCY_SAMPLES = 10000
+request_latencies = {}
+latency_counts = {}
+latency_lock = threading.Lock()
+
+# Percentiles are re-sorted from the samples only after this many new ones,
+# since the deadline and hedge delay of every request are read from them
+PERCENTILE_REFRESH_SAMPLES = 50
+percentile_cache = {}
+
+def record_latency(endpoint_name, latency):
+    with latency_lock:
+        samples = request_latencies.get(endpoint_name)
+        if samples is None:
+            samples = request_latencies[endpoint_name] = deque(maxlen=LATENCY_SAMPLES)
+        samples.append(latency)
+        latency_counts[endpoint_name] = latency_counts.get(endpoint_name, 0) + 1
+
+def latency_percentile(endpoint_name, percentile, max_age=0):
+    """Return the given percentile of recent latencies for an endpoint, or None without samples.
+
+    With max_age, a value computed at most that many samples ago is reused.
+    """
+    key = (endpoint_name, percentile)
+    with latency_lock:
+        count = latency_counts.get(endpoint_name, 0)
+        cached = percentile_cache.get(key)
+        if cached is not None and count - cached[0] <= max_age:
+            return cached[1]
+        samples = sorted(request_latencies.get(endpoint_name, ()))
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+    with latency_lock:
+        percentile_cache[key] = (count, samples[index])
+    return samples[index]
+
+def latency_sample_count(endpoint_name):
+    with latency_lock:
+        return len(request_latencies.get(endpoint_name, ()))
+
+def reset_latencies():
+    with latency_lock:
+        request_latencies.clear()
+        latency_counts.clear()
+        percentile_cache.clear()
+
+# Per-request deadlines and hedging. Until an endpoint has MIN_LATENCY_SAMPLES
+# latencies the flat DEFAULT_TIMEOUT is used and nothing is hedged; after that
+# a request times out at TIMEOUT_MULTIPLIER times the TIMEOUT_PERCENTILE
+# latency (kept between MIN_TIMEOUT and MAX_TIMEOUT), and one still running
+# after the HEDGE_PERCENTILE latency gets a duplicate; the first good answer
+# wins. At most HEDGE_MAX_FRACTION of requests are hedged, so a server that
+# is slow across the board doesn't get twice the load.
+DEFAULT_TIMEOUT = 30
+MIN_LATENCY_SAMPLES = 20
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_MULTIPLIER = 3.0
+MIN_TIMEOUT = 2.0
+MAX_TIMEOUT = 30.0
+HEDGE_PERCENTILE = 95
+HEDGE_MAX_FRACTION = 0.1
+HEDGING_ENABLED = True
+
+# Overall seconds allowed for all requests of one hadith (see hadith_time_budget)
+DEFAULT_HADITH_TIME_BUDGET = 60
+
+hedge_stats = {"requests": 0, "hedged": 0, "hedge_won": 0}
+hedge_lock = threading.Lock()
+
+def configure_deadlines(hedge_percentile=None, timeout_percentile=None, timeout_multiplier=None,
+                        min_timeout=None, max_timeout=None, hedge_max_fraction=None, hedging=None):
+    """Change the deadline and hedging settings; arguments left as None keep their value"""
+    global HEDGE_PERCENTILE, TIMEOUT_PERCENTILE, TIMEOUT_MULTIPLIER, MIN_TIMEOUT, MAX_TIMEOUT
+    global HEDGE_MAX_FRACTION, HEDGING_ENABLED
+    if hedge_percentile is not None:
+        HEDGE_PERCENTILE = hedge_percentile
+    if timeout_percentile is not None:
+        TIMEOUT_PERCENTILE = timeout_percentile
+    if timeout_multiplier is not None:
+        TIMEOUT_MULTIPLIER = timeout_multiplier
+    if min_timeout is not None:
+        MIN_TIMEOUT = min_timeout
+    if max_timeout is not None:
+        MAX_TIMEOUT = max_timeout
+    if hedge_max_fraction is not None:
+        HEDGE_MAX_FRACTION = hedge_max_fraction
+    if hedging is not None:
+        HEDGING_ENABLED = hedging
+
+def request_deadline(endpoint_name):
+    """Timeout in seconds for the next request to an endpoint, from its observed latencies"""
+    if latency_sample_count(endpoint_name) < MIN_LATENCY_SAMPLES:
+        return DEFAULT_TIMEOUT
+    latency = latency_percentile(endpoint_name, TIMEOUT_PERCENTILE, PERCENTILE_REFRESH_SAMPLES)
+    return min(MAX_TIMEOUT, max(MIN_TIMEOUT, latency * TIMEOUT_MULTIPLIER))
+
+def hedge_delay(endpoint_name):
+    """Seconds to wait before sending a duplicate request, or None to not hedge"""
+    if not HEDGING_ENABLED or latency_sample_count(endpoint_name) < MIN_LATENCY_SAMPLES:
+        return None
+    return latency_percentile(endpoint_name, HEDGE_PERCENTILE, PERCENTILE_REFRESH_SAMPLES)
+
+def hedge_allowed():
+    with hedge_lock:
+        if hedge_stats["hedged"] + 1 > HEDGE_MAX_FRACTION * hedge_stats["requests"]:
+            return False
+        hedge_stats["hedged"] += 1
+        return True
+
+def count_hedge_stat(name):
+    with hedge_lock:
+        hedge_stats[name] += 1
+
+def format_hedge_stats():
+    with hedge_lock:
+        stats = dict(hedge_stats)
+    return (f"{stats['hedged']} of {stats['requests']} requests hedged, "
+            f"{stats['hedge_won']} answered first by the hedge")
+
+def reset_hedge_stats():
+    with hedge_lock:
+        for name in hedge_stats:
+            hedge_stats[name] = 0
+
+class TimeBudget:
+    """Wall-clock allowance shared by all the requests made for one hadith"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def check(self):
+        """Return the seconds left, raising a Timeout once there are none"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout(
+                f"Request timed out: the {self.seconds:.0f}s time budget for this hadith is used up")
+        return remaining
+
+# The budget of the hadith the current thread is fetching, if any
+budget_state = threading.local()
+
+def current_budget():
+    return getattr(budget_state, "budget", None)
+
+@contextlib.contextmanager
+def hadith_time_budget(budget):
+    """Cap every request made by this thread (and by its run_concurrently calls) to one budget.
+
+    budget is a TimeBudget or a number of seconds; None means no cap.
+    """
+    if budget is not None and not isinstance(budget, TimeBudget):
+        budget = TimeBudget(budget)
+    previous = current_budget()
+    budget_state.budget = budget
+    try:
+        yield budget
+    finally:
+        budget_state.budget = previous
+
+def call_with_budget(budget, function, *args):
+    """Call function under a budget created on another thread"""
+    with hadith_time_budget(budget):
+        return function(*args)
+
+def send_once(endpoint_name, method, url, **kwargs):
+    bucket = rate_limiter.bucket(endpoint_name)
+    bucket.acquire()
+    started = time.monotonic()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        bucket.record(error=True)
+        raise
+    latency = time.monotonic() - started
+    bucket.record(response.status_code, latency)
+    record_latency(endpoint_name, latency)
+    return response
+
+# Threads that run hedged requests; separate from side_executor so a
+# run_concurrently call waiting on a hedge can't use up the threads it needs
+hedge_executor = None
+
+def send_hedged(endpoint_name, method, url, delay, timeout, **kwargs):
+    """Send a request and, if it hasn't answered after delay seconds, a duplicate; return the first good answer"""
+    global hedge_executor
+    with side_executor_lock:
+        if hedge_executor is None:
+            hedge_executor = ThreadPoolExecutor(max_workers=POOL_MAXSIZE * 2, thread_name_prefix="hadith-hedge")
+        executor = hedge_executor
+    give_up_at = time.monotonic() + timeout
+    pending = {executor.submit(send_once, endpoint_name, method, url, timeout=timeout, **kwargs)}
+    done, _ = wait(pending, timeout=delay)
+    if not done and hedge_allowed():
+        hedge = executor.submit(send_once, endpoint_name, method, url, timeout=timeout, **kwargs)
+        pending.add(hedge)
+    else:
+        hedge = None
+
+    # The losing request is left to finish in the background; requests can't cancel it
+    last = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0, give_up_at - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            raise requests.exceptions.Timeout(f"Request to {endpoint_name} timed out after {timeout:.1f}s")
+        for future in done:
+            last = future
+            if future.exception() is None and future.result().status_code < 500:
+                if future is hedge:
+                    count_hedge_stat("hedge_won")
+                return future.result()
+    # Both failed: report the last failure the way a single request would
+    return last.result()
+
+def send_request(endpoint_name, method, url, timeout=None, hedge=True, **kwargs):
+    """Send one request through the shared session, paced by the endpoint's token bucket.
+
+    timeout=None picks a deadline from the endpoint's latency percentiles, and
+    a slow request is hedged unless hedge is False. Inside hadith_time_budget
+    the timeout is also cut to what is left of the hadith's budget.
+    """
+    if timeout is None:
+        timeout = request_deadline(endpoint_name)
+    budget = current_budget()
+    if budget is not None:
+        timeout = min(timeout, budget.check())
+    count_hedge_stat("requests")
+    delay = hedge_delay(endpoint_name) if hedge else None
+    if delay is None or delay >= timeout:
+        return send_once(endpoint_name, method, url, timeout=timeout, **kwargs)
+    return send_hedged(endpoint_name, method, url, delay, timeout, **kwargs)
+
+def run_concurrently(*functions):
+    """Call zero-argument functions at the same time and return their results in order.
+
+    The first runs on the calling thread and the rest on a shared pool, so
+    e.g. the details and rejal requests for one hadith take as long as the
+    slower of the two instead of both together. Exceptions are re-raised.
+    The calling thread's hadith_time_budget applies to all of them.
+    """
+    global side_executor
+    with side_executor_lock:
+        if side_executor is None:
+            side_executor = ThreadPoolExecutor(max_workers=POOL_MAXSIZE, thread_name_prefix="hadith-side")
+        executor = side_executor
+    budget = current_budget()
+    futures = [executor.submit(call_with_budget, budget, function) for function in functions[1:]]
+    first = functions[0]()
+    return [first] + [future.result() for future in futures]
+
+# On-disk cache of details and rejal responses, off until enable_response_cache is called
+response_cache = None
+
+def enable_response_cache(path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES):
+    """Open the persistent response cache that every fetch path consults before the network"""
+    global response_cache
+    if response_cache is not None:
+        response_cache.close()
+    response_cache = ResponseCache(path, ttl, max_bytes)
+    # Writes the access times of the last hits, which are batched in memory
+    atexit.register(response_cache.close)
+    return response_cache
+
+def cache_lookup(endpoint_name, hadith_id):
+    if response_cache is None or hadith_id is None:
+        return None
+    return response_cache.get(endpoint_name, hadith_id)
+
+def cache_store(endpoint_name, hadith_id, data):
+    if response_cache is not None and hadith_id is not None:
+        response_cache.put(endpoint_name, hadith_id, data)
+
+def format_cache_stats():
+    return response_cache.format_stats() if response_cache is not None else "disabled"
+
+def iter_batches(hadith_ids, batch_size):
+    """Yield lists of up to batch_size IDs from any iterable without materializing it"""
+    iterator = iter(hadith_ids)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def default_headers():
+    """Headers used for the details endpoint when the caller doesn't supply its own"""
+    return {"accept": "application/json", "content-type": "application/json"}
+
+def post_hadith_details(hadith_ids, headers=None, timeout=None, endpoint=HADITH_DETAILS_ENDPOINT):
+    """POST one or more hadith IDs to ElasticHadithById and return the raw response (timeout=None: adaptive)"""
+    payload = {"hadithId": list(hadith_ids), "searchPhrase": ""}
+    return send_request("details", "POST", endpoint, json=payload, headers=headers or default_headers(), timeout=timeout)
+
+def split_details_response(response_data, hadith_ids):
+    """Split a multi-ID ElasticHadithById response into one single-hadith response per ID"""
+    entries = {}
+    for entry in response_data.get("data") or []:
+        if isinstance(entry, dict):
+            entries.setdefault(str(entry.get("id")), entry)
+
+    results = {}
+    for hadith_id in hadith_ids:
+        entry = entries.get(str(hadith_id))
+        if entry is not None:
+            results[hadith_id] = dict(response_data, data=[entry])
+    return results
+
+class BatchedDetailsClient:
+    """Fetches ElasticHadithById responses for many hadith IDs per request.
+
+    prefetch() groups pending IDs into POSTs of up to batch_size IDs and keeps
+    the per-ID responses until get() hands them out. A batch that fails, or
+    that comes back without some of its IDs, is split and retried down to
+    single-ID requests, so one bad ID can't sink the rest of its batch.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, headers_factory=default_headers, timeout=None,
+                 endpoint=HADITH_DETAILS_ENDPOINT):
+        self.batch_size = max(1, batch_size)
+        self.headers_factory = headers_factory
+        self.timeout = timeout
+        self.endpoint = endpoint
+        self.results = {}
+        self.request_count = 0
+        # Fetch workers call _fetch_batch from several threads
+        self.lock = threading.Lock()
+
+    def prefetch(self, hadith_ids):
+        """Fetch details for all given IDs that aren't already waiting to be collected"""
+        pending = []
+        for hadith_id in dict.fromkeys(hadith_ids):
+            if hadith_id is None or hadith_id in self.results:
+                continue
+            cached = cache_lookup("details", hadith_id)
+            if cached is not None:
+                self.results[hadith_id] = (cached, None)
+            else:
+                pending.append(hadith_id)
+        for start in range(0, len(pending), self.batch_size):
+            self._fetch_batch(pending[start:start + self.batch_size])
+
+    def iter_prefetched(self, hadith_ids, skip=None):
+        """Yield IDs from any iterable, prefetching each batch's details just before it is reached"""
+        for batch in iter_batches(hadith_ids, self.batch_size):
+            # Without batching, get() fetches each ID alongside its other requests instead
+            if self.batch_size > 1:
+                self.prefetch([hadith_id for hadith_id in batch if not (skip and skip(hadith_id))])
+            yield from batch
+
+    def get(self, hadith_id):
+        """Return (data, error) for one hadith ID, fetching it on its own if it wasn't prefetched.
+
+        Exceptions from a single-ID request are re-raised here so callers keep
+        their existing timeout and connection error handling. Safe to call from
+        several threads, even for the same ID.
+        """
+        result = self.results.pop(hadith_id, None)
+        if result is None:
+            cached = cache_lookup("details", hadith_id)
+            if cached is not None:
+                return cached, None
+            # Fetched into a private dict so another thread can't collect it first
+            fetched = {}
+            self._fetch_batch([hadith_id], fetched)
+            result = fetched[hadith_id]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _fetch_batch(self, hadith_ids, results=None):
+        results = self.results if results is None else results
+        with self.lock:
+            self.request_count += 1
+        try:
+            response = post_hadith_details(hadith_ids, self.headers_factory(), self.timeout, self.endpoint)
+            if response.status_code != 200:
+                error = f"Failed to fetch hadith details: HTTP {response.status_code}"
+                if len(hadith_ids) == 1:
+                    results[hadith_ids[0]] = (None, error)
+                    return
+                raise requests.exceptions.HTTPError(error)
+            data = response_json(response)
+        except Exception as e:
+            if len(hadith_ids) == 1:
+                results[hadith_ids[0]] = e
+                return
+            logging.warning(f"Details batch of {len(hadith_ids)} IDs failed, splitting it: {str(e)}")
+            middle = len(hadith_ids) // 2
+            self._fetch_batch(hadith_ids[:middle], results)
+            self._fetch_batch(hadith_ids[middle:], results)
+            return
+
+        # A single-ID response is kept as is, even when its data list is empty
+        if len(hadith_ids) == 1:
+            results[hadith_ids[0]] = (data, None)
+            if isinstance(data, dict) and data.get("data"):
+                cache_store("details", hadith_ids[0], data)
+            return
+
+        found = split_details_response(data, hadith_ids) if isinstance(data, dict) else {}
+        for hadith_id, hadith_data in found.items():
+            results[hadith_id] = (hadith_data, None)
+            cache_store("details", hadith_id, hadith_data)
+
+        missing = [hadith_id for hadith_id in hadith_ids if hadith_id not in found]
+        if not missing:
+            return
+        if len(missing) < len(hadith_ids):
+            self._fetch_batch(missing, results)
+        else:
+            middle = len(hadith_ids) // 2
+            self._fetch_batch(hadith_ids[:middle], results)
+            self._fetch_batch(hadith_ids[middle:], results)
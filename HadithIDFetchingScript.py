@@ -1,19 +1,67 @@
+import os
 import time
 import random
 import json
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from HadithApiClient import HADITH_LIST_ENDPOINT, send_request, rate_limiter, format_connection_stats, set_pool_maxsize
+from RetryScheduler import DEFAULT_POLICIES, OTHER, classify_error
+from JsonBackend import response_json
+
+# Selenium is only needed for --mode browser
+try:
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.chrome.options import Options
+    from webdriver_manager.chrome import ChromeDriverManager
+except ImportError:
+    webdriver = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Paged ID discovery through the list view's JSON request
+DEFAULT_PAGE_SIZE = 60
+DEFAULT_WORKERS = 8
+# Pages a worker claims at a time
+DEFAULT_RANGE_SIZE = 20
+
+# Discovered IDs are appended to a JSONL file, one {"page", "hadith_id"} per line;
+# the checkpoint next to it records which pages are complete
+OUTPUT_FILE = "hadith_ids.jsonl"
+CHECKPOINT_EVERY_PAGES = 20
+
+# Search settings of the hadithlist page, sent along with every page request
+LIST_QUERY = {
+    "sortColumn": "default",
+    "sortDirection": "asc",
+    "searchType": "and",
+    "inFeild": "all",
+    "isGroup": 0,
+    "isFullText": 0,
+    "isErab": 1,
+    "pageSizeGrouping": 10,
+    "flexibleForStem": 1,
+    "flexibleForLetter": 1,
+    "flexibleForRoot": 0,
+    "searchIn": "hadith",
+    "searchPhrase": "",
+}
 
 # Anti-ban measures
 def random_delay():
     time.sleep(random.uniform(2, 6))  # Random delay between 2-6 seconds
 
 def setup_driver():
+    if webdriver is None:
+        raise RuntimeError("Browser mode needs selenium and webdriver-manager (pip install selenium webdriver-manager)")
     options = Options()
     options.add_argument("--headless")  # Run in headless mode
     options.add_argument("--disable-blink-features=AutomationControlled")
@@ -25,14 +73,13 @@ def setup_driver():
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")  # Hide Selenium
     return driver
 
-def scrape_hadith():
-    url = "https://hadith.inoor.ir/fa/hadithlist?pagenumber=817&pagesize=60&sortcolumn=default&sortdirection=asc&searchtype=and&infeild=all&isgroup=0&isfulltext=0&iserab=1&pagesizegrouping=10&flexibleforstem=1&flexibleforletter=1&flexibleforroot=0&searchin=hadith"
+def scrape_hadith(output, start_page=817, page_size=DEFAULT_PAGE_SIZE):
+    url = f"https://hadith.inoor.ir/fa/hadithlist?pagenumber={start_page}&pagesize={page_size}&sortcolumn=default&sortdirection=asc&searchtype=and&infeild=all&isgroup=0&isfulltext=0&iserab=1&pagesizegrouping=10&flexibleforstem=1&flexibleforletter=1&flexibleforroot=0&searchin=hadith"
     driver = setup_driver()
     driver.get(url)
     random_delay()
     
-    data = []
-    page = 817
+    page = start_page
     
     while True:
         print(f"Scraping Page: {page}")
@@ -40,12 +87,10 @@ def scrape_hadith():
         hadith_ids = [el.text.strip() for el in hadith_elements if el.text.strip().isdigit()]
         
         for hadith_id in hadith_ids:
-            data.append({"page": page, "hadith_id": hadith_id})
             print(f"Page {page}, Hadith ID: {hadith_id}")
             
-        # Save to file
-        with open("hadith_data.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        # Append this page's new IDs; the checkpoint lets a restart continue from here
+        output.add_page(page, hadith_ids)
         
         # Try to click next button
         try:
@@ -59,5 +104,318 @@ def scrape_hadith():
     
     driver.quit()
 
+class IdOutput:
+    """Append-only JSONL file of discovered hadith IDs plus a checkpoint of completed pages.
+
+    Each page's IDs are appended once, skipping IDs already in the file, so
+    the cost per page doesn't grow with the crawl. Pages can complete out of
+    order; the checkpoint keeps the highest page up to which every page is
+    done plus the completed pages above it, and a restart continues from
+    there. Lines written after the last checkpoint are kept, and their IDs
+    are skipped when those pages are fetched again.
+    """
+
+    def __init__(self, path=OUTPUT_FILE, page_size=DEFAULT_PAGE_SIZE, start_page=1, resume=True,
+                 checkpoint_every=CHECKPOINT_EVERY_PAGES):
+        self.path = path
+        self.checkpoint_path = f"{path}.checkpoint.json"
+        self.page_size = page_size
+        self.checkpoint_every = checkpoint_every
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.ids_written = 0
+        self.duplicates = 0
+        self.pages_since_checkpoint = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing_ids()
+        self.file = open(path, "a", encoding="utf-8", newline="\n")
+
+        checkpoint = self._load_checkpoint() if resume else None
+        self.completed_through = start_page - 1
+        self.completed_pages = set()
+        if checkpoint is not None:
+            self.completed_through = max(self.completed_through, checkpoint["completed_through"])
+            self.completed_pages = {page for page in checkpoint["completed_pages"] if page > self.completed_through}
+
+    def _load_existing_ids(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            content = f.read()
+            # A line cut short by a crash is dropped; its page is fetched again
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self.seen.add(self.key(json.loads(line)["hadith_id"]))
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        # Page numbers mean something else with another page size
+        if checkpoint.get("page_size") != self.page_size:
+            print(f"Checkpoint was written with page size {checkpoint.get('page_size')}, starting over")
+            return None
+        return checkpoint
+
+    @staticmethod
+    def key(hadith_id):
+        # Numeric IDs are kept as ints, which take far less memory than strings
+        hadith_id = str(hadith_id)
+        return int(hadith_id) if hadith_id.isdigit() else hadith_id
+
+    @property
+    def next_page(self):
+        return self.completed_through + 1
+
+    def is_complete(self, page):
+        return page <= self.completed_through or page in self.completed_pages
+
+    def add_page(self, page, hadith_ids):
+        """Append a page's IDs that weren't seen before and mark the page complete"""
+        with self.lock:
+            for hadith_id in hadith_ids:
+                key = self.key(hadith_id)
+                if key in self.seen:
+                    self.duplicates += 1
+                    continue
+                self.seen.add(key)
+                self.file.write(json.dumps({"page": page, "hadith_id": str(hadith_id)}) + "\n")
+                self.ids_written += 1
+
+            self.completed_pages.add(page)
+            while self.completed_through + 1 in self.completed_pages:
+                self.completed_through += 1
+                self.completed_pages.discard(self.completed_through)
+
+            self.pages_since_checkpoint += 1
+            if self.pages_since_checkpoint >= self.checkpoint_every:
+                self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        # The IDs must be on disk before the checkpoint says their pages are done
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        checkpoint = {"page_size": self.page_size, "completed_through": self.completed_through,
+                      "completed_pages": sorted(self.completed_pages), "ids": len(self.seen),
+                      "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+        self.pages_since_checkpoint = 0
+
+    def close(self):
+        with self.lock:
+            self._write_checkpoint()
+            self.file.close()
+
+def export_json(jsonl_path, json_path):
+    """Write the IDs of a JSONL output file as the old hadith_data.json list"""
+    with open(jsonl_path, "r", encoding="utf-8") as source:
+        data = [json.loads(line) for line in source if line.strip()]
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return len(data)
+
+def parse_list_page(response_data):
+    """Return (hadith IDs, total hadith count or None) from one page of the list response"""
+    entries = []
+    total = None
+    if isinstance(response_data, dict):
+        for key in ("data", "list", "hadithList", "items"):
+            value = response_data.get(key)
+            # Some responses nest the list one level down, next to the count
+            if isinstance(value, dict):
+                total = value.get("totalCount", value.get("total"))
+                value = value.get("list") or value.get("data") or value.get("items")
+            if isinstance(value, list):
+                entries = value
+                break
+        if total is None:
+            total = response_data.get("totalCount", response_data.get("total"))
+    elif isinstance(response_data, list):
+        entries = response_data
+
+    hadith_ids = []
+    for entry in entries:
+        hadith_id = entry.get("id", entry.get("hadithId")) if isinstance(entry, dict) else entry
+        if hadith_id is not None and str(hadith_id).isdigit():
+            hadith_ids.append(str(hadith_id))
+    return hadith_ids, int(total) if total is not None else None
+
+def fetch_list_page(page, page_size, last_page=None):
+    """Fetch one page of the hadith list, retrying by error class; returns (hadith IDs, total).
+
+    Up to last_page (the last page the total count covers; by default the
+    one this response's own total covers) an empty page is an error and is
+    retried like one.
+    """
+    payload = dict(LIST_QUERY, pageNumber=page, pageSize=page_size)
+    headers = {"accept": "application/json", "content-type": "application/json"}
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = send_request("list", "POST", HADITH_LIST_ENDPOINT, json=payload, headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to fetch list page {page}: HTTP {response.status_code}")
+            hadith_ids, total = parse_list_page(response_json(response))
+            listed_through = last_page
+            if listed_through is None and total is not None:
+                listed_through = (total + page_size - 1) // page_size
+            if not hadith_ids and listed_through is not None and page <= listed_through:
+                raise RuntimeError(f"List page {page} came back empty: no valid data up to page {listed_through}")
+            return hadith_ids, total
+        except Exception as e:
+            policy = DEFAULT_POLICIES.get(classify_error(e), DEFAULT_POLICIES[OTHER])
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay(attempt)
+            logging.warning(f"List page {page} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+def discover_hadith_ids(on_page, start_page=1, end_page=None, page_size=DEFAULT_PAGE_SIZE, workers=DEFAULT_WORKERS,
+                        range_size=DEFAULT_RANGE_SIZE, skip_page=None):
+    """Fetch list pages start_page..end_page on several threads; returns {page: error} for failed pages.
+
+    Workers claim ranges of range_size pages in order. Without end_page the
+    last page is worked out from the total count in the first response, or,
+    if the API doesn't send one, from the first page that comes back empty.
+    Once the total is known an empty page inside it counts as failed.
+    on_page(page, hadith_ids) is called as each page arrives (from the
+    worker threads, one call at a time); pages for which skip_page(page) is
+    true are not fetched.
+    """
+    failed_pages = {}
+    lock = threading.Lock()
+    # last_listed: the last page the total count covers, once a response has given it
+    state = {"next": start_page, "end": end_page, "last_listed": None}
+
+    def record(page, hadith_ids, total):
+        with lock:
+            if total is not None and state["last_listed"] is None:
+                state["last_listed"] = (total + page_size - 1) // page_size
+                if state["end"] is None:
+                    state["end"] = state["last_listed"]
+                    print(f"{total} hadiths listed, {max(0, state['end'] - start_page + 1)} pages from page {start_page}")
+            if not hadith_ids:
+                if state["last_listed"] is not None and page <= state["last_listed"]:
+                    # Fetched before the total was known and without one of its own, so not retried
+                    logging.error(f"Giving up on list page {page}: came back empty")
+                    failed_pages[page] = "empty page"
+                # Without a total, an empty page is past the end of the list; stop claiming pages beyond it
+                elif state["end"] is None or page <= state["end"]:
+                    state["end"] = page - 1
+                return
+            on_page(page, hadith_ids)
+
+    def claim():
+        with lock:
+            start = state["next"]
+            end = state["end"]
+            if end is not None and start > end:
+                return None
+            stop = start + range_size - 1
+            if end is not None:
+                stop = min(stop, end)
+            state["next"] = stop + 1
+            return start, stop
+
+    def fetch(page):
+        if skip_page is not None and skip_page(page):
+            return
+        with lock:
+            last_listed = state["last_listed"]
+        try:
+            hadith_ids, total = fetch_list_page(page, page_size, last_listed)
+        except Exception as e:
+            logging.error(f"Giving up on list page {page}: {e}")
+            with lock:
+                failed_pages[page] = str(e)
+            return
+        record(page, hadith_ids, total)
+
+    def worker():
+        while True:
+            page_range = claim()
+            if page_range is None:
+                return
+            for page in range(page_range[0], page_range[1] + 1):
+                with lock:
+                    if state["end"] is not None and page > state["end"]:
+                        return
+                fetch(page)
+
+    # The first page usually gives the total count, which bounds the pages the workers claim
+    fetch(start_page)
+    state["next"] = start_page + 1
+    set_pool_maxsize(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(worker)
+
+    if failed_pages:
+        print(f"⚠️ {len(failed_pages)} list pages failed: {sorted(failed_pages)}")
+    return failed_pages
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Collect hadith IDs from the hadith list")
+    parser.add_argument("--mode", choices=["api", "browser"], default="api",
+                        help="api pages through the list's JSON request; browser drives Chrome through the list page")
+    parser.add_argument("--start-page", type=int, default=1,
+                        help="First page of a new crawl; a checkpoint further on takes precedence")
+    parser.add_argument("--end-page", type=int, default=None,
+                        help="Last page to fetch (default: from the total count, or the first empty page)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Pages fetched at once")
+    parser.add_argument("--range-size", type=int, default=DEFAULT_RANGE_SIZE,
+                        help="Consecutive pages each worker claims at a time")
+    parser.add_argument("--rate", type=float, default=5.0, help="Starting list requests per second")
+    parser.add_argument("--max-rate", type=float, default=20.0,
+                        help="List requests per second to ramp up to while the server stays healthy")
+    parser.add_argument("--output", default=OUTPUT_FILE,
+                        help="JSONL file the IDs are appended to (checkpoint kept in OUTPUT.checkpoint.json)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Ignore the checkpoint and start at --start-page (IDs already in OUTPUT are still skipped)")
+    parser.add_argument("--export-json", default=None,
+                        help="Also write all IDs to this file in the old hadith_data.json layout when done")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    output = IdOutput(args.output, args.page_size, args.start_page, resume=not args.no_resume)
+    if output.next_page > args.start_page:
+        print(f"Resuming at page {output.next_page} with {len(output.seen)} IDs already in {args.output}")
+    started = time.monotonic()
+    try:
+        if args.mode == "browser":
+            scrape_hadith(output, output.next_page, args.page_size)
+            failed_pages = {}
+        else:
+            rate_limiter.configure("list", rate=args.rate, min_rate=0.2, max_rate=max(args.rate, args.max_rate))
+            failed_pages = discover_hadith_ids(output.add_page, output.next_page, args.end_page, args.page_size,
+                                               args.workers, args.range_size, skip_page=output.is_complete)
+    finally:
+        output.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Found {output.ids_written} new hadith IDs in {elapsed:.1f}s ({output.duplicates} duplicates skipped), "
+          f"{len(output.seen)} in {args.output}")
+    print(f"Complete through page {output.completed_through}" + (f", {len(failed_pages)} pages failed" if failed_pages else ""))
+    if args.mode == "api":
+        print(f"HTTP connections: {format_connection_stats()}")
+        print(f"Rate limits:\n{rate_limiter.format_stats()}")
+    if args.export_json:
+        count = export_json(args.output, args.export_json)
+        print(f"Exported {count} hadith IDs to {args.export_json}")
+
 if __name__ == "__main__":
-    scrape_hadith()
\ No newline at end of file
+    main()
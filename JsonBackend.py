@@ -0,0 +1,119 @@
+import os
+import json
+import codecs
+from typing import Any, List, Optional, TypedDict
+
+# Optional faster decoders; the stdlib json module is used when neither is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Decoder to use (orjson, msgspec or json); by default the fastest one installed
+JSON_BACKEND = os.environ.get("HADITH_JSON_BACKEND")
+
+def stdlib_loads(data):
+    return json.loads(data)
+
+def orjson_loads(data):
+    return orjson.loads(data)
+
+def msgspec_loads(data):
+    try:
+        return msgspec_decoder.decode(data)
+    except msgspec.DecodeError as e:
+        # Callers (and RetryScheduler.classify_error) expect malformed JSON as a ValueError
+        raise ValueError(str(e)) from e
+
+BACKENDS = {"json": stdlib_loads}
+if msgspec is not None:
+    msgspec_decoder = msgspec.json.Decoder()
+    BACKENDS["msgspec"] = msgspec_loads
+if orjson is not None:
+    BACKENDS["orjson"] = orjson_loads
+
+# Order of preference when no backend is configured
+PREFERRED_BACKENDS = ["orjson", "msgspec", "json"]
+
+def available_backends():
+    return [name for name in PREFERRED_BACKENDS if name in BACKENDS]
+
+backend_name = None
+backend_loads = None
+
+def set_backend(name=None):
+    """Switch the decoder used by loads(); None picks the fastest one installed"""
+    global backend_name, backend_loads
+    name = name or available_backends()[0]
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend {name} is not installed (available: {', '.join(available_backends())})")
+    backend_name, backend_loads = name, BACKENDS[name]
+    return name
+
+set_backend(JSON_BACKEND)
+
+def loads(data):
+    """Decode a JSON document from bytes or str with the selected backend"""
+    return backend_loads(data)
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+def response_json(response):
+    """Decode a requests response body; replaces response.json()"""
+    content = response.content
+    if content.startswith(codecs.BOM_UTF8):
+        content = content[len(codecs.BOM_UTF8):]
+    return loads(content)
+
+# Typed rejal decoding (msgspec only). The schema lists just the fields the
+# extraction scripts read; everything else in the payload is skipped while
+# decoding instead of being built into dicts. The result is still plain
+# dicts and lists, so the extractors work on it unchanged.
+if msgspec is not None:
+    SanadRavi = TypedDict("SanadRavi", {"raviId": Any, "hint": Any}, total=False)
+    SanadItem = TypedDict("SanadItem", {"title": Any, "type": Any, "raviList": Optional[List[SanadRavi]]},
+                          total=False)
+    SanadEntry = TypedDict("SanadEntry", {"sanad": Optional[List[SanadItem]]}, total=False)
+    InfoSection = TypedDict("InfoSection", {"title": Any, "text": Any}, total=False)
+    Ravi = TypedDict("Ravi", {"raviId": Any, "raviTitle": Any, "infoList": Optional[List[InfoSection]],
+                              "infoList2": Optional[List[InfoSection]]}, total=False)
+    RejalData = TypedDict("RejalData", {"sanadList": Optional[List[SanadEntry]], "raviList": Optional[List[Ravi]]},
+                          total=False)
+    RejalResponse = TypedDict("RejalResponse", {"data": Optional[RejalData], "error": Any}, total=False)
+    # A saved record: the details are kept whole, the rejal response is typed
+    HadithRecord = TypedDict("HadithRecord", {"hadith_id": Any, "hadith_details": Any,
+                                              "hadith_rejal_list": Optional[RejalResponse]}, total=False)
+
+    rejal_decoder = msgspec.json.Decoder(RejalResponse)
+    record_decoder = msgspec.json.Decoder(HadithRecord)
+
+def typed_decoding_available():
+    return msgspec is not None
+
+def decode_typed(data, decoder):
+    try:
+        return decoder.decode(data)
+    except msgspec.ValidationError:
+        # Valid JSON not shaped like the schema expects: decode it as it is
+        return loads(data)
+    except msgspec.DecodeError as e:
+        raise ValueError(str(e)) from e
+
+def loads_rejal(data, typed=False):
+    """Decode a HadithRejalList/v2 response, typed when asked and msgspec is installed"""
+    if typed and msgspec is not None:
+        return decode_typed(data, rejal_decoder)
+    return loads(data)
+
+def loads_record(data, typed=False):
+    """Decode a saved record ({hadith_details, hadith_rejal_list}), with a typed rejal part when asked"""
+    if typed and msgspec is not None:
+        return decode_typed(data, record_decoder)
+    return loads(data)
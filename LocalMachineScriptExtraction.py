@@ -2,13 +2,22 @@ import csv
 import uuid
 import re
 import os
-import json
 import logging
 import sys
-import unicodedata
 from datetime import datetime
 import traceback
+import io
 import hashlib
+import itertools
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from SegmentStore import SegmentReader, list_segments
+from RejalIndex import rejal_index
+from NarratorProfile import extract_narrator_profile, ravi_book_source
+from JsonBackend import loads_record
+from ArabicText import is_normal_narrator, format_cache_stats
+from NarratorClassifier import get_classifier, SPECIAL_NAME, HONORIFIC
 
 # Create a log file name with timestamp
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -29,33 +38,11 @@ class Logger:
         self.terminal.flush()
         self.log.flush()
 
-# Redirect stdout to both console and file
-sys.stdout = Logger(log_file_path)
-sys.stderr = Logger(log_file_path)
-
-# Add Arabic normalization function
-def normalize_arabic(text):
-    text = unicodedata.normalize("NFKC", text)
-    text = re.sub(r'[إأآا]', 'ا', text)
-    text = re.sub(r'[ى]', 'ي', text)
-    text = re.sub(r'[ة]', 'ه', text)
-    text = re.sub(r'[ئؤ]', 'ء', text)
-    text = re.sub(r'[\u064B-\u065F]', '', text)  # Remove diacritics
-    text = ' '.join(text.split())  # Remove extra spaces
-    text = text.replace("ابن", "بن")  # Treat ابن and بن as the same
-    return text
-
-# Function to check if title exists in hint
-def is_normal_narrator(title, hint):
-    # Remove honorifics for better comparison
-    for pattern in ["عليه السلام", "ع"]:
-        title = title.replace(pattern, "").strip()
-    
-    title = normalize_arabic(title)
-    hint = normalize_arabic(hint)
-    
-    # Check if all words in title exist in hint
-    return all(word in hint for word in title.split())
+# Redirect stdout to both console and file (extraction worker processes,
+# which import this module again when started by spawn, log to their own files)
+if multiprocessing.parent_process() is None:
+    sys.stdout = Logger(log_file_path)
+    sys.stderr = Logger(log_file_path)
 
 # Configure logging
 logging.basicConfig(
@@ -68,6 +55,18 @@ logging.basicConfig(
 json_folder = r"C:\Users\User\Downloads\hadith system\test json"
 csv_folder = r"C:\Users\User\Downloads\hadith system\test csv"
 
+# Compressed segment store written by ResponseFetchingScript; used instead of json_folder when present
+segment_folder = r"C:\Users\User\Downloads\hadith system\scraped_hadith_segments"
+segment_store = None
+
+def get_segment_store():
+    """Open the segment store on first use; returns None if there are no segments"""
+    global segment_store
+    if segment_store is None and list_segments(segment_folder):
+        segment_store = SegmentReader(segment_folder)
+        print(f"Opened segment store {segment_folder} with {len(segment_store)} hadith records")
+    return segment_store
+
 # Ensure the CSV folder exists
 os.makedirs(csv_folder, exist_ok=True)
 
@@ -95,80 +94,103 @@ for file_path in [hadith_file, book_file, reference_file, sanad_file, narrator_f
     print(f"  - Directory exists: {os.path.exists(os.path.dirname(file_path))}")
     print(f"  - File exists: {os.path.exists(file_path)}")
 
-# Extract Hadith IDs from JSON files in the folder
-def extract_hadith_ids_from_files():
-    try:
-        hadith_ids = set()
-        
-        # First, check if the folder exists
-        if not os.path.exists(json_folder):
+# Hadith JSON file names in json_folder
+HADITH_FILE_PATTERN = re.compile(r'hadith_(\d+)\.json')
+
+# Yield (hadith_id, path) for every stored hadith as the folder is read, without listing it first
+def iter_hadith_files():
+    """Segment store records come first (path None), then hadith_{id}.json files the store doesn't hold"""
+    store = get_segment_store()
+    if store is not None:
+        print(f"Found {len(store)} hadith IDs in segment store: {segment_folder}")
+        for hadith_id in store.ids():
+            yield hadith_id, None
+    
+    if not os.path.isdir(json_folder):
+        if store is None:
             print(f"Error: JSON folder does not exist: {json_folder}")
-            return []
-            
-        # Print folder information
-        print(f"Scanning JSON folder: {json_folder}")
-        
-        # Count total JSON files
-        json_files = [f for f in os.listdir(json_folder) if f.endswith('.json')]
-        total_files = len(json_files)
-        print(f"Found {total_files} JSON files in the folder")
-        
-        # Process each file
-        for i, filename in enumerate(json_files, 1):
-            if i % 10 == 0 or i == 1 or i == total_files:
-                print(f"Processing file {i}/{total_files}: {filename}")
-                
-            if filename.startswith("hadith_") and filename.endswith(".json"):
-                # Extract the ID from the filename
-                match = re.search(r'hadith_(\d+)\.json', filename)
-                if match:
-                    hadith_ids.add(match.group(1))
-        
-        hadith_ids = list(hadith_ids)
-        print(f"Found {len(hadith_ids)} unique hadith IDs from JSON files")
-        if hadith_ids and len(hadith_ids) > 0:
-            sample_size = min(5, len(hadith_ids))
-            print(f"Sample of {sample_size} IDs: {hadith_ids[:sample_size]}")
-        return hadith_ids
-    except Exception as e:
-        logging.error(f"Error extracting hadith IDs from JSON files: {str(e)}")
-        print(f"Exception reading JSON files: {str(e)}")
-        traceback.print_exc()
-        return []
+        return
+    
+    print(f"Scanning JSON folder: {json_folder}")
+    found = 0
+    with os.scandir(json_folder) as entries:
+        for entry in entries:
+            match = HADITH_FILE_PATTERN.fullmatch(entry.name)
+            if match is None or (store is not None and match.group(1) in store):
+                continue
+            found += 1
+            if found % 1000 == 0:
+                print(f"Found {found} JSON files so far")
+            yield match.group(1), entry.path
+    print(f"Found {found} hadith JSON files in {json_folder}")
+
+# Parsed records kept in memory, least recently used first; a reference
+# often points at a hadith that was just processed (0 disables the cache)
+RECORD_CACHE_SIZE = 32
+record_cache = OrderedDict()
+record_cache_stats = {"hits": 0, "misses": 0}
+
+# Decode the rejal part of each record into just the fields the extraction
+# reads; needs msgspec, records are decoded whole without it
+TYPED_REJAL = False
+
+# Function to load the stored record of a hadith (segment store or JSON file), parsed once
+def load_hadith_record(hadith_id, file_path=None):
+    """Return the record holding hadith_details and hadith_rejal_list, or None if there is none.
 
-# Function to load hadith details from JSON file
-def load_hadith_details(hadith_id):
-    file_path = os.path.join(json_folder, f"hadith_{hadith_id}.json")
+    With file_path (from iter_hadith_files) the file is read without looking up the store or the folder.
+    """
+    hadith_id = str(hadith_id)
+    if hadith_id in record_cache:
+        record_cache.move_to_end(hadith_id)
+        record_cache_stats["hits"] += 1
+        return record_cache[hadith_id]
+    record_cache_stats["misses"] += 1
+    
+    store = get_segment_store()
+    if file_path is None and store is not None and hadith_id in store:
+        data = loads_record(store.get_bytes(hadith_id), typed=TYPED_REJAL)
+    else:
+        file_path = file_path or os.path.join(json_folder, f"hadith_{hadith_id}.json")
+        print(f"Loading hadith record from file: {file_path}")
+        try:
+            with open(file_path, 'rb') as f:
+                data = loads_record(f.read(), typed=TYPED_REJAL)
+        except FileNotFoundError:
+            return None
     
+    if RECORD_CACHE_SIZE > 0:
+        record_cache[hadith_id] = data
+        if len(record_cache) > RECORD_CACHE_SIZE:
+            record_cache.popitem(last=False)
+    return data
+
+# Function to load hadith details and rejal data from one parse of the record
+def load_hadith_data(hadith_id, file_path=None):
     try:
-        if os.path.exists(file_path):
-            print(f"Loading hadith details from file: {file_path}")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            print(f"Successfully loaded hadith details for ID: {hadith_id}")
-            
-            # The data structure is different - we need to extract from hadith_details
-            if "hadith_details" in data:
-                return data["hadith_details"]
-            return data
-        else:
-            print(f"File not found: {file_path}")
-            logging.error(f"Hadith details file not found for ID {hadith_id}: {file_path}")
-            return {"error": "File not found"}
+        data = load_hadith_record(hadith_id, file_path)
     except Exception as e:
-        logging.error(f"Exception while loading hadith details for ID {hadith_id}: {str(e)}")
-        return {"error": str(e)}
+        logging.error(f"Exception while loading hadith record for ID {hadith_id}: {str(e)}")
+        return {"error": str(e)}, None
+    
+    if data is None:
+        file_path = file_path or os.path.join(json_folder, f"hadith_{hadith_id}.json")
+        print(f"File not found: {file_path}")
+        logging.error(f"Hadith file not found for ID {hadith_id}: {file_path}")
+        return {"error": "File not found"}, None
+    print(f"Successfully loaded hadith details and rejal for ID: {hadith_id}")
+    
+    # The details are under hadith_details and the rejal data under hadith_rejal_list
+    hadith_details = data["hadith_details"] if "hadith_details" in data else data
+    return hadith_details, data.get("hadith_rejal_list")
 
 # Function to load reference details from JSON file
 def load_reference_details(reference_hadith_id):
     file_path = os.path.join(json_folder, f"hadith_{reference_hadith_id}.json")
     
     try:
-        if os.path.exists(file_path):
-            print(f"Loading reference details from file: {file_path}")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
+        data = load_hadith_record(reference_hadith_id)
+        if data is not None:
             # Extract from hadith_details
             if "hadith_details" in data and "data" in data["hadith_details"]:
                 ref_data = data["hadith_details"]["data"][0]
@@ -188,145 +210,10 @@ def load_reference_details(reference_hadith_id):
         logging.error(f"Exception while loading reference details for ID {reference_hadith_id}: {str(e)}")
         return {}
 
-# Function to load hadith rejal data from JSON file
-def load_hadith_rejal(hadith_id):
-    file_path = os.path.join(json_folder, f"hadith_{hadith_id}.json")
-    
-    try:
-        if os.path.exists(file_path):
-            print(f"Loading hadith rejal from file: {file_path}")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            print(f"Successfully loaded hadith rejal for ID: {hadith_id}")
-            
-            # The data structure is different - we need to extract from hadith_rejal_list
-            if "hadith_rejal_list" in data:
-                return data["hadith_rejal_list"]
-            return None
-        else:
-            print(f"File not found: {file_path}")
-            logging.error(f"Hadith rejal file not found for ID {hadith_id}: {file_path}")
-            return None
-    except Exception as e:
-        logging.error(f"Exception while loading hadith rejal for ID {hadith_id}: {str(e)}")
-        return None
-
-# Helper function to extract narrator titles from rejal data
-def extract_narrator_titles(rejal_data, ravi_id):
-    titles = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return ""
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return ""
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList", []):
-                if info.get("title") == "لقب":  # Filter only title "لقب"
-                    for text_entry in info.get("text", []):
-                        book_names = []
-                        for book in text_entry.get("bookName", []):
-                            book_name = book.get("bookName", "")
-                            if book_name:
-                                book_names.append(book_name)
-                        
-                        text = text_entry.get("text", "")
-                        if text:
-                            book_names_str = ", ".join(book_names)
-                            formatted_title = f"{text}({book_names_str})"
-                            titles.append(formatted_title)
-    
-    return " | ".join(titles) if titles else ""
-
-# Helper function to extract narrator patronymic
-def extract_narrator_patronymic(rejal_data, ravi_id):
-    patronymics = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return ""
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return ""
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList", []):
-                if info.get("title") == "کنيه":  # Filter only title "کنيه" (patronymic)
-                    for text_entry in info.get("text", []):
-                        book_names = []
-                        for book in text_entry.get("bookName", []):
-                            book_name = book.get("bookName", "")
-                            if book_name:
-                                book_names.append(book_name)
-                        
-                        text = text_entry.get("text", "")
-                        if text:
-                            book_names_str = ", ".join(book_names)
-                            formatted_patronymic = f"{text}({book_names_str})"
-                            patronymics.append(formatted_patronymic)
-    
-    return " | ".join(patronymics) if patronymics else ""
-
-# Helper function to extract narrator sect and reliability
-def extract_narrator_sect_reliability(rejal_data, ravi_id):
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return {"sect": "", "reliability": ""}
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return {"sect": "", "reliability": ""}
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList2", []):
-                if info.get("title", "").strip() == "نتيجه ارزيابي":
-                    text_entries = info.get("text", [])
-                    if text_entries:
-                        cleaned_text = "".join(text_entries).replace(" ,", ",")
-                        words = cleaned_text.split(", ")
-                        
-                        sect = words[0] if len(words) > 0 else ""
-                        reliability = words[1] if len(words) > 1 else ""
-                        
-                        return {"sect": sect, "reliability": reliability}
-    
-    return {"sect": "", "reliability": ""}
-
-# Helper function to extract narrator evaluation summary
-def extract_narrator_evaluation_summary(rejal_data, ravi_id):
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return ""
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return ""
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList2", []):
-                if info.get("title") == "جمع بندي ارزيابي":  # Summary evaluation
-                    text = info.get("text", "")
-                    if text:
-                        return text
-    
-    return ""
-
 # Helper function to process narrator death records and evaluations
-def process_narrator_evaluations_and_death(ravi_id, rejal_data, narrator_death_records_writer, narrator_evaluation_writer):
+def process_narrator_evaluations_and_death(ravi_id, profile, narrator_death_records_writer, narrator_evaluation_writer):
     # Process death records
-    death_records = extract_narrator_death_info(rejal_data, ravi_id)
+    death_records = profile["death_records"]
     for death_record in death_records:
         death_record_id = f"death_{str(uuid.uuid4())[:8]}"
         narrator_death_records_writer.writerow([
@@ -337,11 +224,11 @@ def process_narrator_evaluations_and_death(ravi_id, rejal_data, narrator_death_r
         ])
         print(f"Added death record for narrator ID: {ravi_id}")
     
-    # Extract evaluation summary
-    summary = extract_narrator_evaluation_summary(rejal_data, ravi_id)
+    # Evaluation summary
+    summary = profile["summary"]
     
-    # Extract detailed evaluations
-    evaluations = extract_narrator_evaluations(rejal_data, ravi_id)
+    # Detailed evaluations
+    evaluations = profile["evaluations"]
     for evaluation in evaluations:
         eval_id = f"eval_{str(uuid.uuid4())[:8]}"
         # Join sources without adding additional brackets (they're already formatted)
@@ -368,84 +255,6 @@ def process_narrator_evaluations_and_death(ravi_id, rejal_data, narrator_death_r
         ])
         print(f"Added evaluation summary for narrator ID: {ravi_id}")
 
-# Helper function to extract detailed evaluations
-def extract_narrator_evaluations(rejal_data, ravi_id):
-    evaluations = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return evaluations
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return evaluations
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList2", []):
-                if info.get("title") == "الفاظ جرح و تعدیل":  # Evaluation terms
-                    for entry in info.get("text", []):
-                        text_value = entry.get("text", "")
-                        sources = []
-                        
-                        # Extract book names and ravi titles
-                        if "bookName" in entry:
-                            for book_item in entry["bookName"]:
-                                if isinstance(book_item, dict):
-                                    book_title = book_item.get("bookName", "")
-                                    ravi_title = book_item.get("raviTitle", "")
-                                    
-                                    # Format: raviTitle (bookTitle)
-                                    formatted_source = f"{ravi_title} ({book_title})" if ravi_title and book_title else ravi_title or book_title
-                                    sources.append(formatted_source)
-                        
-                        if text_value:  # Only add if there's evaluation text
-                            evaluations.append({
-                                "text": text_value,
-                                "sources": sources
-                            })
-    
-    return evaluations
-
-# Helper function to extract death information
-def extract_narrator_death_info(rejal_data, ravi_id):
-    death_records = []
-    
-    if not rejal_data or not isinstance(rejal_data, dict):
-        return death_records
-    
-    data = rejal_data.get("data", {})
-    if not isinstance(data, dict):
-        return death_records
-    
-    ravi_list = data.get("raviList", [])
-    
-    for ravi in ravi_list:
-        if ravi.get("raviId") == ravi_id:
-            for info in ravi.get("infoList", []):
-                if info.get("title") in ["وفات", "تاريخ وفات"]:  # Death or Death date
-                    for entry in info.get("text", []):
-                        if isinstance(entry, dict):
-                            death_year = entry.get("text", "").strip()
-                            book_names = []
-                            
-                            # Extract book names
-                            if "bookName" in entry:
-                                for book_item in entry.get("bookName", []):
-                                    if isinstance(book_item, dict) and "bookName" in book_item:
-                                        book_names.append(book_item["bookName"])
-                            
-                            source = ", ".join(book_names)
-                            
-                            if death_year or source:  # Only add if we have data
-                                death_records.append({
-                                    "death_year": death_year,
-                                    "source": source
-                                })
-    
-    return death_records
-
 # Check if CSV files exist and create headers if needed
 def initialize_csv_files():
     files_and_headers = {
@@ -511,6 +320,560 @@ def initialize_csv_files():
     
     return existing_content_ids, existing_hadith_content_refs
 
+# Table order of the writers passed to process_hadith_ids
+TABLES = ["hadith", "book", "reference", "sanad", "narrator", "narrator_chain", "narrator_details",
+          "narrator_death_records", "narrator_evaluation", "hadith_content", "special_narrator_relation"]
+
+# Dedup maps kept while extracting; the first hadith to mention a book, content, narrator, ... writes its row
+def new_extraction_state(existing_content_ids):
+    return {
+        "books": {},
+        "narrators": {},
+        "narrator_details": set(),  # We'll track by ravi_id only
+        "hadith_contents": existing_content_ids.copy(),  # Start with existing content IDs
+        "special_narrators": {},  # Track special narrators by unique key
+    }
+
+# Write the rows of every table for (hadith_id, path) pairs from iter_hadith_files; returns how many were processed
+def process_hadith_ids(hadith_files, writers, state, existing_hadith_content_refs, skipped_files_path):
+    (hadith_writer, book_writer, reference_writer, sanad_writer, narrator_writer, narrator_chain_writer,
+     narrator_details_writer, narrator_death_records_writer, narrator_evaluation_writer, hadith_content_writer,
+     special_narrator_relation_writer) = writers
+    
+    # Keep track of processed items
+    processed_books = state["books"]
+    processed_narrators = state["narrators"]
+    processed_narrator_details = state["narrator_details"]
+    processed_hadith_contents = state["hadith_contents"]
+    processed_special_narrators = state["special_narrators"]
+    
+    processed = 0
+    for hadith_id, hadith_path in hadith_files:
+        processed += 1
+        print(f"\nProcessing Hadith ID: {hadith_id}")
+        
+        # Load data from file
+        try:
+            hadith_details, rejal_data = load_hadith_data(hadith_id, hadith_path)
+            # raviList indexed once; narrator names and details are lookups in it
+            rejal = rejal_index(rejal_data)
+        except Exception as e:
+            print(f"Error loading data for Hadith ID {hadith_id}: {str(e)}")
+            with open(skipped_files_path, 'a', encoding='utf-8') as skipped_file:
+                skipped_file.write(f"hadith_{hadith_id}.json,Error loading data: {str(e)},{datetime.now().isoformat()}\n")
+            continue
+        
+        # Process hadith data
+        has_valid_data = False
+        
+        if "data" in hadith_details and hadith_details["data"]:
+            hadith_entry = hadith_details["data"][0]
+            
+            # Generate a unique UUID for this hadith
+            hadith_uuid = str(uuid.uuid4())
+            
+            # Extract hadith ID from data
+            hadith_id_from_data = hadith_entry.get("id", "N/A")
+            print(f"Found hadith with ID: {hadith_id_from_data}")
+            
+            # Extract content and clean HTML tags
+            hadith_content = re.sub(r"</?[^>]+>", "", hadith_entry.get("text", "N/A"))
+            
+            # Check if this hadith ID already has a content reference (from previous runs)
+            if hadith_id_from_data in existing_hadith_content_refs:
+                hadith_content_id = existing_hadith_content_refs[hadith_id_from_data]
+                print(f"Using existing content reference for hadith {hadith_id_from_data}: {hadith_content_id}")
+            # Check if this hadith content already exists
+            elif hadith_content in processed_hadith_contents:
+                hadith_content_id = processed_hadith_contents[hadith_content]
+                print(f"Using existing hadith content ID: {hadith_content_id}")
+            else:
+                # Generate a content ID with a UUID that is shorter but still unique
+                short_uuid = str(uuid.uuid4()).split('-')[0]
+                hadith_content_id = f"content_{short_uuid}"
+                
+                # Write content entry
+                hadith_content_writer.writerow([hadith_content_id, hadith_content])
+                processed_hadith_contents[hadith_content] = hadith_content_id
+                print(f"Added new hadith content with ID: {hadith_content_id}")
+            
+            # Extract narrators and properly join them with comma
+            qaelTitleList = hadith_entry.get("qaelTitleList", ["N/A"])
+            originated_from = ", ".join(qaelTitleList) if isinstance(qaelTitleList, list) else qaelTitleList
+            
+            # Extract book details and create a unique book ID based on source
+            book_title = hadith_entry.get("bookTitle", "Unknown Book")
+            book_source_id = hadith_entry.get("sourceId", "unknown")
+            
+            # Extract page_num and volume for hadith table
+            page_num = hadith_entry.get("pageNum", "N/A")
+            volume = hadith_entry.get("vol", "N/A")
+            
+            # Create a unique book ID or use an existing one
+            if book_title in processed_books:
+                book_id = processed_books[book_title]
+                print(f"Using existing book ID: {book_id} for book: {book_title}")
+            else:
+                # Generate a book ID based on source ID or create a UUID if none
+                book_id = f"book_{book_source_id}" if book_source_id != "unknown" else f"book_{str(uuid.uuid4())[:8]}"
+                
+                # Write book entry only once - with just the title
+                book_writer.writerow([book_id, book_title])
+                processed_books[book_title] = book_id
+                print(f"Added new book: {book_title} with ID: {book_id}")
+            
+            # Write hadith entry with proper book ID relationship, content ID reference, and page/volume
+            hadith_writer.writerow([hadith_uuid, hadith_id_from_data, hadith_content_id, originated_from, book_id, page_num, volume])
+            print(f"Wrote hadith entry with UUID: {hadith_uuid}")
+            
+            has_valid_data = True
+            
+            # Process references
+            group_together_list = hadith_entry.get("groupTogetherList", [])
+            print(f"Found {len(group_together_list)} references")
+            
+            for item in group_together_list:
+                reference_hadith_id = item.get("hadithId", "N/A")
+                
+                # Skip self-references
+                if reference_hadith_id == hadith_id_from_data:
+                    print(f"Skipping self-reference to {reference_hadith_id}")
+                    continue
+                
+                # Create reference entry directly from the data we have
+                reference_id = f"ref_{str(uuid.uuid4())[:8]}"
+                
+                reference_writer.writerow([
+                    reference_id,                       # Unique reference ID
+                    hadith_uuid,                        # Foreign key to hadith
+                    reference_hadith_id,                # Referenced hadith ID
+                    item.get("vol", "N/A"),            # Volume
+                    item.get("pageNum", "N/A"),        # Page number
+                    item.get("sourceId", "N/A"),       # Source ID
+                    item.get("sourceMainTitle", "Unknown Source")  # Source title
+                ])
+                print(f"Added reference to hadith ID: {reference_hadith_id}")
+            
+            # Process Sanad (Narrator Chains) using the new logic
+            sanad_lists = []
+            if rejal_data and isinstance(rejal_data, dict):
+                data = rejal_data.get("data", {})
+                if isinstance(data, dict):
+                    sanad_lists = data.get("sanadList", [])
+            
+            print(f"Found {len(sanad_lists)} sanad entries")
+            
+            # Process each sanad (chain of narrators)
+            for sanad_list_num, sanad_entry in enumerate(sanad_lists, start=1):
+                # Generate unique sanad ID using a consistent format
+                sanad_id = f"sanad_{hadith_id_from_data}_{sanad_list_num}"
+                
+                # Extract the sanad description based on the new logic
+                sanad = sanad_entry.get("sanad", [])
+                sanad_description = " ".join(item.get("title", "") for item in sanad if item.get("title"))
+                
+                # Write sanad entry with proper foreign key to hadith
+                sanad_writer.writerow([
+                    sanad_id,           # Primary key
+                    hadith_uuid,        # Foreign key to hadith
+                    sanad_description,  # Full description
+                    sanad_list_num      # Number/position of this sanad
+                ])
+                print(f"Added sanad #{sanad_list_num} with description: {sanad_description[:50]}...")
+                
+                # Process each narrator in this sanad
+                position = 1  # Track position within this sanad
+                for sanad_item in sanad_entry.get("sanad", []):
+                    # Only process narrators (type=0 or type=4)
+                    if sanad_item.get("type") in [0, 4]:
+                        narrator_name = sanad_item.get("title", "N/A")
+                        
+                        # Ensure we have a valid name
+                        if narrator_name == "N/A":
+                            continue
+                        
+                        # Extract all ravi IDs for this title
+                        ravi_ids = []
+                        ravi_names = {}  # Store actual narrator names by raviId
+                        hint_data = {}   # Store hint data for each ravi_id
+                        
+                        if "raviList" in sanad_item:
+                            for ravi_entry in sanad_item["raviList"]:
+                                if "raviId" in ravi_entry:
+                                    ravi_id = ravi_entry.get("raviId")
+                                    ravi_ids.append(ravi_id)
+                                    
+                                    # Store hint data
+                                    if "hint" in ravi_entry:
+                                        hint_data[ravi_id] = ravi_entry.get("hint", "")
+                                        # Extract name from hint format "name,sect,reliability"
+                                        hint_parts = hint_data[ravi_id].split(",")
+                                        if len(hint_parts) > 0:
+                                            ravi_names[ravi_id] = hint_parts[0]
+                                            
+                                    # Look for the actual narrator name in the rejal data
+                                    actual_name = rejal.title(ravi_id)
+                                    if actual_name:
+                                        ravi_names[ravi_id] = actual_name
+                        
+                        # Log the found ravi IDs
+                        if len(ravi_ids) > 1:
+                            print(f"Found multiple raviIDs for '{narrator_name}': {ravi_ids}")
+                            print(f"Actual narrator names: {ravi_names}")
+                        elif len(ravi_ids) == 1:
+                            print(f"Found single raviID for '{narrator_name}': {ravi_ids[0]}")
+                            if ravi_ids[0] in ravi_names:
+                                print(f"Actual narrator name: {ravi_names[ravi_ids[0]]}")
+                        else:
+                            print(f"No raviID found for '{narrator_name}'")
+                        
+                        # Determine if this is a special narrator based on criteria:
+                        # 1. Name matches known special phrases like "أبيه", etc. (special_narrator_patterns.txt)
+                        # 2. Multiple ravi IDs (e.g., "عدة من أصحابنا")
+                        # 3. Title doesn't match hint (using word-based normalized comparison)
+                        
+                        # Special phrases and honorifics in the name, found in one scan
+                        name_categories = get_classifier().categories(narrator_name)
+                        is_special_by_name = SPECIAL_NAME in name_categories
+                        
+                        # Check if multiple ravi IDs - always a special case
+                        is_special_by_multiple_ravis = len(ravi_ids) > 1
+                        
+                        # Check if title doesn't appear in hint
+                        is_special_by_honorific = False
+                        if len(ravi_ids) == 1:
+                            ravi_id = ravi_ids[0]
+                            if ravi_id in hint_data:
+                                hint_text = hint_data[ravi_id]
+                                
+                                # Use the improved normalized comparison
+                                if is_normal_narrator(narrator_name, hint_text):
+                                    print(f"NOT SPECIAL: '{narrator_name}' words found in hint '{hint_text}'")
+                                    is_special_by_honorific = False
+                                else:
+                                    print(f"SPECIAL CASE: '{narrator_name}' words not found in hint '{hint_text}'")
+                                    is_special_by_honorific = True
+                            else:
+                                # No hint data but has ravi_id - check if it has honorifics
+                                if HONORIFIC in name_categories:
+                                    is_special_by_honorific = True
+                        
+                        # Combined check for special narrator
+                        is_special_narrator = is_special_by_name or is_special_by_multiple_ravis or is_special_by_honorific
+                        
+                        # Debug info
+                        if is_special_narrator:
+                            print(f"SPECIAL NARRATOR: '{narrator_name}' | By name: {is_special_by_name} | By multiple: {is_special_by_multiple_ravis} | By honorific: {is_special_by_honorific}")
+                        
+                        if is_special_narrator:
+                            # Create a unique key for this special narrator type per hadith
+                            special_key = f"{narrator_name}_{hadith_id_from_data}_{sanad_id}"
+                            
+                            # Only add one entry for this special narrator in the relation table
+                            if special_key not in processed_special_narrators:
+                                # Generate a relation ID
+                                special_relation_id = f"special_rel_{hashlib.md5(special_key.encode()).hexdigest()[:8]}"
+                                
+                                # Find a representative ravi_id to use for joining
+                                representative_ravi_id = ravi_ids[0] if ravi_ids else ""
+                                
+                                # Track this special narrator
+                                processed_special_narrators[special_key] = {
+                                    "relation_id": special_relation_id,
+                                    "ravi_ids": ravi_ids.copy(),  # Store all related ravi_ids
+                                    "representative_ravi_id": representative_ravi_id  # Store the representative ravi_id
+                                }
+                                
+                                # Add the special relation entry (only once per hadith)
+                                special_narrator_relation_writer.writerow([
+                                    special_relation_id,
+                                    hadith_uuid,
+                                    hadith_id_from_data,
+                                    sanad_id,
+                                    narrator_name,  # The special name (e.g., "أبيه" or "عدة من أصحابنا")
+                                    representative_ravi_id  # Store representative ravi_id for joining/mapping
+                                ])
+                                print(f"Added special relation for '{narrator_name}' in hadith {hadith_id_from_data} with representative ravi_id: {representative_ravi_id}")
+                                
+                            # Now add all the actual narrators to the narrator table and link them
+                            special_relation_id = processed_special_narrators[special_key]["relation_id"]
+                            
+                            # Process all the narrators associated with this special relation
+                            if len(ravi_ids) > 0:
+                                print(f">>> Processing {len(ravi_ids)} narrators for special case '{narrator_name}': {[ravi_names.get(rid, rid) for rid in ravi_ids]}")
+                                # Add each narrator to the narrator table if not already there
+                                for ravi_id in ravi_ids:
+                                    actual_name = ravi_names.get(ravi_id, "")
+                                    
+                                    # If we can't get name from ravi_names, try extracting from hint data
+                                    if not actual_name and ravi_id in hint_data:
+                                        hint_parts = hint_data[ravi_id].split(",")
+                                        if hint_parts:
+                                            actual_name = hint_parts[0].strip()
+                                    
+                                    # Skip if we don't have an actual name after trying both sources
+                                    if not actual_name:
+                                        print(f"WARNING: Could not find name for narrator with ID {ravi_id}")
+                                        continue
+                                    
+                                    # Add narrator to the table if not already processed
+                                    if ravi_id not in processed_narrators:
+                                        narrator_writer.writerow([ravi_id, actual_name])
+                                        processed_narrators[ravi_id] = actual_name
+                                        print(f"Added narrator with ID {ravi_id}: {actual_name}")
+                                    else:
+                                        print(f"Using existing narrator with ID {ravi_id}: {processed_narrators[ravi_id]}")
+                                    
+                                    # Create chain entry linking this narrator to the sanad
+                                    chain_id = f"chain_{sanad_id}_{position}_{ravi_id}"
+                                    narrator_chain_writer.writerow([
+                                        chain_id,     # Primary key
+                                        sanad_id,     # Foreign key to sanad
+                                        ravi_id,      # Foreign key to narrator
+                                        position      # Position in the chain
+                                    ])
+                                    print(f"Added narrator chain entry for {ravi_id} at position {position}")
+                                    
+                                    # Process narrator details
+                                    if ravi_id not in processed_narrator_details:
+                                        # Titles, patronymic, sect, reliability, death records and evaluations in one pass
+                                        profile = extract_narrator_profile(rejal, ravi_id, evaluation_source=ravi_book_source)
+                                        
+                                        # Generate IDs for new records
+                                        details_id = f"details_{str(uuid.uuid4())[:8]}"
+                                        
+                                        # Write narrator details
+                                        narrator_details_writer.writerow([
+                                            details_id,
+                                            ravi_id,
+                                            profile["sect"],
+                                            profile["reliability"],
+                                            profile["titles"],
+                                            profile["patronymic"]
+                                        ])
+                                        
+                                        # Process death records and evaluations
+                                        process_narrator_evaluations_and_death(
+                                            ravi_id, 
+                                            profile, 
+                                            narrator_death_records_writer, 
+                                            narrator_evaluation_writer
+                                        )
+                                        
+                                        # Mark this narrator as processed for additional details
+                                        processed_narrator_details.add(ravi_id)
+                            
+                            # Skip to next narrator since we've handled all the special cases
+                            position += 1
+                            continue
+                        
+                        # For normal narrators (not special cases)
+                        for ravi_id in ravi_ids if ravi_ids else [None]:
+                            if ravi_id is None:
+                                # Generate a consistent ID for narrators without ravi_id
+                                narrator_id = f"gen_{hashlib.md5(narrator_name.encode()).hexdigest()[:8]}"
+                                actual_narrator_name = narrator_name
+                            else:
+                                # Use the ravi_id directly
+                                narrator_id = ravi_id
+                                actual_narrator_name = ravi_names.get(ravi_id, narrator_name)
+                            
+                            # Add entry to narrator table if not already processed
+                            if narrator_id not in processed_narrators:
+                                narrator_writer.writerow([narrator_id, actual_narrator_name])
+                                processed_narrators[narrator_id] = actual_narrator_name
+                                print(f"Added narrator with ID {narrator_id}: {actual_narrator_name}")
+                            else:
+                                print(f"Using existing narrator with ID {narrator_id}: {processed_narrators[narrator_id]}")
+                            
+                            # Create chain entry linking this narrator to the sanad
+                            chain_id = f"chain_{sanad_id}_{position}_{narrator_id}"
+                            narrator_chain_writer.writerow([
+                                chain_id,     # Primary key
+                                sanad_id,     # Foreign key to sanad
+                                narrator_id,  # Foreign key to narrator
+                                position      # Position in the chain
+                            ])
+                            
+                            # Process additional narrator details if we have a real ravi ID
+                            if ravi_id and ravi_id not in processed_narrator_details:
+                                # Titles, patronymic, sect, reliability, death records and evaluations in one pass
+                                profile = extract_narrator_profile(rejal, ravi_id, evaluation_source=ravi_book_source)
+                                
+                                # Generate IDs for new records
+                                details_id = f"details_{str(uuid.uuid4())[:8]}"
+                                
+                                # Write narrator details
+                                narrator_details_writer.writerow([
+                                    details_id,
+                                    ravi_id,
+                                    profile["sect"],
+                                    profile["reliability"],
+                                    profile["titles"],
+                                    profile["patronymic"]
+                                ])
+                                
+                                # Process death records and evaluations
+                                process_narrator_evaluations_and_death(
+                                    ravi_id, 
+                                    profile, 
+                                    narrator_death_records_writer, 
+                                    narrator_evaluation_writer
+                                )
+                                
+                                # Mark this narrator as processed for additional details
+                                processed_narrator_details.add(ravi_id)
+                            
+                            # Increment position for the next narrator in this chain
+                            position += 1
+                
+                print(f"Added {position-1} narrators to the chain for sanad #{sanad_list_num}")
+            
+            print(f"Successfully processed Hadith ID: {hadith_id_from_data}")
+        else:
+            print(f"No valid data found for Hadith ID: {hadith_id}")
+            with open(skipped_files_path, 'a', encoding='utf-8') as skipped_file:
+                skipped_file.write(f"hadith_{hadith_id}.json,No valid data found,{datetime.now().isoformat()}\n")
+    
+    return processed
+
+# Worker processes for extraction (1: extract in this process). Each worker
+# takes EXTRACT_CHUNK_SIZE hadiths at a time and returns the rows of all
+# tables; merge_partial_tables then applies the dedup maps chunk by chunk in
+# hadith order, so the tables get the same rows as a serial run
+EXTRACT_PROCESSES = 1
+EXTRACT_CHUNK_SIZE = 100
+
+# Tables without dedup, which make up most of the rows; workers hand them
+# back as CSV text so the main process only has to append it
+FORMATTED_IN_WORKER = {"reference", "sanad", "narrator_chain"}
+
+# Chunks handed to the workers ahead of the merge, per worker; the rest of
+# the folder is only read as chunks complete
+EXTRACT_CHUNKS_IN_FLIGHT = 2
+
+# Set in each worker process by init_extract_worker
+worker_context = {}
+
+# Module settings copied into the workers, which may have imported this module afresh (spawn)
+WORKER_SETTINGS = ["json_folder", "segment_folder", "RECORD_CACHE_SIZE", "TYPED_REJAL"]
+
+class PartialTable:
+    """A worker's rows for one table, collected through the writerow of a csv writer"""
+    def __init__(self):
+        self.rows = []
+        
+    def writerow(self, row):
+        self.rows.append(row)
+
+def init_extract_worker(settings, log_timestamp, existing_hadith_content_refs, skipped_files_path):
+    # Each worker logs to its own file instead of the console and the main log
+    sys.stdout = sys.stderr = open(f"hadith_processing_log_{log_timestamp}_worker{os.getpid()}.txt", 'w', encoding='utf-8')
+    globals().update(settings)
+    worker_context["existing_hadith_content_refs"] = existing_hadith_content_refs
+    worker_context["skipped_files_path"] = skipped_files_path
+
+def iter_chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def extract_chunk(hadith_files):
+    buffers = {name: io.StringIO() for name in FORMATTED_IN_WORKER}
+    tables = [csv.writer(buffers[name]) if name in buffers else PartialTable() for name in TABLES]
+    # Duplicates are only dropped within the chunk here; merge_partial_tables drops the rest
+    state = new_extraction_state({})
+    process_hadith_ids(hadith_files, tables, state, worker_context["existing_hadith_content_refs"],
+                       worker_context["skipped_files_path"])
+    sys.stdout.flush()
+    return [buffers[name].getvalue() if name in buffers else table.rows for name, table in zip(TABLES, tables)]
+
+def merge_partial_tables(tables, writers, csv_files, state):
+    """Write one chunk's rows, skipping books, contents, narrators and narrator details an earlier chunk wrote"""
+    (hadith_rows, book_rows, reference_text, sanad_text, narrator_rows, narrator_chain_text, narrator_details_rows,
+     narrator_death_records_rows, narrator_evaluation_rows, hadith_content_rows, special_narrator_relation_rows) = tables
+    (hadith_writer, book_writer, reference_writer, sanad_writer, narrator_writer, narrator_chain_writer,
+     narrator_details_writer, narrator_death_records_writer, narrator_evaluation_writer, hadith_content_writer,
+     special_narrator_relation_writer) = writers
+    
+    # Hadith rows point at the book and content IDs that were written first
+    book_ids = {}
+    for book_id, book_title in book_rows:
+        if book_title in state["books"]:
+            book_ids[book_id] = state["books"][book_title]
+        else:
+            state["books"][book_title] = book_id
+            book_writer.writerow([book_id, book_title])
+    
+    content_ids = {}
+    for content_id, content in hadith_content_rows:
+        if content in state["hadith_contents"]:
+            content_ids[content_id] = state["hadith_contents"][content]
+        else:
+            state["hadith_contents"][content] = content_id
+            hadith_content_writer.writerow([content_id, content])
+    
+    for row in hadith_rows:
+        row[2] = content_ids.get(row[2], row[2])
+        row[4] = book_ids.get(row[4], row[4])
+        hadith_writer.writerow(row)
+    
+    for name, text in (("reference", reference_text), ("sanad", sanad_text), ("narrator_chain", narrator_chain_text)):
+        csv_files[TABLES.index(name)].write(text)
+    
+    for narrator_id, narrator_name in narrator_rows:
+        if narrator_id not in state["narrators"]:
+            state["narrators"][narrator_id] = narrator_name
+            narrator_writer.writerow([narrator_id, narrator_name])
+    
+    # A narrator's death records and evaluations come with its details row
+    already_described = set()
+    for row in narrator_details_rows:
+        if row[1] in state["narrator_details"]:
+            already_described.add(row[1])
+        else:
+            state["narrator_details"].add(row[1])
+            narrator_details_writer.writerow(row)
+    narrator_death_records_writer.writerows(row for row in narrator_death_records_rows if row[1] not in already_described)
+    narrator_evaluation_writer.writerows(row for row in narrator_evaluation_rows if row[1] not in already_described)
+    
+    for row in special_narrator_relation_rows:
+        # Same key as process_hadith_ids: special name, hadith ID and sanad ID
+        special_key = f"{row[4]}_{row[2]}_{row[3]}"
+        if special_key not in state["special_narrators"]:
+            state["special_narrators"][special_key] = {"relation_id": row[0], "representative_ravi_id": row[5]}
+            special_narrator_relation_writer.writerow(row)
+
+def extract_parallel(hadith_files, writers, csv_files, state, existing_hadith_content_refs, skipped_files_path):
+    """Extract (hadith_id, path) pairs in worker processes; returns how many hadiths were processed"""
+    print(f"Extracting chunks of {EXTRACT_CHUNK_SIZE} hadiths with {EXTRACT_PROCESSES} worker processes")
+    print(f"Worker logs: hadith_processing_log_{timestamp}_worker<pid>.txt")
+    settings = {name: globals()[name] for name in WORKER_SETTINGS}
+    with ProcessPoolExecutor(max_workers=EXTRACT_PROCESSES, initializer=init_extract_worker,
+                             initargs=(settings, timestamp, existing_hadith_content_refs, skipped_files_path)) as executor:
+        # Chunks are merged in the order they were read, whichever worker finishes first;
+        # only a few are submitted ahead so the pairs are read from the folder as work frees up
+        pending = deque()
+        processed = merged = 0
+        for chunk in iter_chunks(hadith_files, EXTRACT_CHUNK_SIZE):
+            pending.append((len(chunk), executor.submit(extract_chunk, chunk)))
+            if len(pending) < EXTRACT_PROCESSES * EXTRACT_CHUNKS_IN_FLIGHT:
+                continue
+            size, future = pending.popleft()
+            merge_partial_tables(future.result(), writers, csv_files, state)
+            processed, merged = processed + size, merged + 1
+            if merged % 10 == 0:
+                print(f"Merged chunk {merged} ({processed} hadiths)")
+        while pending:
+            size, future = pending.popleft()
+            merge_partial_tables(future.result(), writers, csv_files, state)
+            processed, merged = processed + size, merged + 1
+        print(f"Merged {merged} chunks ({processed} hadiths)")
+    return processed
+
 # Main execution
 def main():
     print("Starting script execution...")
@@ -523,8 +886,8 @@ def main():
     with open(skipped_files_path, 'w', encoding='utf-8') as skipped_file:
         skipped_file.write("Filename,Reason,Timestamp\n")  # Write CSV header
     
-    # Check if the JSON file exists
-    if not os.path.exists(json_folder):
+    # Check if the JSON folder or a segment store exists
+    if not os.path.exists(json_folder) and get_segment_store() is None:
         logging.error(f"JSON folder does not exist: {json_folder}")
         print(f"❌ JSON folder does not exist: {json_folder}")
         return 1
@@ -558,432 +921,31 @@ def main():
             special_narrator_relation_writer = csv.writer(special_narrator_relation_csv)
             
             # Keep track of processed items
-            processed_books = {}
-            processed_narrators = {}
-            processed_narrator_details = set()  # We'll track by ravi_id only
-            processed_hadith_contents = existing_content_ids.copy()  # Start with existing content IDs
-            processed_special_narrators = {}  # Track special narrators by unique key
+            state = new_extraction_state(existing_content_ids)
             
             try:
                 print("\n" + "="*50)
                 print(f"Processing folder: {json_folder}")
                 
-                # Load data from folder
-                try:
-                    hadith_ids = extract_hadith_ids_from_files()
-                except Exception as e:
-                    print(f"Error extracting hadith IDs: {str(e)}")
-                    with open(skipped_files_path, 'a', encoding='utf-8') as skipped_file:
-                        skipped_file.write(f"{os.path.basename(json_folder)},Error extracting hadith IDs: {str(e)},{datetime.now().isoformat()}\n")
-                    return 1
+                # Hadiths are processed as the folder is read; nothing lists it up front
+                hadith_files = iter_hadith_files()
                 
-                # Process each hadith
-                for hadith_id in hadith_ids:
-                    print(f"\nProcessing Hadith ID: {hadith_id}")
-                    
-                    # Load data from file
-                    try:
-                        hadith_details = load_hadith_details(hadith_id)
-                        rejal_data = load_hadith_rejal(hadith_id)
-                    except Exception as e:
-                        print(f"Error loading data for Hadith ID {hadith_id}: {str(e)}")
-                        with open(skipped_files_path, 'a', encoding='utf-8') as skipped_file:
-                            skipped_file.write(f"hadith_{hadith_id}.json,Error loading data: {str(e)},{datetime.now().isoformat()}\n")
-                        continue
-                    
-                    # Process hadith data
-                    has_valid_data = False
-                    
-                    if "data" in hadith_details and hadith_details["data"]:
-                        hadith_entry = hadith_details["data"][0]
-                        
-                        # Generate a unique UUID for this hadith
-                        hadith_uuid = str(uuid.uuid4())
-                        
-                        # Extract hadith ID from data
-                        hadith_id_from_data = hadith_entry.get("id", "N/A")
-                        print(f"Found hadith with ID: {hadith_id_from_data}")
-                        
-                        # Extract content and clean HTML tags
-                        hadith_content = re.sub(r"</?[^>]+>", "", hadith_entry.get("text", "N/A"))
-                        
-                        # Check if this hadith ID already has a content reference (from previous runs)
-                        if hadith_id_from_data in existing_hadith_content_refs:
-                            hadith_content_id = existing_hadith_content_refs[hadith_id_from_data]
-                            print(f"Using existing content reference for hadith {hadith_id_from_data}: {hadith_content_id}")
-                        # Check if this hadith content already exists
-                        elif hadith_content in processed_hadith_contents:
-                            hadith_content_id = processed_hadith_contents[hadith_content]
-                            print(f"Using existing hadith content ID: {hadith_content_id}")
-                        else:
-                            # Generate a content ID with a UUID that is shorter but still unique
-                            short_uuid = str(uuid.uuid4()).split('-')[0]
-                            hadith_content_id = f"content_{short_uuid}"
-                            
-                            # Write content entry
-                            hadith_content_writer.writerow([hadith_content_id, hadith_content])
-                            processed_hadith_contents[hadith_content] = hadith_content_id
-                            print(f"Added new hadith content with ID: {hadith_content_id}")
-                        
-                        # Extract narrators and properly join them with comma
-                        qaelTitleList = hadith_entry.get("qaelTitleList", ["N/A"])
-                        originated_from = ", ".join(qaelTitleList) if isinstance(qaelTitleList, list) else qaelTitleList
-                        
-                        # Extract book details and create a unique book ID based on source
-                        book_title = hadith_entry.get("bookTitle", "Unknown Book")
-                        book_source_id = hadith_entry.get("sourceId", "unknown")
-                        
-                        # Extract page_num and volume for hadith table
-                        page_num = hadith_entry.get("pageNum", "N/A")
-                        volume = hadith_entry.get("vol", "N/A")
-                        
-                        # Create a unique book ID or use an existing one
-                        if book_title in processed_books:
-                            book_id = processed_books[book_title]
-                            print(f"Using existing book ID: {book_id} for book: {book_title}")
-                        else:
-                            # Generate a book ID based on source ID or create a UUID if none
-                            book_id = f"book_{book_source_id}" if book_source_id != "unknown" else f"book_{str(uuid.uuid4())[:8]}"
-                            
-                            # Write book entry only once - with just the title
-                            book_writer.writerow([book_id, book_title])
-                            processed_books[book_title] = book_id
-                            print(f"Added new book: {book_title} with ID: {book_id}")
-                        
-                        # Write hadith entry with proper book ID relationship, content ID reference, and page/volume
-                        hadith_writer.writerow([hadith_uuid, hadith_id_from_data, hadith_content_id, originated_from, book_id, page_num, volume])
-                        print(f"Wrote hadith entry with UUID: {hadith_uuid}")
-                        
-                        has_valid_data = True
-                        
-                        # Process references
-                        group_together_list = hadith_entry.get("groupTogetherList", [])
-                        print(f"Found {len(group_together_list)} references")
-                        
-                        for item in group_together_list:
-                            reference_hadith_id = item.get("hadithId", "N/A")
-                            
-                            # Skip self-references
-                            if reference_hadith_id == hadith_id_from_data:
-                                print(f"Skipping self-reference to {reference_hadith_id}")
-                                continue
-                            
-                            # Create reference entry directly from the data we have
-                            reference_id = f"ref_{str(uuid.uuid4())[:8]}"
-                            
-                            reference_writer.writerow([
-                                reference_id,                       # Unique reference ID
-                                hadith_uuid,                        # Foreign key to hadith
-                                reference_hadith_id,                # Referenced hadith ID
-                                item.get("vol", "N/A"),            # Volume
-                                item.get("pageNum", "N/A"),        # Page number
-                                item.get("sourceId", "N/A"),       # Source ID
-                                item.get("sourceMainTitle", "Unknown Source")  # Source title
-                            ])
-                            print(f"Added reference to hadith ID: {reference_hadith_id}")
-                        
-                        # Process Sanad (Narrator Chains) using the new logic
-                        sanad_lists = []
-                        if rejal_data and isinstance(rejal_data, dict):
-                            data = rejal_data.get("data", {})
-                            if isinstance(data, dict):
-                                sanad_lists = data.get("sanadList", [])
-                        
-                        print(f"Found {len(sanad_lists)} sanad entries")
-                        
-                        # Process each sanad (chain of narrators)
-                        for sanad_list_num, sanad_entry in enumerate(sanad_lists, start=1):
-                            # Generate unique sanad ID using a consistent format
-                            sanad_id = f"sanad_{hadith_id_from_data}_{sanad_list_num}"
-                            
-                            # Extract the sanad description based on the new logic
-                            sanad = sanad_entry.get("sanad", [])
-                            sanad_description = " ".join(item.get("title", "") for item in sanad if item.get("title"))
-                            
-                            # Write sanad entry with proper foreign key to hadith
-                            sanad_writer.writerow([
-                                sanad_id,           # Primary key
-                                hadith_uuid,        # Foreign key to hadith
-                                sanad_description,  # Full description
-                                sanad_list_num      # Number/position of this sanad
-                            ])
-                            print(f"Added sanad #{sanad_list_num} with description: {sanad_description[:50]}...")
-                            
-                            # Process each narrator in this sanad
-                            position = 1  # Track position within this sanad
-                            for sanad_item in sanad_entry.get("sanad", []):
-                                # Only process narrators (type=0 or type=4)
-                                if sanad_item.get("type") in [0, 4]:
-                                    narrator_name = sanad_item.get("title", "N/A")
-                                    
-                                    # Ensure we have a valid name
-                                    if narrator_name == "N/A":
-                                        continue
-                                    
-                                    # Extract all ravi IDs for this title
-                                    ravi_ids = []
-                                    ravi_names = {}  # Store actual narrator names by raviId
-                                    hint_data = {}   # Store hint data for each ravi_id
-                                    
-                                    if "raviList" in sanad_item:
-                                        for ravi_entry in sanad_item["raviList"]:
-                                            if "raviId" in ravi_entry:
-                                                ravi_id = ravi_entry.get("raviId")
-                                                ravi_ids.append(ravi_id)
-                                                
-                                                # Store hint data
-                                                if "hint" in ravi_entry:
-                                                    hint_data[ravi_id] = ravi_entry.get("hint", "")
-                                                    # Extract name from hint format "name,sect,reliability"
-                                                    hint_parts = hint_data[ravi_id].split(",")
-                                                    if len(hint_parts) > 0:
-                                                        ravi_names[ravi_id] = hint_parts[0]
-                                                        
-                                                # Look for the actual narrator name in the rejal data
-                                                for ravi in rejal_data.get("data", {}).get("raviList", []):
-                                                    if ravi.get("raviId") == ravi_id:
-                                                        actual_name = ravi.get("raviTitle", "")
-                                                        if actual_name:
-                                                            ravi_names[ravi_id] = actual_name
-                                    
-                                    # Log the found ravi IDs
-                                    if len(ravi_ids) > 1:
-                                        print(f"Found multiple raviIDs for '{narrator_name}': {ravi_ids}")
-                                        print(f"Actual narrator names: {ravi_names}")
-                                    elif len(ravi_ids) == 1:
-                                        print(f"Found single raviID for '{narrator_name}': {ravi_ids[0]}")
-                                        if ravi_ids[0] in ravi_names:
-                                            print(f"Actual narrator name: {ravi_names[ravi_ids[0]]}")
-                                    else:
-                                        print(f"No raviID found for '{narrator_name}'")
-                                    
-                                    # Determine if this is a special narrator based on criteria:
-                                    # 1. Name matches known special phrases like "أبيه", etc.
-                                    # 2. Multiple ravi IDs (e.g., "عدة من أصحابنا")
-                                    # 3. Title doesn't match hint (using word-based normalized comparison)
-                                    
-                                    special_name_patterns = [
-                                        "أبيه", "أبيها", "بعض أصحابنا", "بعض أصحابه", "بعضهم", "غيره", "غيرهم",
-                                        "من أخبره", "من حدثه", "الثقة من أصحاب", "عدة من أصحابنا", "أصحابنا"
-                                    ]
-                                    
-                                    # Check for explicit special name patterns
-                                    is_special_by_name = any(pattern in narrator_name for pattern in special_name_patterns)
-                                    
-                                    # Check if multiple ravi IDs - always a special case
-                                    is_special_by_multiple_ravis = len(ravi_ids) > 1
-                                    
-                                    # Check if title doesn't appear in hint
-                                    is_special_by_honorific = False
-                                    if len(ravi_ids) == 1:
-                                        ravi_id = ravi_ids[0]
-                                        if ravi_id in hint_data:
-                                            hint_text = hint_data[ravi_id]
-                                            
-                                            # Use the improved normalized comparison
-                                            if is_normal_narrator(narrator_name, hint_text):
-                                                print(f"NOT SPECIAL: '{narrator_name}' words found in hint '{hint_text}'")
-                                                is_special_by_honorific = False
-                                            else:
-                                                print(f"SPECIAL CASE: '{narrator_name}' words not found in hint '{hint_text}'")
-                                                is_special_by_honorific = True
-                                        else:
-                                            # No hint data but has ravi_id - check if it has honorifics
-                                            honorific_patterns = ["عليه السلام", "ع"]
-                                            if any(pattern in narrator_name for pattern in honorific_patterns):
-                                                is_special_by_honorific = True
-                                    
-                                    # Combined check for special narrator
-                                    is_special_narrator = is_special_by_name or is_special_by_multiple_ravis or is_special_by_honorific
-                                    
-                                    # Debug info
-                                    if is_special_narrator:
-                                        print(f"SPECIAL NARRATOR: '{narrator_name}' | By name: {is_special_by_name} | By multiple: {is_special_by_multiple_ravis} | By honorific: {is_special_by_honorific}")
-                                    
-                                    if is_special_narrator:
-                                        # Create a unique key for this special narrator type per hadith
-                                        special_key = f"{narrator_name}_{hadith_id_from_data}_{sanad_id}"
-                                        
-                                        # Only add one entry for this special narrator in the relation table
-                                        if special_key not in processed_special_narrators:
-                                            # Generate a relation ID
-                                            special_relation_id = f"special_rel_{hashlib.md5(special_key.encode()).hexdigest()[:8]}"
-                                            
-                                            # Find a representative ravi_id to use for joining
-                                            representative_ravi_id = ravi_ids[0] if ravi_ids else ""
-                                            
-                                            # Track this special narrator
-                                            processed_special_narrators[special_key] = {
-                                                "relation_id": special_relation_id,
-                                                "ravi_ids": ravi_ids.copy(),  # Store all related ravi_ids
-                                                "representative_ravi_id": representative_ravi_id  # Store the representative ravi_id
-                                            }
-                                            
-                                            # Add the special relation entry (only once per hadith)
-                                            special_narrator_relation_writer.writerow([
-                                                special_relation_id,
-                                                hadith_uuid,
-                                                hadith_id_from_data,
-                                                sanad_id,
-                                                narrator_name,  # The special name (e.g., "أبيه" or "عدة من أصحابنا")
-                                                representative_ravi_id  # Store representative ravi_id for joining/mapping
-                                            ])
-                                            print(f"Added special relation for '{narrator_name}' in hadith {hadith_id_from_data} with representative ravi_id: {representative_ravi_id}")
-                                            
-                                        # Now add all the actual narrators to the narrator table and link them
-                                        special_relation_id = processed_special_narrators[special_key]["relation_id"]
-                                        
-                                        # Process all the narrators associated with this special relation
-                                        if len(ravi_ids) > 0:
-                                            print(f">>> Processing {len(ravi_ids)} narrators for special case '{narrator_name}': {[ravi_names.get(rid, rid) for rid in ravi_ids]}")
-                                            # Add each narrator to the narrator table if not already there
-                                            for ravi_id in ravi_ids:
-                                                actual_name = ravi_names.get(ravi_id, "")
-                                                
-                                                # If we can't get name from ravi_names, try extracting from hint data
-                                                if not actual_name and ravi_id in hint_data:
-                                                    hint_parts = hint_data[ravi_id].split(",")
-                                                    if hint_parts:
-                                                        actual_name = hint_parts[0].strip()
-                                                
-                                                # Skip if we don't have an actual name after trying both sources
-                                                if not actual_name:
-                                                    print(f"WARNING: Could not find name for narrator with ID {ravi_id}")
-                                                    continue
-                                                
-                                                # Add narrator to the table if not already processed
-                                                if ravi_id not in processed_narrators:
-                                                    narrator_writer.writerow([ravi_id, actual_name])
-                                                    processed_narrators[ravi_id] = actual_name
-                                                    print(f"Added narrator with ID {ravi_id}: {actual_name}")
-                                                else:
-                                                    print(f"Using existing narrator with ID {ravi_id}: {processed_narrators[ravi_id]}")
-                                                
-                                                # Create chain entry linking this narrator to the sanad
-                                                chain_id = f"chain_{sanad_id}_{position}_{ravi_id}"
-                                                narrator_chain_writer.writerow([
-                                                    chain_id,     # Primary key
-                                                    sanad_id,     # Foreign key to sanad
-                                                    ravi_id,      # Foreign key to narrator
-                                                    position      # Position in the chain
-                                                ])
-                                                print(f"Added narrator chain entry for {ravi_id} at position {position}")
-                                                
-                                                # Process narrator details
-                                                if ravi_id not in processed_narrator_details:
-                                                    # Extract narrator titles
-                                                    titles = extract_narrator_titles(rejal_data, ravi_id)
-                                                    
-                                                    # Extract narrator patronymic
-                                                    patronymic = extract_narrator_patronymic(rejal_data, ravi_id)
-                                                    
-                                                    # Extract sect and reliability
-                                                    sect_reliability = extract_narrator_sect_reliability(rejal_data, ravi_id)
-                                                    
-                                                    # Generate IDs for new records
-                                                    details_id = f"details_{str(uuid.uuid4())[:8]}"
-                                                    
-                                                    # Write narrator details
-                                                    narrator_details_writer.writerow([
-                                                        details_id,
-                                                        ravi_id,
-                                                        sect_reliability.get("sect", ""),
-                                                        sect_reliability.get("reliability", ""),
-                                                        titles,
-                                                        patronymic
-                                                    ])
-                                                    
-                                                    # Process death records and evaluations
-                                                    process_narrator_evaluations_and_death(
-                                                        ravi_id, 
-                                                        rejal_data, 
-                                                        narrator_death_records_writer, 
-                                                        narrator_evaluation_writer
-                                                    )
-                                                    
-                                                    # Mark this narrator as processed for additional details
-                                                    processed_narrator_details.add(ravi_id)
-                                        
-                                        # Skip to next narrator since we've handled all the special cases
-                                        position += 1
-                                        continue
-                                    
-                                    # For normal narrators (not special cases)
-                                    for ravi_id in ravi_ids if ravi_ids else [None]:
-                                        if ravi_id is None:
-                                            # Generate a consistent ID for narrators without ravi_id
-                                            narrator_id = f"gen_{hashlib.md5(narrator_name.encode()).hexdigest()[:8]}"
-                                            actual_narrator_name = narrator_name
-                                        else:
-                                            # Use the ravi_id directly
-                                            narrator_id = ravi_id
-                                            actual_narrator_name = ravi_names.get(ravi_id, narrator_name)
-                                        
-                                        # Add entry to narrator table if not already processed
-                                        if narrator_id not in processed_narrators:
-                                            narrator_writer.writerow([narrator_id, actual_narrator_name])
-                                            processed_narrators[narrator_id] = actual_narrator_name
-                                            print(f"Added narrator with ID {narrator_id}: {actual_narrator_name}")
-                                        else:
-                                            print(f"Using existing narrator with ID {narrator_id}: {processed_narrators[narrator_id]}")
-                                        
-                                        # Create chain entry linking this narrator to the sanad
-                                        chain_id = f"chain_{sanad_id}_{position}_{narrator_id}"
-                                        narrator_chain_writer.writerow([
-                                            chain_id,     # Primary key
-                                            sanad_id,     # Foreign key to sanad
-                                            narrator_id,  # Foreign key to narrator
-                                            position      # Position in the chain
-                                        ])
-                                        
-                                        # Process additional narrator details if we have a real ravi ID
-                                        if ravi_id and ravi_id not in processed_narrator_details:
-                                            # Extract narrator titles
-                                            titles = extract_narrator_titles(rejal_data, ravi_id)
-                                            
-                                            # Extract narrator patronymic
-                                            patronymic = extract_narrator_patronymic(rejal_data, ravi_id)
-                                            
-                                            # Extract sect and reliability
-                                            sect_reliability = extract_narrator_sect_reliability(rejal_data, ravi_id)
-                                            
-                                            # Generate IDs for new records
-                                            details_id = f"details_{str(uuid.uuid4())[:8]}"
-                                            
-                                            # Write narrator details
-                                            narrator_details_writer.writerow([
-                                                details_id,
-                                                ravi_id,
-                                                sect_reliability.get("sect", ""),
-                                                sect_reliability.get("reliability", ""),
-                                                titles,
-                                                patronymic
-                                            ])
-                                            
-                                            # Process death records and evaluations
-                                            process_narrator_evaluations_and_death(
-                                                ravi_id, 
-                                                rejal_data, 
-                                                narrator_death_records_writer, 
-                                                narrator_evaluation_writer
-                                            )
-                                            
-                                            # Mark this narrator as processed for additional details
-                                            processed_narrator_details.add(ravi_id)
-                                        
-                                        # Increment position for the next narrator in this chain
-                                        position += 1
-                            
-                            print(f"Added {position-1} narrators to the chain for sanad #{sanad_list_num}")
-                        
-                        print(f"Successfully processed Hadith ID: {hadith_id_from_data}")
-                    else:
-                        print(f"No valid data found for Hadith ID: {hadith_id}")
-                        with open(skipped_files_path, 'a', encoding='utf-8') as skipped_file:
-                            skipped_file.write(f"hadith_{hadith_id}.json,No valid data found,{datetime.now().isoformat()}\n")
+                # Process each hadith, in worker processes when EXTRACT_PROCESSES > 1
+                writers = [hadith_writer, book_writer, reference_writer, sanad_writer, narrator_writer,
+                           narrator_chain_writer, narrator_details_writer, narrator_death_records_writer,
+                           narrator_evaluation_writer, hadith_content_writer, special_narrator_relation_writer]
+                if EXTRACT_PROCESSES > 1:
+                    csv_files = [hadith_csv, book_csv, reference_csv, sanad_csv, narrator_csv, narrator_chain_csv,
+                                 narrator_details_csv, narrator_death_records_csv, narrator_evaluation_csv,
+                                 hadith_content_csv, special_narrator_relation_csv]
+                    total = extract_parallel(hadith_files, writers, csv_files, state, existing_hadith_content_refs,
+                                             skipped_files_path)
+                else:
+                    total = process_hadith_ids(hadith_files, writers, state, existing_hadith_content_refs,
+                                               skipped_files_path)
             
                 print(f"\nFinished processing all hadith files.")
-                print(f"Total hadiths processed: {len(hadith_ids)}")
+                print(f"Total hadiths processed: {total}")
             
             except Exception as e:
                 logging.error(f"Error processing folder: {str(e)}")
@@ -1018,6 +980,9 @@ def main():
         traceback.print_exc()
         return 1
 
+    print(f"Parsed record cache: {record_cache_stats['hits']} hits, {record_cache_stats['misses']} misses")
+    print(f"Arabic normalization cache: {format_cache_stats()}")
+    print(f"Narrator classifier: {get_classifier().format_cache_stats()}")
     print(f"\nAll output has been saved to: {log_file_path}")
     print(f"Skipped files log saved to: {skipped_files_path}")
     return 0
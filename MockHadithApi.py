@@ -0,0 +1,406 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Paths served, matching the real hadith.inoor.ir API
+DETAILS_PATH = "/service/api/elastic/ElasticHadithById"
+REJAL_PATH = "/service/api/hadith/HadithRejalList/v2"
+LIST_PATH = "/service/api/elastic/ElasticHadithList"
+STATS_PATH = "/mock/stats"
+RESET_PATH = "/mock/reset"
+
+def parse_latency(spec):
+    """Turn a latency spec into a function returning seconds.
+
+    Supported specs: "fixed:0.05", "uniform:0.02,0.2", "exponential:0.08"
+    (mean), "lognormal:0.08,0.5" (median, sigma) and "none".
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "none":
+        return lambda rng: 0.0
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class SyntheticCorpus:
+    """Generates hadith and rejal responses from the hadith ID alone.
+
+    The same ID always gives the same response. Narrators come from a fixed
+    pool so the crawler sees the repeats it sees on the real site.
+    """
+
+    def __init__(self, seed=0, sanad_count=2, sanad_length=5, narrator_pool=500, group_size=3,
+                 list_size=5000, list_start=1000):
+        self.seed = seed
+        self.sanad_count = sanad_count
+        self.sanad_length = sanad_length
+        self.narrator_pool = narrator_pool
+        self.group_size = group_size
+        self.list_size = list_size
+        self.list_start = list_start
+
+    def list_ids(self):
+        """IDs shown by the hadith list view, in list order"""
+        return [str(self.list_start + offset) for offset in range(self.list_size)]
+
+    def rng(self, hadith_id):
+        return random.Random(f"{self.seed}:{hadith_id}")
+
+    def details_entry(self, hadith_id):
+        rng = self.rng(hadith_id)
+        source_id = rng.randint(1, 50)
+        group = [str(hadith_id)] + [str(int(hadith_id) + rng.randint(1, 5000)) for _ in range(self.group_size - 1)]
+        return {
+            "id": str(hadith_id),
+            "textSample": f"حديث {hadith_id}",
+            "text": f"<Hadith>متن الحديث رقم {hadith_id} " + "قال " * rng.randint(20, 200) + "</Hadith>",
+            "bookTitle": f"كتاب {source_id}",
+            "sourceId": source_id,
+            "vol": rng.randint(1, 10),
+            "pageNum": rng.randint(1, 600),
+            "qaelTitleList": [f"الإمام {rng.randint(1, 12)}"],
+            "groupTogetherList": [
+                {"hadithId": group_id, "sourceId": source_id, "sourceMainTitle": f"كتاب {source_id}",
+                 "vol": rng.randint(1, 10), "pageNum": rng.randint(1, 600)}
+                for group_id in group
+            ],
+        }
+
+    def narrator(self, ravi_id):
+        rng = random.Random(f"{self.seed}:ravi:{ravi_id}")
+        book = [{"bookName": f"رجال {rng.randint(1, 20)}"}]
+        return {
+            "raviId": ravi_id,
+            "infoList": [
+                {"title": "لقب", "text": [{"text": f"لقب {ravi_id}", "bookName": book}]},
+                {"title": "کنيه", "text": [{"text": f"أبو {ravi_id}", "bookName": book}]},
+                {"title": "وفات", "text": [{"text": str(rng.randint(100, 400)), "bookName": book}]},
+            ],
+            "infoList2": [
+                {"title": "نتيجه ارزيابي", "text": ["امامي", ", ثقه"]},
+                {"title": "جمع بندي ارزيابي", "text": "ثقة"},
+                {"title": "الفاظ جرح و تعدیل", "text": [{"text": "ثقة ثقة", "bookName": book}]},
+            ],
+        }
+
+    def rejal(self, hadith_id):
+        rng = self.rng(hadith_id)
+        sanad_list = []
+        ravi_ids = []
+        for _ in range(self.sanad_count):
+            sanad = []
+            for _ in range(self.sanad_length):
+                ravi_id = rng.randint(1, self.narrator_pool)
+                ravi_ids.append(ravi_id)
+                sanad.append({"title": f"راوي {ravi_id}", "type": 0, "raviList": [{"raviId": ravi_id}]})
+                sanad.append({"title": "عن", "type": 1, "raviList": []})
+            sanad_list.append({"sanad": sanad})
+        return {"data": {"sanadList": sanad_list,
+                         "raviList": [self.narrator(ravi_id) for ravi_id in dict.fromkeys(ravi_ids)]}}
+
+class RecordedCorpus:
+    """Serves responses recorded by ResponseFetchingScript (segment folder or JSON folder).
+
+    IDs that were never recorded are answered by the fallback corpus, or
+    left out of the response like unknown IDs on the real API.
+    """
+
+    def __init__(self, source, fallback=None):
+        self.fallback = fallback
+        self.reader = None
+        self.files = {}
+        from SegmentStore import SegmentReader, list_segments
+        if list_segments(source):
+            self.reader = SegmentReader(source)
+        else:
+            pattern = re.compile(r'hadith_(\d+)\.json$')
+            with os.scandir(source) as entries:
+                for entry in entries:
+                    match = pattern.match(entry.name)
+                    if match:
+                        self.files[match.group(1)] = entry.path
+
+    def record(self, hadith_id):
+        hadith_id = str(hadith_id)
+        if self.reader is not None:
+            return self.reader.get(hadith_id)
+        if hadith_id in self.files:
+            with open(self.files[hadith_id], "r", encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+    def list_ids(self):
+        if self.reader is not None:
+            ids = list(self.reader.ids())
+        else:
+            ids = list(self.files)
+        if not ids and self.fallback:
+            return self.fallback.list_ids()
+        return sorted(ids, key=lambda hadith_id: (len(hadith_id), hadith_id))
+
+    def details_entry(self, hadith_id):
+        record = self.record(hadith_id)
+        if record is not None:
+            entries = (record.get("hadith_details") or {}).get("data") or []
+            return entries[0] if entries else None
+        return self.fallback.details_entry(hadith_id) if self.fallback else None
+
+    def rejal(self, hadith_id):
+        record = self.record(hadith_id)
+        if record is not None:
+            return record.get("hadith_rejal_list")
+        return self.fallback.rejal(hadith_id) if self.fallback else {"data": {"sanadList": [], "raviList": []}}
+
+class MockApiConfig:
+    """Fault and load behaviour of the mock server.
+
+    error_rate and throttle_rate are the chances that a request is answered
+    with a 500 or a 429. rate_limit caps each endpoint at that many requests
+    per second; requests over the limit get a 429 with Retry-After.
+    """
+
+    def __init__(self, latency="lognormal:0.08,0.4", per_id_latency=0.002, error_rate=0.0,
+                 throttle_rate=0.0, rate_limit=None, max_batch=100, seed=0):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.per_id_latency = per_id_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.max_batch = max_batch
+        self.seed = seed
+
+class MockApiState:
+    """Server-side counters plus the per-endpoint rate limit buckets"""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.buckets = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.statuses = Counter()
+            self.ids_requested = Counter()
+            self.ids_seen = {"details": set(), "rejal": set()}
+            self.repeats = Counter()
+
+    def draw(self):
+        with self.lock:
+            return self.rng.random(), self.config.latency(self.rng)
+
+    def over_rate_limit(self, endpoint):
+        if not self.config.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(endpoint, (self.config.rate_limit, now))
+            tokens = min(self.config.rate_limit, tokens + (now - last) * self.config.rate_limit)
+            if tokens < 1:
+                self.buckets[endpoint] = (tokens, now)
+                return True
+            self.buckets[endpoint] = (tokens - 1, now)
+            return False
+
+    def count(self, endpoint, status, hadith_ids):
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.statuses[f"{endpoint}:{status}"] += 1
+            for hadith_id in hadith_ids:
+                self.ids_requested[endpoint] += 1
+                # Any ID asked for a second time is a retry or a refetch by the crawler
+                if hadith_id in self.ids_seen[endpoint]:
+                    self.repeats[endpoint] += 1
+                else:
+                    self.ids_seen[endpoint].add(hadith_id)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "statuses": dict(self.statuses),
+                "ids_requested": dict(self.ids_requested),
+                "unique_ids": {endpoint: len(ids) for endpoint, ids in self.ids_seen.items()},
+                "repeated_ids": dict(self.repeats),
+            }
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this each response waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def inject_faults(self, endpoint, hadith_ids):
+        """Sleep for the simulated latency and answer with a fault if one is drawn; True if answered"""
+        state = self.server.state
+        config = state.config
+        if state.over_rate_limit(endpoint):
+            state.count(endpoint, 429, hadith_ids)
+            self.send_json(429, {"message": "Too many requests"}, {"Retry-After": "1"})
+            return True
+        roll, latency = state.draw()
+        time.sleep(latency + config.per_id_latency * len(hadith_ids))
+        if roll < config.throttle_rate:
+            state.count(endpoint, 429, hadith_ids)
+            self.send_json(429, {"message": "Too many requests"}, {"Retry-After": "1"})
+            return True
+        if roll < config.throttle_rate + config.error_rate:
+            state.count(endpoint, 500, hadith_ids)
+            self.send_json(500, {"message": "Internal server error"})
+            return True
+        return False
+
+    def send_list_page(self, body):
+        """One page of the hadith list view: {"data": [{"id": ...}], "totalCount": N}"""
+        try:
+            request = json.loads(body)
+            page_number = max(1, int(request.get("pageNumber", 1)))
+            page_size = max(1, int(request.get("pageSize", 60)))
+        except (ValueError, AttributeError, TypeError):
+            self.send_json(400, {"message": "Invalid body"})
+            return
+        if self.inject_faults("list", []):
+            return
+        # The corpus lists are small enough to slice on every request
+        ids = self.server.corpus.list_ids()
+        page = ids[(page_number - 1) * page_size:page_number * page_size]
+        self.server.state.count("list", 200, [])
+        self.send_json(200, {"data": [{"id": hadith_id, "pageNumber": page_number} for hadith_id in page],
+                             "totalCount": len(ids)})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if path == LIST_PATH:
+            self.send_list_page(body)
+            return
+        if path != DETAILS_PATH:
+            self.send_json(404, {"message": "Not found"})
+            return
+        try:
+            hadith_ids = [str(hadith_id) for hadith_id in json.loads(body).get("hadithId", [])]
+        except (ValueError, AttributeError):
+            self.send_json(400, {"message": "Invalid body"})
+            return
+        if len(hadith_ids) > self.server.state.config.max_batch:
+            self.server.state.count("details", 413, hadith_ids)
+            self.send_json(413, {"message": "Too many IDs"})
+            return
+        if self.inject_faults("details", hadith_ids):
+            return
+        entries = [self.server.corpus.details_entry(hadith_id) for hadith_id in hadith_ids]
+        self.server.state.count("details", 200, hadith_ids)
+        self.send_json(200, {"data": [entry for entry in entries if entry]})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == STATS_PATH:
+            self.send_json(200, self.server.state.stats())
+            return
+        if url.path == RESET_PATH:
+            self.server.state.reset()
+            self.send_json(200, {"reset": True})
+            return
+        if url.path != REJAL_PATH:
+            self.send_json(404, {"message": "Not found"})
+            return
+        hadith_id = parse_qs(url.query).get("hadithId", [""])[0]
+        if self.inject_faults("rejal", [hadith_id]):
+            return
+        self.server.state.count("rejal", 200, [hadith_id])
+        self.send_json(200, self.server.corpus.rejal(hadith_id))
+
+class MockApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, corpus, config):
+        super().__init__(address, MockApiHandler)
+        self.corpus = corpus
+        self.state = MockApiState(config)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def start_mock_server(corpus=None, config=None, host="127.0.0.1", port=0):
+    """Start the mock API on a background thread; port 0 picks a free port (see server.base_url)"""
+    server = MockApiServer((host, port), corpus or SyntheticCorpus(), config or MockApiConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:0.08,0.4",
+                        help="Latency distribution: none, fixed:S, uniform:A,B, exponential:MEAN, lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--per-id-latency", type=float, default=0.002,
+                        help="Extra seconds per hadith ID in a details request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="Requests per second allowed per endpoint before answering 429")
+    parser.add_argument("--fixtures", default=None,
+                        help="Segment folder or JSON folder with recorded responses (synthetic data otherwise)")
+    parser.add_argument("--list-size", type=int, default=5000,
+                        help="Number of synthetic hadiths in the paged list view")
+    parser.add_argument("--seed", type=int, default=0)
+
+def mock_from_args(args):
+    synthetic = SyntheticCorpus(seed=args.seed, list_size=args.list_size)
+    corpus = RecordedCorpus(args.fixtures, fallback=synthetic) if args.fixtures else synthetic
+    config = MockApiConfig(args.latency, args.per_id_latency, args.error_rate,
+                           args.throttle_rate, args.rate_limit, seed=args.seed)
+    return corpus, config
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the hadith.inoor.ir API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    corpus, config = mock_from_args(args)
+    server = MockApiServer((args.host, args.port), corpus, config)
+    print(f"Mock hadith API listening on {server.base_url}")
+    print(f"Crawl it with: HADITH_API_BASE={server.base_url} python ResponseFetchingScript.py")
+    print(f"Server counters: {server.base_url}{STATS_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import os
+from collections import deque
+from functools import lru_cache
+
+# Classifies sanad narrator titles by the special phrases they contain.
+#
+# Every phrase is compiled into one Aho-Corasick automaton, so a title is
+# scanned once whatever the number of phrases, and the result is cached per
+# distinct title. The phrases are read from a pattern file (one
+# "category<TAB>phrase" per line) so new ones don't need a code change.
+
+# Titles standing for an unnamed or grouped narrator ("أبيه", "عدة من أصحابنا")
+SPECIAL_NAME = "special_name"
+# Honorifics marking a title that refers to an Imam rather than the hinted narrator
+HONORIFIC = "honorific"
+CATEGORIES = [SPECIAL_NAME, HONORIFIC]
+
+# Pattern file used by default; HADITH_NARRATOR_PATTERNS overrides it
+PATTERN_FILE = os.environ.get("HADITH_NARRATOR_PATTERNS",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "special_narrator_patterns.txt"))
+
+# Used when the pattern file is missing
+DEFAULT_PATTERNS = [(SPECIAL_NAME, phrase) for phrase in [
+    "أبيه", "أبيها", "بعض أصحابنا", "بعض أصحابه", "بعضهم", "غيره", "غيرهم",
+    "من أخبره", "من حدثه", "الثقة من أصحاب", "عدة من أصحابنا", "أصحابنا"
+]] + [(HONORIFIC, phrase) for phrase in ["عليه السلام", "ع"]]
+
+# Distinct titles whose categories are kept
+CLASSIFIER_CACHE_SIZE = 65536
+
+def load_patterns(path=None):
+    """Read (category, phrase) pairs from a pattern file; blank lines and # comments are skipped"""
+    path = path or PATTERN_FILE
+    if not os.path.exists(path):
+        print(f"Narrator pattern file not found, using the built-in patterns: {path}")
+        return list(DEFAULT_PATTERNS)
+    patterns = []
+    with open(path, encoding='utf-8-sig') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            category, _, phrase = line.partition("\t")
+            category, phrase = category.strip(), phrase.strip()
+            if category not in CATEGORIES or not phrase:
+                raise ValueError(f"{path}:{line_number}: expected one of {CATEGORIES}, a tab and a phrase, got {line!r}")
+            patterns.append((category, phrase))
+    return patterns
+
+class NarratorClassifier:
+    """Aho-Corasick matcher from narrator titles to the categories of the phrases they contain"""
+
+    def __init__(self, patterns, cache_size=CLASSIFIER_CACHE_SIZE):
+        self.patterns = list(patterns)
+        # State 0 is the root; each state has its transitions, failure link and matched categories
+        self.transitions = [{}]
+        self.outputs = [set()]
+        for category, phrase in self.patterns:
+            state = 0
+            for char in phrase:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.outputs.append(set())
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            self.outputs[state].add(category)
+
+        self.failure = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.failure[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.failure[fallback]
+                self.failure[next_state] = self.transitions[fallback].get(char, 0)
+                # A phrase ending here also ends every phrase that is a suffix of it
+                self.outputs[next_state] |= self.outputs[self.failure[next_state]]
+        self.outputs = [frozenset(categories) for categories in self.outputs]
+        self.categories = lru_cache(maxsize=cache_size)(self.match)
+
+    def match(self, title):
+        """The categories of every phrase occurring in title, in one pass over it"""
+        found = set()
+        state = 0
+        for char in title:
+            while state and char not in self.transitions[state]:
+                state = self.failure[state]
+            state = self.transitions[state].get(char, 0)
+            if self.outputs[state]:
+                found |= self.outputs[state]
+        return frozenset(found)
+
+    def format_cache_stats(self):
+        info = self.categories.cache_info()
+        return f"{len(self.patterns)} patterns, {info.hits} hits, {info.misses} misses, {info.currsize} titles cached"
+
+default_classifier = None
+
+def get_classifier():
+    """The classifier for PATTERN_FILE, built on first use"""
+    global default_classifier
+    if default_classifier is None:
+        default_classifier = NarratorClassifier(load_patterns())
+    return default_classifier
@@ -0,0 +1,124 @@
+from RejalIndex import rejal_index
+
+# Builds everything the CSV tables need about one narrator in a single walk
+# over each raviList entry's infoList and infoList2. The per-field extractors
+# this replaces walked both lists once per field.
+
+TITLE = "لقب"
+PATRONYMIC = "کنيه"
+DEATH_TITLES = ("وفات", "تاريخ وفات")
+SECT_RELIABILITY = "نتيجه ارزيابي"
+EVALUATION_SUMMARY = "جمع بندي ارزيابي"
+EVALUATION_TERMS = "الفاظ جرح و تعدیل"
+
+def book_name_source(book_item):
+    """Evaluation source as the book name alone (CurrentWorkingScript2)"""
+    if isinstance(book_item, dict) and "bookName" in book_item:
+        return book_item["bookName"]
+    return None
+
+def ravi_book_source(book_item):
+    """Evaluation source as "raviTitle (bookName)" (LocalMachineScriptExtraction)"""
+    if not isinstance(book_item, dict):
+        return None
+    book_title = book_item.get("bookName", "")
+    ravi_title = book_item.get("raviTitle", "")
+    return f"{ravi_title} ({book_title})" if ravi_title and book_title else ravi_title or book_title
+
+def format_with_books(info, values):
+    # "text(book, book)" for every text entry that has text
+    for text_entry in info.get("text", []):
+        book_names = []
+        for book in text_entry.get("bookName", []):
+            book_name = book.get("bookName", "")
+            if book_name:
+                book_names.append(book_name)
+        
+        text = text_entry.get("text", "")
+        if text:
+            values.append(f"{text}({', '.join(book_names)})")
+
+def add_title(profile, info, evaluation_source):
+    format_with_books(info, profile["titles"])
+
+def add_patronymic(profile, info, evaluation_source):
+    format_with_books(info, profile["patronymic"])
+
+def add_death_records(profile, info, evaluation_source):
+    for entry in info.get("text", []):
+        if isinstance(entry, dict):
+            death_year = entry.get("text", "").strip()
+            book_names = []
+            if "bookName" in entry:
+                for book_item in entry.get("bookName", []):
+                    if isinstance(book_item, dict) and "bookName" in book_item:
+                        book_names.append(book_item["bookName"])
+            
+            source = ", ".join(book_names)
+            if death_year or source:  # Only add if we have data
+                profile["death_records"].append({"death_year": death_year, "source": source})
+
+def set_sect_reliability(profile, info, evaluation_source):
+    # The first non-empty "sect, reliability" wins
+    text_entries = info.get("text", [])
+    if profile["sect"] is None and text_entries:
+        words = "".join(text_entries).replace(" ,", ",").split(", ")
+        profile["sect"] = words[0] if len(words) > 0 else ""
+        profile["reliability"] = words[1] if len(words) > 1 else ""
+
+def set_summary(profile, info, evaluation_source):
+    text = info.get("text", "")
+    if profile["summary"] is None and text:
+        profile["summary"] = text
+
+def add_evaluations(profile, info, evaluation_source):
+    for entry in info.get("text", []):
+        text_value = entry.get("text", "")
+        sources = []
+        if "bookName" in entry:
+            for book_item in entry["bookName"]:
+                source = evaluation_source(book_item)
+                if source is not None:
+                    sources.append(source)
+        
+        if text_value:  # Only add if there's evaluation text
+            profile["evaluations"].append({"text": text_value, "sources": sources})
+
+# Handlers by info title, one table per list
+INFO_HANDLERS = {
+    TITLE: add_title,
+    PATRONYMIC: add_patronymic,
+    **{title: add_death_records for title in DEATH_TITLES},
+}
+INFO2_HANDLERS = {
+    SECT_RELIABILITY: set_sect_reliability,
+    EVALUATION_SUMMARY: set_summary,
+    EVALUATION_TERMS: add_evaluations,
+}
+
+# Titles also matched with surrounding whitespace, as the old extractors did
+STRIPPED_INFO2_HANDLERS = {SECT_RELIABILITY: set_sect_reliability}
+
+def walk_info(profile, infos, handlers, stripped_handlers, evaluation_source):
+    for info in infos:
+        title = info.get("title", "")
+        handler = handlers.get(title)
+        if handler is None and stripped_handlers:
+            handler = stripped_handlers.get(title.strip())
+        if handler is not None:
+            handler(profile, info, evaluation_source)
+
+def extract_narrator_profile(rejal_data, ravi_id, evaluation_source=book_name_source):
+    """Titles, patronymic, sect, reliability, death records, evaluation summary and
+    evaluations of ravi_id, from rejal data or a RejalIndex built from it"""
+    profile = {"titles": [], "patronymic": [], "sect": None, "reliability": "", "death_records": [],
+               "summary": None, "evaluations": []}
+    for ravi in rejal_index(rejal_data).entries(ravi_id):
+        walk_info(profile, ravi.get("infoList", []), INFO_HANDLERS, None, evaluation_source)
+        walk_info(profile, ravi.get("infoList2", []), INFO2_HANDLERS, STRIPPED_INFO2_HANDLERS, evaluation_source)
+    
+    profile["titles"] = " | ".join(profile["titles"])
+    profile["patronymic"] = " | ".join(profile["patronymic"])
+    profile["sect"] = profile["sect"] or ""
+    profile["summary"] = profile["summary"] or ""
+    return profile
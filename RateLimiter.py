@@ -0,0 +1,144 @@
+import time
+import logging
+import threading
+from collections import deque
+
+# Per-endpoint request budgets in requests per second. Each bucket starts at
+# "rate", climbs towards "max_rate" while responses stay healthy and never
+# drops below "min_rate" when the server pushes back.
+DEFAULT_BUDGETS = {
+    "details": {"rate": 1.0, "min_rate": 0.2, "max_rate": 10.0},
+    "rejal": {"rate": 1.0, "min_rate": 0.2, "max_rate": 10.0},
+}
+
+# Window used to measure the actual request rate
+RATE_WINDOW_SECONDS = 10.0
+
+class TokenBucket:
+    """Token bucket for one endpoint whose refill rate adapts to server health.
+
+    Healthy responses raise the rate additively by increase_step, while a 429,
+    a 5xx, a network error or a latency spike above latency_factor times the
+    running baseline multiplies it by decrease_factor. After a cut the rate is
+    held for cooldown seconds so one burst of failures only counts once.
+    """
+
+    def __init__(self, name, rate=1.0, min_rate=0.2, max_rate=10.0, burst=1.0,
+                 increase_step=0.05, decrease_factor=0.5, latency_factor=3.0, cooldown=2.0):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.burst = max(1.0, burst)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.hold_until = 0.0
+        self.latency_baseline = None
+        self.latency_samples = 0
+
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.backoffs = 0
+        self.recent = deque()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return how long the caller must wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+
+            # Tokens may go negative; the debt is paid off by waiting
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+            self.acquired += 1
+            self.total_wait += wait
+            self.recent.append(now + wait)
+            while self.recent and self.recent[0] < now - RATE_WINDOW_SECONDS:
+                self.recent.popleft()
+            return wait
+
+    def acquire(self):
+        """Block until the endpoint's budget allows one more request"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record(self, status_code=None, latency=None, error=False):
+        """Feed the outcome of one request back into the rate"""
+        with self.lock:
+            now = time.monotonic()
+            unhealthy = error or status_code == 429 or (status_code is not None and status_code >= 500)
+
+            if not unhealthy and latency is not None:
+                if self.latency_baseline is None:
+                    self.latency_baseline = latency
+                elif self.latency_samples >= 10 and latency > self.latency_factor * self.latency_baseline:
+                    unhealthy = True
+                if not unhealthy:
+                    self.latency_baseline = 0.9 * self.latency_baseline + 0.1 * latency
+                    self.latency_samples += 1
+
+            if now < self.hold_until:
+                return
+
+            if unhealthy:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.hold_until = now + self.cooldown
+                self.backoffs += 1
+                logging.warning(f"Rate limiter '{self.name}' backing off to {self.rate:.2f} req/s "
+                                f"(status={status_code}, latency={latency}, error={error})")
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def stats(self):
+        with self.lock:
+            now = time.monotonic()
+            recent = [t for t in self.recent if now - RATE_WINDOW_SECONDS <= t <= now]
+            return {
+                "rate": self.rate,
+                "observed_rps": len(recent) / RATE_WINDOW_SECONDS,
+                "requests": self.acquired,
+                "total_wait": self.total_wait,
+                "mean_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+                "backoffs": self.backoffs,
+            }
+
+class RateLimiter:
+    """Holds one adaptive token bucket per endpoint"""
+
+    def __init__(self, budgets=None):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        for name, budget in (budgets or DEFAULT_BUDGETS).items():
+            self.buckets[name] = TokenBucket(name, **budget)
+
+    def bucket(self, name):
+        with self.lock:
+            if name not in self.buckets:
+                self.buckets[name] = TokenBucket(name)
+            return self.buckets[name]
+
+    def configure(self, name, **budget):
+        """Replace the budget for one endpoint, e.g. from command line options"""
+        with self.lock:
+            self.buckets[name] = TokenBucket(name, **budget)
+
+    def stats(self):
+        return {name: bucket.stats() for name, bucket in list(self.buckets.items())}
+
+    def format_stats(self):
+        lines = []
+        for name, stats in self.stats().items():
+            lines.append(f"{name}: {stats['rate']:.2f} req/s allowed, {stats['observed_rps']:.2f} req/s observed, "
+                         f"{stats['requests']} requests, waited {stats['total_wait']:.1f}s "
+                         f"({stats['mean_wait']:.2f}s avg), {stats['backoffs']} backoffs")
+        return "\n".join(lines)
@@ -0,0 +1,44 @@
+class RejalIndex:
+    """raviList of a HadithRejalList/v2 response, indexed by raviId.
+
+    The narrator extractors used to scan raviList for every field of every
+    narrator; the index is built once per hadith and each lookup is a dict
+    access. Entries sharing a raviId are kept in raviList order.
+    """
+
+    def __init__(self, rejal_data):
+        self.by_id = {}
+        data = rejal_data.get("data", {}) if isinstance(rejal_data, dict) else None
+        if not isinstance(data, dict):
+            return
+        for ravi in data.get("raviList") or []:
+            if not isinstance(ravi, dict):
+                continue
+            ravi_id = ravi.get("raviId")
+            try:
+                self.by_id.setdefault(ravi_id, []).append(ravi)
+            except TypeError:
+                # An unhashable raviId can't equal the IDs the sanads refer to
+                continue
+
+    def entries(self, ravi_id):
+        try:
+            return self.by_id.get(ravi_id, [])
+        except TypeError:
+            return []
+
+    def title(self, ravi_id, default=None):
+        """The last non-empty raviTitle given for ravi_id"""
+        for ravi in reversed(self.entries(ravi_id)):
+            if ravi.get("raviTitle", ""):
+                return ravi["raviTitle"]
+        return default
+
+    def __len__(self):
+        return len(self.by_id)
+
+def rejal_index(rejal_data):
+    """Index rejal_data, or return it as is if it is already a RejalIndex"""
+    if isinstance(rejal_data, RejalIndex):
+        return rejal_data
+    return RejalIndex(rejal_data)
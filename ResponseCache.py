@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from JsonBackend import loads
+
+# Default location and limits for the on-disk response cache
+DEFAULT_CACHE_PATH = "response_cache.sqlite3"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Cache hits whose last_access times are held in memory before being written in one transaction
+ACCESS_FLUSH_EVERY = 1000
+
+def cache_key(endpoint_name, hadith_id):
+    """Content address of one cached response: a hash of the endpoint and hadith ID"""
+    return hashlib.sha256(f"{endpoint_name}:{hadith_id}".encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Persistent cache of API responses keyed by endpoint and hadith ID.
+
+    Responses are stored zlib-compressed in a SQLite file. Entries older than
+    ttl seconds count as misses, and once the stored bodies exceed max_bytes
+    the least recently used entries are evicted. A hit only records its
+    access time in memory; the times are written in batches, before every
+    eviction and on close, so lookups don't each wait for a disk write.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+        # key -> last access time not yet written to the database
+        self.pending_access = {}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, endpoint TEXT, hadith_id TEXT, body BLOB, "
+            "size INTEGER, created_at REAL, last_access REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, endpoint_name, hadith_id):
+        """Return the cached response, or None on a miss"""
+        key = cache_key(endpoint_name, str(hadith_id))
+        with self.lock:
+            row = self.db.execute("SELECT body, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            body, size, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                self.pending_access.pop(key, None)
+                self.total_bytes -= size
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+            self.pending_access[key] = now
+            if len(self.pending_access) >= ACCESS_FLUSH_EVERY:
+                self._flush_access()
+                self.db.commit()
+            self.counters["hits"] += 1
+        return loads(zlib.decompress(body))
+
+    def put(self, endpoint_name, hadith_id, data):
+        """Store one response and evict least recently used entries if over the size limit"""
+        hadith_id = str(hadith_id)
+        key = cache_key(endpoint_name, hadith_id)
+        body = zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self.lock:
+            now = time.time()
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, hadith_id, body, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint_name, hadith_id, body, len(body), now, now)
+            )
+            self.total_bytes += len(body)
+            self.counters["stores"] += 1
+            self.pending_access.pop(key, None)
+            # Eviction goes by last_access, so the recorded hits have to be in the table first
+            self._flush_access()
+            self._evict()
+            self.db.commit()
+
+    def _flush_access(self):
+        if self.pending_access:
+            self.db.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                [(accessed, key) for key, accessed in self.pending_access.items()])
+            self.pending_access.clear()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.counters["evictions"] += 1
+                if self.total_bytes <= self.max_bytes:
+                    return
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        stats["bytes"] = self.total_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_ratio']:.0%} hit ratio), "
+                f"{stats['expired']} expired, {stats['evictions']} evicted, "
+                f"{stats['entries']} entries / {stats['bytes'] / 1024 / 1024:.1f} MB on disk")
+
+    def close(self):
+        with self.lock:
+            if self.db is None:
+                return
+            self._flush_access()
+            self.db.commit()
+            self.db.close()
+            self.db = None
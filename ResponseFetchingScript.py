@@ -1,15 +1,35 @@
 import requests
+import asyncio
+import argparse
 import json
 import csv
 import os
-import re
+import sys
 import time
 import random
+import itertools
 import logging
-import xml.etree.ElementTree as ET
 from datetime import datetime
 from pathlib import Path
-from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from HadithApiClient import (
+    BatchedDetailsClient, DEFAULT_BATCH_SIZE, HADITH_REJAL_ENDPOINT, send_request, set_pool_maxsize,
+    run_concurrently, format_connection_stats, rate_limiter, enable_response_cache, cache_lookup, cache_store, format_cache_stats, iter_batches,
+    DEFAULT_HADITH_TIME_BUDGET, TimeBudget, hadith_time_budget, call_with_budget, record_latency, configure_deadlines,
+    format_hedge_stats
+)
+from RateLimiter import DEFAULT_BUDGETS
+from ResponseCache import DEFAULT_CACHE_PATH, DEFAULT_TTL_SECONDS
+from CrawlJournal import CrawlJournal, DEFAULT_JOURNAL_PATH
+from SitemapReader import iter_hadith_ids, SITEMAP_HADITH_PATTERN
+from SegmentStore import SegmentWriter, DEFAULT_SEGMENT_DIR, saved_segment_ids
+from JsonBackend import response_json
+from RetryScheduler import RetryScheduler, DeadLetterFile, DEFAULT_DEAD_LETTER_PATH
+from CrawlFrontier import CrawlFrontier, DEFAULT_FRONTIER_PATH, reference_ids
+from Sharding import (
+    add_shard_arguments, filter_shard, shard_of, shard_path, shard_suffix, strip_option, launch_shards,
+    merge_csv_files, merge_id_logs
+)
 
 # Configure logging
 logging.basicConfig(
@@ -25,9 +45,16 @@ log_dir.mkdir(exist_ok=True)
 output_dir = Path("scraped_hadith_json")
 output_dir.mkdir(exist_ok=True)
 
+# Compressed segment store for responses; set up in main() unless --output-format json
+segment_writer = None
+
+# With --frontier, hadith IDs referenced in groupTogetherList are queued here and crawled too
+frontier = None
+
 # Setup log files
-success_log = log_dir / f"success_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-error_log = log_dir / f"error_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+success_log = log_dir / f"success_log_{run_id}.txt"
+error_log = log_dir / f"error_log_{run_id}.txt"
 
 # Rotating User Agents
 user_agents = [
@@ -39,16 +66,11 @@ user_agents = [
     "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1"
 ]
 
-# API Endpoints
-HADITH_DETAILS_ENDPOINT = "https://hadith.inoor.ir/service/api/elastic/ElasticHadithById"
-HADITH_REJAL_ENDPOINT = "https://hadith.inoor.ir/service/api/hadith/HadithRejalList/v2"
-
 # Path to the sitemap file - adjust this to your actual sitemap file path
 SITEMAP_PATH = "sitemap.xml"  # Change this to your actual sitemap path
 
-def get_random_delay():
-    """Generate a random delay between requests to avoid detection"""
-    return random.uniform(1.5, 5.0)
+# Default number of requests in flight when running in async mode
+DEFAULT_CONCURRENCY = 8
 
 def get_headers():
     """Get headers with a random user agent"""
@@ -59,76 +81,112 @@ def get_headers():
         "user-agent": random.choice(user_agents)
     }
 
+# Per-request timeout in seconds; None derives it from observed latencies
+request_timeout = None
+
+# Seconds allowed for all requests of one hadith; None for no limit
+time_budget_seconds = DEFAULT_HADITH_TIME_BUDGET
+
+# Groups ElasticHadithById lookups into multi-ID requests
+details_client = BatchedDetailsClient(batch_size=DEFAULT_BATCH_SIZE, headers_factory=get_headers)
+
 def extract_hadith_ids_from_sitemap(sitemap_path):
-    """Extract hadith IDs from the sitemap file"""
+    """Yield hadith IDs from the sitemap as it is read.
+
+    Sitemap-index files are followed, .xml.gz files are decompressed on the
+    fly and repeated IDs are dropped, so fetching can start with the first ID.
+    """
     try:
         if not os.path.exists(sitemap_path):
             logging.error(f"Sitemap file not found: {sitemap_path}")
-            return []
-        
-        hadith_ids = []
-        tree = ET.parse(sitemap_path)
-        root = tree.getroot()
-        
-        # Define namespace if needed - adjust according to your sitemap format
-        namespaces = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+            return
         
-        # Extract URLs and parse for hadith IDs
-        for url in root.findall(".//ns:url/ns:loc", namespaces) or root.findall(".//url/loc"):
-            url_text = url.text
-            if 'hadith.inoor.ir' in url_text and '/h/' in url_text:
-                # Extract hadith ID from URL - adjust pattern as needed
-                match = re.search(r'/h/(\d+)', url_text)
-                if match:
-                    hadith_id = match.group(1)
-                    hadith_ids.append(hadith_id)
-        
-        logging.info(f"Extracted {len(hadith_ids)} hadith IDs from sitemap")
-        return hadith_ids
+        yield from iter_hadith_ids(sitemap_path, SITEMAP_HADITH_PATTERN)
     except Exception as e:
         logging.error(f"Error extracting hadith IDs from sitemap: {e}")
-        return []
+
+def fetch_hadith_details(hadith_id):
+    """Fetch the ElasticHadithById response for a single hadith ID"""
+    # Served from the current batch when the ID was prefetched
+    return details_client.get(hadith_id)
+
+def fetch_hadith_rejal(hadith_id):
+    """Fetch the HadithRejalList/v2 response for a single hadith ID"""
+    cached = cache_lookup("rejal", hadith_id)
+    if cached is not None:
+        return cached, None
+    
+    rejal_url = f"{HADITH_REJAL_ENDPOINT}?hadithId={hadith_id}"
+    headers = get_headers()  # Get a possibly different user agent
+    rejal_response = send_request(
+        "rejal", "GET", rejal_url, 
+        headers=headers,
+        timeout=request_timeout
+    )
+    
+    if rejal_response.status_code != 200:
+        return None, f"Failed to fetch rejal data: HTTP {rejal_response.status_code}"
+    
+    rejal_data = response_json(rejal_response)
+    cache_store("rejal", hadith_id, rejal_data)
+    return rejal_data, None
+
+def describe_fetch_error(hadith_id, error):
+    """Turn an exception raised while fetching into an error log message"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return f"Request timed out for hadith ID {hadith_id}"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return f"Connection error for hadith ID {hadith_id}"
+    if isinstance(error, ValueError):
+        return f"Malformed JSON response for hadith ID {hadith_id}: {str(error)}"
+    return f"Error fetching data for hadith ID {hadith_id}: {str(error)}"
 
 def fetch_hadith_data(hadith_id):
     """Fetch hadith details and rejal data for a given hadith ID"""
+    started = time.monotonic()
     try:
-        # Get hadith details
-        payload = {
-            "hadithId": [hadith_id],
-            "searchPhrase": ""
-        }
-        
-        headers = get_headers()
-        response = requests.post(
-            HADITH_DETAILS_ENDPOINT, 
-            json=payload, 
-            headers=headers,
-            timeout=30
-        )
+        # The two requests don't depend on each other, so both go out at once
+        # (pacing is left to the rate limiter), and share one time budget
+        with hadith_time_budget(time_budget_seconds):
+            (hadith_details, error), (rejal_data, rejal_error) = run_concurrently(
+                lambda: fetch_hadith_details(hadith_id),
+                lambda: fetch_hadith_rejal(hadith_id)
+            )
+        if error or rejal_error:
+            return None, error or rejal_error
         
-        if response.status_code != 200:
-            return None, f"Failed to fetch hadith details: HTTP {response.status_code}"
-        
-        hadith_details = response.json()
-        
-        # Add delay between requests
-        time.sleep(get_random_delay())
+        # Combine both responses
+        final_data = {
+            "hadith_id": hadith_id,
+            "hadith_details": hadith_details,
+            "hadith_rejal_list": rejal_data
+        }
         
-        # Get rejal data
-        rejal_url = f"{HADITH_REJAL_ENDPOINT}?hadithId={hadith_id}"
-        headers = get_headers()  # Get a possibly different user agent
-        rejal_response = requests.get(
-            rejal_url, 
-            headers=headers,
-            timeout=30
+        return final_data, None
+    except Exception as e:
+        return None, describe_fetch_error(hadith_id, e)
+    finally:
+        # Time per hadith, whatever the outcome, for the tail-latency report
+        record_latency("hadith", time.monotonic() - started)
+
+async def fetch_hadith_data_async(hadith_id, semaphore):
+    """Fetch hadith details and rejal data without blocking the event loop"""
+    started = time.monotonic()
+    budget = TimeBudget(time_budget_seconds) if time_budget_seconds is not None else None
+    
+    async def fetch(function):
+        # Each request holds one slot of the global concurrency limit
+        async with semaphore:
+            return await asyncio.to_thread(call_with_budget, budget, function, hadith_id)
+    
+    try:
+        # Details and rejal for the same hadith are fetched at the same time
+        (hadith_details, error), (rejal_data, rejal_error) = await asyncio.gather(
+            fetch(fetch_hadith_details), fetch(fetch_hadith_rejal)
         )
+        if error or rejal_error:
+            return None, error or rejal_error
         
-        if rejal_response.status_code != 200:
-            return None, f"Failed to fetch rejal data: HTTP {rejal_response.status_code}"
-        
-        rejal_data = rejal_response.json()
-        
-        # Combine both responses
         final_data = {
             "hadith_id": hadith_id,
             "hadith_details": hadith_details,
@@ -136,12 +194,11 @@ def fetch_hadith_data(hadith_id):
         }
         
         return final_data, None
-    except requests.exceptions.Timeout:
-        return None, f"Request timed out for hadith ID {hadith_id}"
-    except requests.exceptions.ConnectionError:
-        return None, f"Connection error for hadith ID {hadith_id}"
     except Exception as e:
-        return None, f"Error fetching data for hadith ID {hadith_id}: {str(e)}"
+        return None, describe_fetch_error(hadith_id, e)
+    finally:
+        # Time per hadith, whatever the outcome, for the tail-latency report
+        record_latency("hadith", time.monotonic() - started)
 
 def save_to_csv(hadith_data, csv_file):
     """Save processed hadith data to CSV file"""
@@ -196,85 +253,387 @@ def save_to_csv(hadith_data, csv_file):
         logging.error(f"Error saving to CSV: {e}")
         return False
 
-def process_hadith_ids(hadith_ids, csv_file, max_retries=3):
-    """Process a list of hadith IDs, with retry logic"""
-    total = len(hadith_ids)
+def save_hadith_result(data, csv_file):
+    """Store the JSON response for one hadith and append its CSV row"""
+    if segment_writer is not None:
+        segment_writer.write(data['hadith_id'], data)
+    else:
+        json_path = output_dir / f"hadith_{data['hadith_id']}.json"
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=4, ensure_ascii=False)
+    
+    if frontier is not None:
+        frontier.discover(reference_ids(data['hadith_details']))
+    
+    return save_to_csv(data, csv_file)
+
+def progress_label(index, total):
+    return f"{index+1}/{total}" if total is not None else f"{index+1}"
+
+def attempt_label(index, total, attempt):
+    label = progress_label(index, total) if index is not None else "retry"
+    return f"{label} (attempt {attempt})" if attempt > 1 else label
+
+def process_hadith_ids(hadith_ids, csv_file, max_retries=None, journal=None, scheduler=None):
+    """Process a list or stream of hadith IDs, with delayed retries and optional progress journal"""
+    total = len(hadith_ids) if hasattr(hadith_ids, "__len__") else None
     success_count = 0
     error_count = 0
+    scheduler = scheduler or RetryScheduler(max_attempts=max_retries)
+    index = -1
     
-    with open(success_log, 'w', encoding='utf-8') as s_log, \
-         open(error_log, 'w', encoding='utf-8') as e_log:
+    with open(success_log, 'a', encoding='utf-8') as s_log, \
+         open(error_log, 'a', encoding='utf-8') as e_log:
         
-        for index, hadith_id in enumerate(hadith_ids):
-            logging.info(f"Processing {index+1}/{total}: Hadith ID {hadith_id}")
+        # Details for each batch of IDs are fetched in one request just before it is reached;
+        # failed IDs wait on the retry queue and come back between new IDs once they are due
+        for hadith_id in scheduler.interleave(details_client.iter_prefetched(hadith_ids)):
+            attempt = scheduler.attempt_number(hadith_id)
+            if attempt == 1:
+                index += 1
+            logging.info(f"Processing {attempt_label(index, total, attempt)}: Hadith ID {hadith_id}")
             
-            retries = 0
-            success = False
+            if journal:
+                journal.mark_in_flight(hadith_id)
             
-            while retries < max_retries and not success:
-                if retries > 0:
-                    # Exponential backoff
-                    wait_time = 2 ** retries + random.uniform(0, 1)
-                    logging.info(f"Retry {retries}/{max_retries} for hadith ID {hadith_id}. Waiting {wait_time:.2f} seconds...")
-                    time.sleep(wait_time)
-                
-                data, error = fetch_hadith_data(hadith_id)
-                
-                if data:
-                    # Save JSON response
-                    json_path = output_dir / f"hadith_{hadith_id}.json"
-                    with open(json_path, "w", encoding="utf-8") as file:
-                        json.dump(data, file, indent=4, ensure_ascii=False)
-                    
-                    # Save to CSV
-                    csv_success = save_to_csv(data, csv_file)
-                    
-                    if csv_success:
-                        success = True
-                        success_count += 1
-                        s_log.write(f"{hadith_id}\n")
-                        logging.info(f"Successfully processed hadith ID {hadith_id}")
-                    else:
-                        error = "Failed to save to CSV"
-                
-                retries += 1
+            data, error = fetch_hadith_data(hadith_id)
+            
+            # Save JSON response and CSV row
+            if data and not save_hadith_result(data, csv_file):
+                data, error = None, "Failed to save to CSV"
             
-            # Add to error log if all retries failed
-            if not success:
+            if data:
+                success_count += 1
+                s_log.write(f"{hadith_id}\n")
+                scheduler.succeeded(hadith_id)
+                if journal:
+                    journal.mark_done(hadith_id)
+                logging.info(f"Successfully processed hadith ID {hadith_id}")
+            elif scheduler.failed(hadith_id, error) is None:
+                # Out of retries for this kind of error
                 error_count += 1
                 e_log.write(f"{hadith_id}: {error}\n")
-                logging.error(f"Failed to process hadith ID {hadith_id}: {error}")
-            
-            # Add a random delay between processing different hadiths
-            if index < total - 1:  # Don't delay after the last item
-                time.sleep(get_random_delay())
+                if journal:
+                    journal.mark_failed(hadith_id, error)
     
     return success_count, error_count
 
+async def process_hadith_ids_async(hadith_ids, csv_file, max_retries=None, concurrency=DEFAULT_CONCURRENCY,
+                                   journal=None, scheduler=None):
+    """Process hadith IDs concurrently, with the same retry logic and outputs as process_hadith_ids"""
+    total = len(hadith_ids) if hasattr(hadith_ids, "__len__") else None
+    counts = {"success": 0, "error": 0}
+    scheduler = scheduler or RetryScheduler(max_attempts=max_retries)
+    
+    # Blocking requests calls run in worker threads, so size the pool to the limit
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    set_pool_maxsize(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    # Workers share one iterator of ID batches; all file writes happen on the event loop thread
+    batch_size = details_client.batch_size
+    pending = ((number * batch_size, batch) for number, batch in enumerate(iter_batches(hadith_ids, batch_size)))
+    
+    with open(success_log, 'a', encoding='utf-8') as s_log, \
+         open(error_log, 'a', encoding='utf-8') as e_log:
+        
+        async def process_one(index, hadith_id):
+            attempt = scheduler.attempt_number(hadith_id)
+            logging.info(f"Processing {attempt_label(index, total, attempt)}: Hadith ID {hadith_id}")
+            
+            if journal:
+                journal.mark_in_flight(hadith_id)
+            
+            data, error = await fetch_hadith_data_async(hadith_id, semaphore)
+            
+            if data and not save_hadith_result(data, csv_file):
+                data, error = None, "Failed to save to CSV"
+            
+            if data:
+                counts["success"] += 1
+                s_log.write(f"{hadith_id}\n")
+                scheduler.succeeded(hadith_id)
+                if journal:
+                    journal.mark_done(hadith_id)
+                logging.info(f"Successfully processed hadith ID {hadith_id}")
+            elif scheduler.failed(hadith_id, error) is None:
+                counts["error"] += 1
+                e_log.write(f"{hadith_id}: {error}\n")
+                if journal:
+                    journal.mark_failed(hadith_id, error)
+        
+        async def worker():
+            for start, batch in pending:
+                # One multi-ID details request for the whole batch, then rejal per ID
+                async with semaphore:
+                    await asyncio.to_thread(details_client.prefetch, batch)
+                await asyncio.gather(*(process_one(start + offset, hadith_id)
+                                       for offset, hadith_id in enumerate(batch)))
+        
+        # Failed IDs are retried by their own tasks once due, so workers never wait on them
+        workers_done = asyncio.Event()
+        retry_tasks = set()
+        
+        async def retry_worker():
+            while True:
+                for hadith_id in scheduler.pop_due():
+                    task = asyncio.create_task(process_one(None, hadith_id))
+                    retry_tasks.add(task)
+                    task.add_done_callback(retry_tasks.discard)
+                if workers_done.is_set() and not retry_tasks and not scheduler.pending():
+                    return
+                wait = scheduler.next_due_in()
+                await asyncio.sleep(min(wait, 0.5) if wait is not None else 0.1)
+        
+        async def run_workers():
+            try:
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+            finally:
+                workers_done.set()
+        
+        await asyncio.gather(run_workers(), retry_worker())
+    
+    return counts["success"], counts["error"]
+
+def parse_args():
+    """Parse command line options for the crawler"""
+    parser = argparse.ArgumentParser(description="Fetch hadith details and rejal data listed in the sitemap")
+    parser.add_argument("--mode", choices=["sequential", "async"], default="sequential",
+                        help="sequential fetches one hadith at a time, async fetches many at once")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of requests in flight in async mode")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of hadith IDs sent in one ElasticHadithById request")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Starting requests per second for each endpoint")
+    parser.add_argument("--max-rate", type=float, default=None,
+                        help="Requests per second each endpoint may ramp up to while the server stays healthy")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH,
+                        help="SQLite file holding cached details and rejal responses")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL_SECONDS,
+                        help="Seconds before a cached response is fetched again")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always go to the network and don't store responses")
+    parser.add_argument("--output-format", choices=["segments", "json"], default="segments",
+                        help="Store responses in compressed segments or as one JSON file per hadith")
+    parser.add_argument("--segment-dir", default=DEFAULT_SEGMENT_DIR,
+                        help="Folder for the compressed response segments")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_PATH,
+                        help="SQLite file recording done, failed and in-flight hadith IDs")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Fetch every sitemap ID again instead of continuing from the journal")
+    parser.add_argument("--skip-failed", action="store_true",
+                        help="When resuming, don't retry IDs that failed in earlier runs")
+    parser.add_argument("--max-retries", type=int, default=None,
+                        help="Cap on attempts per hadith ID; by default each error class has its own limit")
+    parser.add_argument("--dead-letter", default=DEFAULT_DEAD_LETTER_PATH,
+                        help="JSONL file collecting hadith IDs that used up their retries")
+    parser.add_argument("--replay-dead-letters", action="store_true",
+                        help="Fetch only the IDs in the dead-letter file instead of the sitemap")
+    parser.add_argument("--frontier", action="store_true",
+                        help="Also crawl hadith IDs referenced in groupTogetherList that aren't in the sitemap")
+    parser.add_argument("--frontier-path", default=DEFAULT_FRONTIER_PATH,
+                        help="SQLite file holding every hadith ID seen and the queue of IDs to crawl")
+    parser.add_argument("--frontier-limit", type=int, default=None,
+                        help="Stop queueing discovered IDs once the frontier has seen this many")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Fixed per-request timeout in seconds (default: derived from observed latencies)")
+    parser.add_argument("--hedge-percentile", type=float, default=None,
+                        help="Latency percentile after which a slow request is sent a second time")
+    parser.add_argument("--no-hedge", action="store_true",
+                        help="Never send duplicate requests")
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_HADITH_TIME_BUDGET,
+                        help="Seconds allowed for all requests of one hadith before it counts as timed out (0: no limit)")
+    parser.add_argument("--run-id", default=run_id,
+                        help="Timestamp used in log file names; shards of one crawl share it")
+    add_shard_arguments(parser)
+    return parser.parse_args()
+
+def run_local_shards(args, csv_file):
+    """Crawl with one worker process per shard, then merge their CSV files and logs.
+
+    The shards' own files stay in place after the merge: their journals are
+    what lets the next sharded run skip IDs it already wrote.
+    """
+    shard_count = args.spawn_shards
+    argv = strip_option(sys.argv[1:], "--run-id") + ["--run-id", args.run_id]
+    exit_codes = launch_shards(os.path.abspath(__file__), shard_count, argv)
+    for shard_index, exit_code in enumerate(exit_codes):
+        if exit_code != 0:
+            print(f"Shard {shard_index} exited with code {exit_code}")
+    
+    # Rows already in the main CSV file from earlier runs are kept first
+    shard_csv_files = [shard_path(csv_file, index, shard_count) for index in range(shard_count)]
+    merged_csv = f"{csv_file}.merging"
+    rows = merge_csv_files([csv_file] + shard_csv_files, merged_csv, key=lambda row: row[0])
+    os.replace(merged_csv, csv_file)
+    
+    # Shards dead-letter into their own files; gather them into the main one
+    for index in range(shard_count):
+        shard_dead_letters = shard_path(args.dead_letter, index, shard_count)
+        if os.path.exists(shard_dead_letters):
+            with open(shard_dead_letters, "r", encoding="utf-8") as source, \
+                 open(args.dead_letter, "a", encoding="utf-8") as target:
+                target.write(source.read())
+            os.remove(shard_dead_letters)
+    
+    suffixes = [shard_suffix(index, shard_count) for index in range(shard_count)]
+    shard_success_logs = [log_dir / f"success_log_{args.run_id}_{suffix}.txt" for suffix in suffixes]
+    shard_error_logs = [log_dir / f"error_log_{args.run_id}_{suffix}.txt" for suffix in suffixes]
+    succeeded, failed = merge_id_logs(
+        [path for path in shard_success_logs if path.exists()],
+        [path for path in shard_error_logs if path.exists()],
+        success_log, error_log
+    )
+    
+    print("\n--- Sharded Scraping Complete ---")
+    print(f"Shards: {shard_count}")
+    print(f"Successfully processed: {succeeded}")
+    print(f"Failed to process: {failed}")
+    print(f"Success log: {success_log}")
+    print(f"Error log: {error_log}")
+    print(f"CSV data saved to: {csv_file} ({rows} rows)")
+    print(f"Shard CSV files, logs, journals and response caches are kept (e.g. {shard_csv_files[0]}) "
+          f"so a later run can resume each shard; the next merge skips rows already in {csv_file}")
+
 def main():
+    global success_log, error_log, segment_writer, request_timeout, time_budget_seconds, frontier
+    args = parse_args()
+    details_client.batch_size = max(1, args.batch_size)
+    details_client.timeout = request_timeout = args.timeout
+    time_budget_seconds = args.time_budget or None
+    configure_deadlines(hedge_percentile=args.hedge_percentile, hedging=not args.no_hedge)
+    for endpoint_name, budget in DEFAULT_BUDGETS.items():
+        budget = dict(budget)
+        if args.rate is not None:
+            budget["rate"] = args.rate
+        if args.max_rate is not None:
+            budget["max_rate"] = args.max_rate
+        rate_limiter.configure(endpoint_name, **budget)
+    
     # CSV file for structured data
     csv_file = 'hadith_data.csv'
+    success_log = log_dir / f"success_log_{args.run_id}.txt"
+    error_log = log_dir / f"error_log_{args.run_id}.txt"
     
-    # Get hadith IDs from sitemap
-    print("Extracting hadith IDs from sitemap...")
-    hadith_ids = extract_hadith_ids_from_sitemap(SITEMAP_PATH)
+    if args.spawn_shards > 1:
+        run_local_shards(args, csv_file)
+        return
+    
+    # Each shard keeps its own CSV file, logs, journal and response cache; JSON files never overlap
+    cache_path = args.cache_path
+    journal_path = args.journal
+    dead_letter_path = args.dead_letter
+    frontier_path = args.frontier_path
+    segment_prefix = "segment"
+    if args.shard_count > 1:
+        suffix = shard_suffix(args.shard_index, args.shard_count)
+        print(f"Crawling shard {args.shard_index + 1} of {args.shard_count} ({args.shard_method})")
+        csv_file = shard_path(csv_file, args.shard_index, args.shard_count)
+        cache_path = shard_path(args.cache_path, args.shard_index, args.shard_count)
+        journal_path = shard_path(args.journal, args.shard_index, args.shard_count)
+        dead_letter_path = shard_path(args.dead_letter, args.shard_index, args.shard_count)
+        frontier_path = shard_path(args.frontier_path, args.shard_index, args.shard_count)
+        segment_prefix = suffix
+        success_log = log_dir / f"success_log_{args.run_id}_{suffix}.txt"
+        error_log = log_dir / f"error_log_{args.run_id}_{suffix}.txt"
+    
+    # Shards never share a cache file: each process keeps its own size count for eviction
+    if not args.no_cache:
+        enable_response_cache(cache_path, args.cache_ttl)
+    
+    # Get hadith IDs from sitemap, or from the IDs that ran out of retries last time
+    dead_letters = DeadLetterFile(dead_letter_path)
+    scheduler = RetryScheduler(dead_letters, max_attempts=args.max_retries)
+    if args.replay_dead_letters:
+        hadith_ids = iter(dead_letters.replay_ids())
+        print(f"Replaying dead-lettered hadith IDs from {dead_letter_path}")
+    else:
+        print("Extracting hadith IDs from sitemap...")
+        hadith_ids = extract_hadith_ids_from_sitemap(SITEMAP_PATH)
+    hadith_ids = filter_shard(hadith_ids, args.shard_index, args.shard_count, args.shard_method)
+    
+    # Sitemap IDs go through the frontier too, so a reference to one isn't crawled twice;
+    # each shard only queues the references that fall in its own shard
+    if args.frontier:
+        accept = None
+        if args.shard_count > 1:
+            accept = lambda hadith_id: shard_of(hadith_id, args.shard_count, args.shard_method) == args.shard_index
+        frontier = CrawlFrontier(frontier_path, limit=args.frontier_limit, accept=accept)
+        print(f"Crawl frontier {frontier_path}: {frontier.count} IDs seen, {frontier.queued} queued")
+        hadith_ids = frontier.iter_ids(hadith_ids)
     
-    if not hadith_ids:
-        print("No hadith IDs found. Please check the sitemap path.")
+    # Continue from where the last run stopped
+    journal = CrawlJournal(journal_path)
+    
+    def resume(hadith_ids):
+        if args.no_resume:
+            return hadith_ids
+        return journal.remaining(hadith_ids, output_dir, include_failed=not args.skip_failed,
+                                 saved_ids=saved_segment_ids(args.segment_dir))
+    
+    if not args.no_resume:
+        print(f"Resuming with journal {journal_path}: {journal.counts()}")
+    hadith_ids = resume(hadith_ids)
+    
+    # IDs are streamed from the sitemap, so peek at the first one to see if there is any work
+    first_id = next(hadith_ids, None)
+    if first_id is None:
+        print("No hadith IDs left to fetch. Please check the sitemap path.")
         return
+    hadith_ids = itertools.chain([first_id], hadith_ids)
     
-    # Process all hadith IDs
-    print(f"Starting to process {len(hadith_ids)} hadith IDs...")
-    success_count, error_count = process_hadith_ids(hadith_ids, csv_file)
+    # Shards write segments with their own prefix, so they can share one folder
+    if args.output_format == "segments":
+        segment_writer = SegmentWriter(args.segment_dir, prefix=segment_prefix)
+    
+    # Process hadith IDs as they are read from the sitemap
+    print("Starting to process hadith IDs...")
+    if args.mode == "async":
+        print(f"Async mode with up to {args.concurrency} concurrent requests")
+    success_count = error_count = 0
+    while True:
+        if args.mode == "async":
+            succeeded, failed = asyncio.run(
+                process_hadith_ids_async(hadith_ids, csv_file, args.max_retries, args.concurrency, journal, scheduler)
+            )
+        else:
+            succeeded, failed = process_hadith_ids(hadith_ids, csv_file, args.max_retries, journal, scheduler)
+        success_count += succeeded
+        error_count += failed
+        
+        # References found by hadiths still in flight when the queue ran dry wait for another round
+        if frontier is None or not frontier.queued:
+            break
+        print(f"Crawling {frontier.queued} hadith IDs discovered in references...")
+        hadith_ids = resume(frontier.iter_ids())
+    if args.replay_dead_letters:
+        dead_letters.finish_replay()
     
     # Final report
     print("\n--- Scraping Complete ---")
-    print(f"Total hadith IDs processed: {len(hadith_ids)}")
+    print(f"Total hadith IDs processed: {success_count + error_count}")
     print(f"Successfully processed: {success_count}")
     print(f"Failed to process: {error_count}")
+    print(f"HTTP connections: {format_connection_stats()}")
+    print(f"Rate limits:\n{rate_limiter.format_stats()}")
+    print(f"Hedged requests: {format_hedge_stats()}")
+    print(f"Response cache: {format_cache_stats()}")
+    print(f"Retries: {scheduler.format_stats()}")
+    print(f"Dead letters: {dead_letters.count} new in {dead_letter_path}")
     print(f"Success log: {success_log}")
     print(f"Error log: {error_log}")
-    print(f"JSON files saved to: {output_dir}")
+    print(f"Crawl journal: {journal_path} {journal.counts()}")
+    if frontier is not None:
+        print(f"Crawl frontier: {frontier.format_stats()}")
+        frontier.close()
+    if segment_writer is not None:
+        segment_writer.close()
+        print(f"Responses saved to: {args.segment_dir} ({segment_writer.records_written} records, "
+              f"{segment_writer.bytes_written / 1024 / 1024:.1f} MB compressed)")
+    else:
+        print(f"JSON files saved to: {output_dir}")
     print(f"CSV data saved to: {csv_file}")
 
 if __name__ == "__main__":
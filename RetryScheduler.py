@@ -0,0 +1,238 @@
+import os
+import re
+import json
+import time
+import heapq
+import random
+import logging
+import threading
+import requests
+
+# Default file for hadith IDs that used up their retries
+DEFAULT_DEAD_LETTER_PATH = "dead_letters.jsonl"
+
+# Error classes a failed hadith ID can fall into
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+HTTP_5XX = "http_5xx"
+HTTP_429 = "http_429"
+HTTP_4XX = "http_4xx"
+MALFORMED_JSON = "malformed_json"
+NO_DATA = "no_data"
+OTHER = "other"
+
+class RetryPolicy:
+    """How often and how long to wait before retrying one class of error.
+
+    The wait before retry n (1-based) is base_delay * multiplier ** (n - 1),
+    capped at max_delay, with up to jitter (a fraction) added at random so
+    IDs that failed together don't all come back together.
+    """
+
+    def __init__(self, max_attempts, base_delay, multiplier=2.0, max_delay=600.0, jitter=0.2):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, retry_number):
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (retry_number - 1))
+        return delay * (1 + random.uniform(0, self.jitter))
+
+DEFAULT_POLICIES = {
+    # Slow responses usually clear up quickly; connection errors take longer
+    TIMEOUT: RetryPolicy(max_attempts=4, base_delay=5, multiplier=2, max_delay=120),
+    CONNECTION: RetryPolicy(max_attempts=5, base_delay=10, multiplier=2, max_delay=300),
+    HTTP_5XX: RetryPolicy(max_attempts=4, base_delay=5, multiplier=3, max_delay=300),
+    # The rate limiter also slows down on a 429, so give the server longer here
+    HTTP_429: RetryPolicy(max_attempts=6, base_delay=30, multiplier=2, max_delay=600),
+    # A truncated or garbled body might be a one-off; a second failure is probably not
+    MALFORMED_JSON: RetryPolicy(max_attempts=2, base_delay=30, multiplier=1, max_delay=30),
+    # Other 4xx answers won't change on retry
+    HTTP_4XX: RetryPolicy(max_attempts=1, base_delay=0),
+    NO_DATA: RetryPolicy(max_attempts=2, base_delay=60, multiplier=1, max_delay=60),
+    OTHER: RetryPolicy(max_attempts=3, base_delay=10, multiplier=2, max_delay=120),
+}
+
+def classify_error(error):
+    """Map an exception or one of the crawlers' error messages to an error class"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return TIMEOUT
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return CONNECTION
+    if isinstance(error, ValueError):
+        return MALFORMED_JSON
+
+    message = str(error)
+    status = re.search(r'(?:HTTP|[Ss]tatus code:?) (\d{3})', message)
+    if status:
+        code = int(status.group(1))
+        if code == 429:
+            return HTTP_429
+        if code >= 500:
+            return HTTP_5XX
+        return HTTP_4XX
+    if re.search(r'timed out|[Tt]imeout', message):
+        return TIMEOUT
+    if re.search(r'[Cc]onnection|Max retries exceeded|Name or service not known', message):
+        return CONNECTION
+    if re.search(r'JSON|Expecting value|Extra data|Unterminated string', message):
+        return MALFORMED_JSON
+    if re.search(r'[Nn]o valid data|[Nn]ot found', message):
+        return NO_DATA
+    return OTHER
+
+class DeadLetterFile:
+    """Append-only JSONL file of hadith IDs that used up all their retries.
+
+    A later run can replay it with replay_ids(); the file being replayed is
+    moved aside first, so IDs that fail again are written to a fresh file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def add(self, hadith_id, error_class, error, attempts):
+        entry = {"hadith_id": str(hadith_id), "error_class": error_class, "error": str(error),
+                 "attempts": attempts, "failed_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with self.lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def entries(self, path=None):
+        path = path or self.path
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+
+    def replay_ids(self):
+        """Return the dead-lettered IDs (oldest first, no duplicates) and move the file aside"""
+        replaying = f"{self.path}.replaying"
+        with self.lock:
+            # A replay that was interrupted left its IDs in the .replaying file
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as source, \
+                     open(replaying, "a", encoding="utf-8") as target:
+                    target.write(source.read())
+                os.remove(self.path)
+        ids = list(dict.fromkeys(entry["hadith_id"] for entry in self.entries(replaying)))
+        return ids
+
+    def finish_replay(self):
+        """Drop the moved-aside file once every replayed ID has been processed or re-dead-lettered"""
+        replaying = f"{self.path}.replaying"
+        if os.path.exists(replaying):
+            os.remove(replaying)
+
+class RetryScheduler:
+    """Keeps failed hadith IDs on a delayed-retry queue instead of retrying them inline.
+
+    failed() decides from the error class whether and when an ID is tried
+    again; IDs out of attempts go to the dead-letter file. interleave() mixes
+    due retries into a stream of new IDs so healthy IDs keep flowing while
+    failed ones wait.
+    """
+
+    def __init__(self, dead_letters=None, policies=None, max_attempts=None, delay_scale=1.0):
+        self.policies = dict(DEFAULT_POLICIES, **(policies or {}))
+        self.max_attempts = max_attempts
+        self.delay_scale = delay_scale
+        self.dead_letters = dead_letters
+        self.lock = threading.Lock()
+        self.queue = []
+        self.sequence = 0
+        self.attempts = {}
+        self.stats = {"retries_scheduled": 0, "retried_ok": 0, "dead_lettered": 0}
+        self.class_counts = {}
+
+    def attempt_limit(self, error_class):
+        limit = self.policies.get(error_class, self.policies[OTHER]).max_attempts
+        if self.max_attempts is not None:
+            limit = min(limit, self.max_attempts)
+        return limit
+
+    def failed(self, hadith_id, error):
+        """Record a failed attempt; returns the retry delay in seconds, or None if the ID was dead-lettered"""
+        error_class = classify_error(error)
+        policy = self.policies.get(error_class, self.policies[OTHER])
+        with self.lock:
+            attempts = self.attempts.get(hadith_id, 0) + 1
+            self.attempts[hadith_id] = attempts
+            self.class_counts[error_class] = self.class_counts.get(error_class, 0) + 1
+            if attempts >= self.attempt_limit(error_class):
+                del self.attempts[hadith_id]
+                self.stats["dead_lettered"] += 1
+                dead = True
+            else:
+                delay = policy.delay(attempts) * self.delay_scale
+                heapq.heappush(self.queue, (time.monotonic() + delay, self.sequence, hadith_id))
+                self.sequence += 1
+                self.stats["retries_scheduled"] += 1
+                dead = False
+        if dead:
+            if self.dead_letters is not None:
+                self.dead_letters.add(hadith_id, error_class, error, attempts)
+            logging.error(f"Giving up on hadith ID {hadith_id} after {attempts} attempts ({error_class}): {error}")
+            return None
+        logging.warning(f"Hadith ID {hadith_id} failed ({error_class}, attempt {attempts}), retrying in {delay:.1f}s")
+        return delay
+
+    def succeeded(self, hadith_id):
+        with self.lock:
+            if self.attempts.pop(hadith_id, None) is not None:
+                self.stats["retried_ok"] += 1
+
+    def attempt_number(self, hadith_id):
+        """1-based number of the attempt about to be made for an ID"""
+        with self.lock:
+            return self.attempts.get(hadith_id, 0) + 1
+
+    def pending(self):
+        with self.lock:
+            return len(self.queue)
+
+    def next_due_in(self):
+        """Seconds until the next retry is due (0 if one is due now), or None if none are waiting"""
+        with self.lock:
+            if not self.queue:
+                return None
+            return max(0.0, self.queue[0][0] - time.monotonic())
+
+    def pop_due(self):
+        """Remove and return every ID whose retry is due"""
+        due = []
+        with self.lock:
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now:
+                due.append(heapq.heappop(self.queue)[2])
+        return due
+
+    def interleave(self, hadith_ids):
+        """Yield new IDs with due retries mixed in, then wait out the remaining retries"""
+        for hadith_id in hadith_ids:
+            yield from self.pop_due()
+            yield hadith_id
+        while True:
+            wait = self.next_due_in()
+            if wait is None:
+                return
+            if wait > 0:
+                time.sleep(wait)
+            yield from self.pop_due()
+
+    def format_stats(self):
+        classes = ", ".join(f"{name} {count}" for name, count in sorted(self.class_counts.items())) or "none"
+        return (f"{self.stats['retries_scheduled']} retries scheduled, {self.stats['retried_ok']} recovered, "
+                f"{self.stats['dead_lettered']} dead-lettered; failures by class: {classes}")
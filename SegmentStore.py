@@ -0,0 +1,253 @@
+import os
+import re
+import gzip
+import json
+import mmap
+import argparse
+import threading
+from JsonBackend import loads
+
+# Default folder for the fetched responses
+DEFAULT_SEGMENT_DIR = "scraped_hadith_segments"
+
+# A writer starts a new segment once the current one reaches this size
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024
+
+SEGMENT_EXTENSION = ".jsonl.gz"
+INDEX_EXTENSION = ".idx"
+
+def segment_name(prefix, number):
+    return f"{prefix}-{number:05d}"
+
+def list_segments(directory):
+    """Return the base paths (without extension) of all segments in a folder, in name order"""
+    if not os.path.isdir(directory):
+        return []
+    names = [name[:-len(INDEX_EXTENSION)] for name in os.listdir(directory) if name.endswith(INDEX_EXTENSION)]
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+def read_index(index_path):
+    """Yield (hadith_id, offset, length) for every complete line of a segment index"""
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                # Half-written line from a crash; the record it points to is ignored
+                break
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != 3:
+                continue
+            yield parts[0], int(parts[1]), int(parts[2])
+
+class SegmentWriter:
+    """Appends fetched hadith records to compressed JSONL segments.
+
+    Every record is written as its own gzip member holding one JSON line, so
+    a segment can be read whole with zcat or any gzip reader, and a single
+    record can be decompressed on its own from its offset. After each record
+    the segment is flushed and a "hadith_id<TAB>offset<TAB>length" line is
+    appended to the segment's .idx file. Writers with different prefixes
+    (e.g. one per shard) can share a folder.
+    """
+
+    def __init__(self, directory=DEFAULT_SEGMENT_DIR, prefix="segment", max_segment_bytes=DEFAULT_SEGMENT_BYTES):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.lock = threading.Lock()
+        self.records_written = 0
+        self.bytes_written = 0
+        os.makedirs(directory, exist_ok=True)
+
+        # Keep appending to this prefix's last segment if it has room
+        pattern = re.compile(re.escape(prefix) + r"-(\d+)$")
+        numbers = [int(match.group(1)) for match in
+                   (pattern.match(os.path.basename(path)) for path in list_segments(directory)) if match]
+        self.number = max(numbers) if numbers else 0
+        self._open_segment()
+        if self.data_file.tell() >= self.max_segment_bytes:
+            self._roll_over()
+
+    def _open_segment(self):
+        base = os.path.join(self.directory, segment_name(self.prefix, self.number))
+        self.data_path = base + SEGMENT_EXTENSION
+        self.index_path = base + INDEX_EXTENSION
+        self._trim_partial_index_line()
+        self.data_file = open(self.data_path, "ab")
+        self.index_file = open(self.index_path, "a", encoding="utf-8", newline="\n")
+
+    def _trim_partial_index_line(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb+") as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+
+    def _roll_over(self):
+        self.data_file.close()
+        self.index_file.close()
+        self.number += 1
+        self._open_segment()
+
+    def write(self, hadith_id, record):
+        """Append one record; a later record for the same ID replaces the earlier one on read"""
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        member = gzip.compress(line.encode("utf-8"), mtime=0)
+        with self.lock:
+            offset = self.data_file.tell()
+            self.data_file.write(member)
+            self.data_file.flush()
+            self.index_file.write(f"{hadith_id}\t{offset}\t{len(member)}\n")
+            self.index_file.flush()
+            self.records_written += 1
+            self.bytes_written += len(member)
+            if self.data_file.tell() >= self.max_segment_bytes:
+                self._roll_over()
+
+    def close(self):
+        with self.lock:
+            self.data_file.close()
+            self.index_file.close()
+
+class SegmentReader:
+    """Random access to hadith records in a segment folder.
+
+    All .idx files are loaded into one dictionary of hadith ID to
+    (segment, offset, length), and segments are memory-mapped so a lookup
+    decompresses just the one record it needs.
+    """
+
+    def __init__(self, directory=DEFAULT_SEGMENT_DIR):
+        self.directory = directory
+        self.index = {}
+        self.maps = []
+        self.files = []
+        for base in list_segments(directory):
+            data_path = base + SEGMENT_EXTENSION
+            if not os.path.exists(data_path) or os.path.getsize(data_path) == 0:
+                continue
+            data_file = open(data_path, "rb")
+            segment = len(self.maps)
+            self.files.append(data_file)
+            self.maps.append(mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ))
+            size = len(self.maps[segment])
+            for hadith_id, offset, length in read_index(base + INDEX_EXTENSION):
+                # Skip index lines that point past data lost in a crash
+                if offset + length <= size:
+                    self.index[hadith_id] = (segment, offset, length)
+
+    def __contains__(self, hadith_id):
+        return str(hadith_id) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def ids(self):
+        return list(self.index)
+
+    def get_bytes(self, hadith_id):
+        """Return the stored record for a hadith ID as undecoded JSON, or None"""
+        location = self.index.get(str(hadith_id))
+        if location is None:
+            return None
+        segment, offset, length = location
+        return gzip.decompress(self.maps[segment][offset:offset + length])
+
+    def get(self, hadith_id):
+        """Return the stored record for a hadith ID, or None"""
+        line = self.get_bytes(hadith_id)
+        return loads(line) if line is not None else None
+
+    def close(self):
+        for segment_map in self.maps:
+            segment_map.close()
+        for data_file in self.files:
+            data_file.close()
+        self.maps = []
+        self.files = []
+
+def saved_segment_ids(directory):
+    """Return the IDs already stored in a segment folder without opening the segments"""
+    saved = set()
+    for base in list_segments(directory):
+        for hadith_id, _, _ in read_index(base + INDEX_EXTENSION):
+            saved.add(hadith_id)
+    return saved
+
+def migrate_json_folder(json_folder, segment_dir, prefix="migrated", max_segment_bytes=DEFAULT_SEGMENT_BYTES):
+    """Copy hadith_{id}.json files into a segment folder, skipping IDs it already holds"""
+    pattern = re.compile(r'hadith_(\d+)\.json$')
+    existing = saved_segment_ids(segment_dir)
+    writer = SegmentWriter(segment_dir, prefix, max_segment_bytes)
+    migrated = skipped = failed = 0
+    try:
+        with os.scandir(json_folder) as entries:
+            for entry in entries:
+                match = pattern.match(entry.name)
+                if not match:
+                    continue
+                hadith_id = match.group(1)
+                if hadith_id in existing:
+                    skipped += 1
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        record = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Could not read {entry.path}: {e}")
+                    failed += 1
+                    continue
+                writer.write(hadith_id, record)
+                existing.add(hadith_id)
+                migrated += 1
+                if migrated % 10000 == 0:
+                    print(f"Migrated {migrated} files...")
+    finally:
+        writer.close()
+    return migrated, skipped, failed, writer.bytes_written
+
+def export_json_folder(segment_dir, json_folder):
+    """Write every stored record back out as hadith_{id}.json, in the fetcher's old format"""
+    os.makedirs(json_folder, exist_ok=True)
+    reader = SegmentReader(segment_dir)
+    try:
+        for hadith_id in reader.ids():
+            with open(os.path.join(json_folder, f"hadith_{hadith_id}.json"), "w", encoding="utf-8") as f:
+                json.dump(reader.get(hadith_id), f, indent=4, ensure_ascii=False)
+        return len(reader)
+    finally:
+        reader.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between hadith JSON folders and segment stores")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Pack a folder of hadith_{id}.json files into segments")
+    migrate_parser.add_argument("json_folder")
+    migrate_parser.add_argument("segment_dir", nargs="?", default=DEFAULT_SEGMENT_DIR)
+    migrate_parser.add_argument("--prefix", default="migrated",
+                                help="Segment file prefix; use a different one per source folder")
+
+    export_parser = commands.add_parser("export", help="Unpack segments into hadith_{id}.json files")
+    export_parser.add_argument("segment_dir")
+    export_parser.add_argument("json_folder")
+
+    stats_parser = commands.add_parser("stats", help="Show how many records a segment folder holds")
+    stats_parser.add_argument("segment_dir", nargs="?", default=DEFAULT_SEGMENT_DIR)
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrated, skipped, failed, size = migrate_json_folder(args.json_folder, args.segment_dir, args.prefix)
+        print(f"Migrated {migrated} files ({size / 1024 / 1024:.1f} MB compressed), "
+              f"skipped {skipped} already stored, {failed} unreadable")
+    elif args.command == "export":
+        print(f"Exported {export_json_folder(args.segment_dir, args.json_folder)} records to {args.json_folder}")
+    elif args.command == "stats":
+        segments = list_segments(args.segment_dir)
+        size = sum(os.path.getsize(base + SEGMENT_EXTENSION) for base in segments
+                   if os.path.exists(base + SEGMENT_EXTENSION))
+        print(f"{len(saved_segment_ids(args.segment_dir))} hadith IDs in {len(segments)} segments, "
+              f"{size / 1024 / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import os
+import re
+import csv
+import sys
+import shutil
+import io
+import zlib
+import argparse
+import contextlib
+import subprocess
+
+HASH = "hash"
+RANGE = "range"
+
+# With range sharding, consecutive blocks of this many IDs go to the same shard
+DEFAULT_RANGE_BLOCK = 10000
+
+def shard_of(hadith_id, shard_count, method=HASH, block_size=DEFAULT_RANGE_BLOCK):
+    """Return the shard a hadith ID belongs to; the same on every machine and every run"""
+    if method == RANGE:
+        return (int(hadith_id) // block_size) % shard_count
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(str(hadith_id).encode("utf-8")) % shard_count
+
+def filter_shard(hadith_ids, shard_index, shard_count, method=HASH, block_size=DEFAULT_RANGE_BLOCK):
+    """Yield only the IDs assigned to one shard"""
+    if shard_count <= 1:
+        yield from hadith_ids
+        return
+    for hadith_id in hadith_ids:
+        if shard_of(hadith_id, shard_count, method, block_size) == shard_index:
+            yield hadith_id
+
+def shard_suffix(shard_index, shard_count):
+    return f"shard{shard_index}of{shard_count}"
+
+def shard_path(path, shard_index, shard_count):
+    """Add the shard suffix to a file name, e.g. hadith_data.csv -> hadith_data.shard0of4.csv"""
+    if shard_count <= 1:
+        return path
+    root, extension = os.path.splitext(str(path))
+    return f"{root}.{shard_suffix(shard_index, shard_count)}{extension}"
+
+def argv_shard_suffix(argv=None):
+    """Read --shard-index/--shard-count from the command line before argparse runs.
+
+    Used for files that are opened at import time, such as the stdout log.
+    """
+    argv = sys.argv if argv is None else argv
+    # The same options as the script's own parser, so "--shard-index 1" and "--shard-index=1" both work
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    add_shard_arguments(parser)
+    try:
+        # A bad value is reported when the script parses its arguments, not here
+        with contextlib.redirect_stderr(io.StringIO()):
+            args, _ = parser.parse_known_args(argv[1:])
+    except SystemExit:
+        return ""
+    if args.shard_count <= 1:
+        return ""
+    return "_" + shard_suffix(args.shard_index, args.shard_count)
+
+def add_shard_arguments(parser):
+    parser.add_argument("--shard-index", type=int, default=0,
+                        help="Which shard this process crawls (0-based)")
+    parser.add_argument("--shard-count", type=int, default=1,
+                        help="Total number of shards the crawl is split into")
+    parser.add_argument("--shard-method", choices=[HASH, RANGE], default=HASH,
+                        help="hash spreads IDs evenly, range keeps blocks of consecutive IDs together")
+    parser.add_argument("--spawn-shards", type=int, default=0,
+                        help="Run this many shards as local worker processes and merge their output")
+
+def strip_option(argv, name):
+    """Remove an option and its value from an argument list"""
+    stripped = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg == name:
+            skip = True
+            continue
+        if arg.startswith(name + "="):
+            continue
+        stripped.append(arg)
+    return stripped
+
+def launch_shards(script_path, shard_count, argv):
+    """Run one worker process per shard and wait for all of them; returns their exit codes"""
+    base_args = strip_option(strip_option(strip_option(argv, "--spawn-shards"), "--shard-index"), "--shard-count")
+    processes = []
+    for shard_index in range(shard_count):
+        command = [sys.executable, script_path, *base_args,
+                   "--shard-index", str(shard_index), "--shard-count", str(shard_count)]
+        print(f"Starting shard {shard_index + 1}/{shard_count}: {' '.join(command)}")
+        processes.append(subprocess.Popen(command))
+    return [process.wait() for process in processes]
+
+def read_csv_rows(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None, []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        return header, list(reader)
+
+def merge_csv_files(paths, out_path, key=None):
+    """Concatenate CSV files that share a header, dropping rows whose key was already written.
+
+    key is a function from row to dedup key; by default the whole row is the key.
+    """
+    key = key or tuple
+    seen = set()
+    header_written = False
+    written = 0
+    with open(out_path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        for path in paths:
+            header, rows = read_csv_rows(path)
+            if header is None:
+                continue
+            if not header_written:
+                writer.writerow(header)
+                header_written = True
+            for row in rows:
+                row_key = key(row)
+                if row_key in seen:
+                    continue
+                seen.add(row_key)
+                writer.writerow(row)
+                written += 1
+    return written
+
+def merge_id_logs(success_paths, error_paths, out_success, out_error):
+    """Merge success/error logs; an ID that succeeded in any shard is dropped from the error log"""
+    succeeded = []
+    seen = set()
+    for path in success_paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                hadith_id = line.strip()
+                if hadith_id and hadith_id not in seen:
+                    seen.add(hadith_id)
+                    succeeded.append(hadith_id)
+    with open(out_success, "w", encoding="utf-8") as f:
+        f.writelines(f"{hadith_id}\n" for hadith_id in succeeded)
+
+    failed = {}
+    for path in error_paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                hadith_id, _, error = line.rstrip("\n").partition(": ")
+                if hadith_id and hadith_id not in seen:
+                    failed[hadith_id] = error
+    with open(out_error, "w", encoding="utf-8") as f:
+        f.writelines(f"{hadith_id}: {error}\n" for hadith_id, error in failed.items())
+    return len(succeeded), len(failed)
+
+def merge_json_dirs(source_dirs, out_dir):
+    """Copy hadith_*.json files from several machines' output folders into one, skipping duplicates"""
+    os.makedirs(out_dir, exist_ok=True)
+    pattern = re.compile(r'hadith_\d+\.json$')
+    existing = {name for name in os.listdir(out_dir) if pattern.match(name)}
+    copied = 0
+    for source_dir in source_dirs:
+        if os.path.abspath(source_dir) == os.path.abspath(out_dir):
+            continue
+        with os.scandir(source_dir) as entries:
+            for entry in entries:
+                if pattern.match(entry.name) and entry.name not in existing:
+                    shutil.copy2(entry.path, os.path.join(out_dir, entry.name))
+                    existing.add(entry.name)
+                    copied += 1
+    return copied
+
+def merge_narrator_tables(shard_folders, out_folder):
+    """Merge the nine CSV tables written by CurrentWorkingScript2 shards.
+
+    Each shard gives narrators its own random IDs, so narrators are matched
+    by name, every foreign key is rewritten to the first ID seen for that
+    name, and rows that become identical after the rewrite are dropped.
+    """
+    os.makedirs(out_folder, exist_ok=True)
+    remaps = []
+    canonical_ids = {}
+    for folder in shard_folders:
+        _, rows = read_csv_rows(os.path.join(folder, "narrators.csv"))
+        remap = {}
+        for row in rows:
+            narrator_id, narrator_name = row[0], row[1]
+            remap[narrator_id] = canonical_ids.setdefault(narrator_name, narrator_id)
+        remaps.append(remap)
+
+    def remapped(name, column):
+        for folder, remap in zip(shard_folders, remaps):
+            header, rows = read_csv_rows(os.path.join(folder, name))
+            for row in rows:
+                if len(row) > column:
+                    row[column] = remap.get(row[column], row[column])
+            yield header, rows
+
+    def write_table(name, key, column=None):
+        paths = [os.path.join(folder, name) for folder in shard_folders]
+        if column is None:
+            return merge_csv_files(paths, os.path.join(out_folder, name), key)
+        # Write remapped copies first so merge_csv_files can do the dedup
+        temp_paths = []
+        for index, (header, rows) in enumerate(remapped(name, column)):
+            temp_path = os.path.join(out_folder, f".{name}.{index}.tmp")
+            with open(temp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if header:
+                    writer.writerow(header)
+                writer.writerows(rows)
+            temp_paths.append(temp_path)
+        written = merge_csv_files(temp_paths, os.path.join(out_folder, name), key)
+        for temp_path in temp_paths:
+            os.remove(temp_path)
+        return written
+
+    counts = {
+        "hadith.csv": write_table("hadith.csv", key=lambda row: row[1]),
+        "book.csv": write_table("book.csv", key=lambda row: row[0]),
+        "reference.csv": write_table("reference.csv", key=lambda row: row[0]),
+        "hadith_sanad.csv": write_table("hadith_sanad.csv", key=lambda row: row[0]),
+        "narrators.csv": write_table("narrators.csv", key=lambda row: row[1]),
+        "hadith_narrator_chain.csv": write_table("hadith_narrator_chain.csv", key=lambda row: row[0], column=2),
+        "narrator_details.csv": write_table("narrator_details.csv", key=lambda row: tuple(row[1:]), column=1),
+        "narrator_death_records.csv": write_table("narrator_death_records.csv", key=lambda row: tuple(row[1:]), column=1),
+        "narrator_evaluation.csv": write_table("narrator_evaluation.csv", key=lambda row: tuple(row[1:]), column=1),
+    }
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the outputs of sharded crawls")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    json_parser = commands.add_parser("merge-json", help="Merge scraped_hadith_json folders from several machines")
+    json_parser.add_argument("out_dir")
+    json_parser.add_argument("source_dirs", nargs="+")
+
+    csv_parser = commands.add_parser("merge-csv", help="Merge ResponseFetchingScript CSV files, one row per hadith")
+    csv_parser.add_argument("out_file")
+    csv_parser.add_argument("csv_files", nargs="+")
+
+    logs_parser = commands.add_parser("merge-logs", help="Merge success and error logs")
+    logs_parser.add_argument("--success", nargs="+", required=True)
+    logs_parser.add_argument("--error", nargs="+", default=[])
+    logs_parser.add_argument("--out-success", required=True)
+    logs_parser.add_argument("--out-error", required=True)
+
+    tables_parser = commands.add_parser("merge-tables", help="Merge CurrentWorkingScript2 CSV folders")
+    tables_parser.add_argument("out_folder")
+    tables_parser.add_argument("shard_folders", nargs="+")
+
+    args = parser.parse_args()
+    if args.command == "merge-json":
+        print(f"Copied {merge_json_dirs(args.source_dirs, args.out_dir)} JSON files into {args.out_dir}")
+    elif args.command == "merge-csv":
+        written = merge_csv_files(args.csv_files, args.out_file, key=lambda row: row[0])
+        print(f"Wrote {written} rows to {args.out_file}")
+    elif args.command == "merge-logs":
+        succeeded, failed = merge_id_logs(args.success, args.error, args.out_success, args.out_error)
+        print(f"{succeeded} successful and {failed} failed hadith IDs after merging")
+    elif args.command == "merge-tables":
+        for name, written in merge_narrator_tables(args.shard_folders, args.out_folder).items():
+            print(f"{name}: {written} rows")
+
+if __name__ == "__main__":
+    main()
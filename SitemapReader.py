@@ -0,0 +1,115 @@
+import os
+import re
+import gzip
+import logging
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+# Hadith URL patterns used by the different sitemap dumps
+SITEMAP_HADITH_PATTERN = r'hadith\.inoor\.ir.*/h/(\d+)'
+URL_LIST_HADITH_PATTERN = r'/hadith/(\d+)/'
+
+def local_name(tag):
+    """Strip the XML namespace from a tag name"""
+    return tag.rsplit('}', 1)[-1]
+
+def open_source(source):
+    """Open a local file or URL for binary reading, decompressing gzip transparently"""
+    if urlparse(source).scheme in ("http", "https"):
+        # Imported here so reading local sitemaps doesn't need the HTTP client
+        from HadithApiClient import get_session
+        response = get_session().get(source, stream=True, timeout=60)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        stream = response.raw
+        # A .gz file served without Content-Encoding still has to be decompressed here
+        if source.endswith(".gz") and response.headers.get("content-encoding") != "gzip":
+            return gzip.GzipFile(fileobj=stream)
+        return stream
+
+    handle = open(source, 'rb')
+    if handle.read(2) == b'\x1f\x8b':
+        handle.seek(0)
+        return gzip.GzipFile(fileobj=handle)
+    handle.seek(0)
+    return handle
+
+def resolve_child_sitemap(loc, parent):
+    """Find a sitemap listed in a sitemap index, preferring a local copy next to the index"""
+    if urlparse(parent).scheme in ("http", "https"):
+        return loc
+    base_dir = os.path.dirname(os.path.abspath(parent))
+    name = os.path.basename(urlparse(loc).path) if urlparse(loc).scheme else loc
+    candidate = os.path.join(base_dir, name)
+    if os.path.exists(candidate):
+        return candidate
+    return loc
+
+def iter_sitemap_urls(source, visited=None):
+    """Yield every page URL in a sitemap, following sitemap-index files recursively.
+
+    The XML is parsed incrementally and each element is discarded once it
+    has been read, so memory stays flat however many URLs the sitemap holds.
+    """
+    visited = set() if visited is None else visited
+    if source in visited:
+        return
+    visited.add(source)
+
+    stream = open_source(source)
+    try:
+        path = []
+        root = None
+        for event, element in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                path.append(local_name(element.tag))
+                if root is None:
+                    root = element
+                continue
+
+            name = path.pop()
+            if name == "loc" and element.text:
+                loc = element.text.strip()
+                parent = path[-1] if path else ""
+                if parent == "sitemap":
+                    yield from iter_sitemap_urls(resolve_child_sitemap(loc, source), visited)
+                elif parent == "url":
+                    yield loc
+            elif name in ("url", "sitemap"):
+                # Drop finished entries so the tree never grows
+                root.clear()
+    finally:
+        stream.close()
+
+def iter_url_list(source):
+    """Yield lines of a plain-text URL list one at a time"""
+    stream = open_source(source)
+    try:
+        for line in stream:
+            yield line.decode('utf-8', errors='replace')
+    finally:
+        stream.close()
+
+def is_xml_source(source):
+    name = urlparse(source).path if urlparse(source).scheme else source
+    return name.endswith(".xml") or name.endswith(".xml.gz")
+
+def iter_hadith_ids(source, pattern=SITEMAP_HADITH_PATTERN, seen=None):
+    """Yield unique hadith IDs from a sitemap, sitemap index or plain URL list as they are read"""
+    regex = re.compile(pattern)
+    seen = set() if seen is None else seen
+    lines = iter_sitemap_urls(source) if is_xml_source(source) else iter_url_list(source)
+
+    for line in lines:
+        match = regex.search(line)
+        if not match:
+            continue
+        hadith_id = match.group(1)
+        # Keep ints in the seen set; they take far less memory than strings
+        key = int(hadith_id)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield hadith_id
+
+    logging.info(f"Finished reading {len(seen)} unique hadith IDs from {source}")